@@ -49,19 +49,19 @@ class Ion:
         if type(self.color) == int:
             print(f'Ion {self.n} does not exist.')
             return
+        from choose_file import draw_pixels
         fig, (ax0, ax1) = plt.subplots(ncols=2, figsize=(6, 2.5))
 
         xbounds = (self.data['x'].min(), self.data['x'].max())
         ybounds = (self.data['y'].min(), self.data['y'].max())
-        xbins = int(self.data['x'].max()-self.data['x'].min()+1)
-        ybins = int(self.data['y'].max()-self.data['y'].min()+1)
-        # create 2D histogram of ROI with proper binning and range
-        h = ax0.hist2d(self.data['x'], self.data['y'], bins=(xbins, ybins), range=[xbounds, ybounds])
-        fig.colorbar(h[3], ax = ax0)
+        # per-pixel counts of the ROI, computed once and drawn in both panels
+        image = self.pixel_counts()
+        h = draw_pixels(ax0, image, xbounds, ybounds)
+        fig.colorbar(h, ax = ax0)
 
-        # create the same plot on a log-scale
-        h = ax1.hist2d(self.data['x'], self.data['y'], bins=(xbins, ybins), range=[xbounds, ybounds], norm=mpl.colors.LogNorm())
-        fig.colorbar(h[3], ax = ax1)
+        # the same image on a log-scale
+        h = draw_pixels(ax1, image, xbounds, ybounds, log=True)
+        fig.colorbar(h, ax = ax1)
         fig.suptitle(f'Ion {self.n}')
         fig.tight_layout()
         plt.show()
@@ -73,15 +73,26 @@ class Ion:
             return
         fig, (ax0, ax1) = plt.subplots(ncols=2, figsize=(6, 2.5))
 
-        h = ax0.hist2d(self.data['xc'], self.data['yc'], bins=int(2*self.r0), range=[(self.x-self.r0, self.x+self.r0), (self.y-self.r0, self.y+self.r0)])
-        fig.colorbar(h[3], ax = ax0)
+        extent = (self.x-self.r0, self.x+self.r0, self.y-self.r0, self.y+self.r0)
+        image, _, _ = np.histogram2d(self.data['xc'], self.data['yc'], bins=int(2*self.r0), range=[extent[:2], extent[2:]])
+        h = ax0.imshow(image.T, origin='lower', extent=extent, aspect='auto', interpolation='nearest')
+        fig.colorbar(h, ax = ax0)
 
-        h = ax1.hist2d(self.data['xc'], self.data['yc'], bins=(2*self.r0), range=[(self.x-self.r0, self.x+self.r0), (self.y-self.r0, self.y+self.r0)], norm=mpl.colors.LogNorm())
-        fig.colorbar(h[3], ax = ax1)
+        h = ax1.imshow(image.T, origin='lower', extent=extent, aspect='auto', interpolation='nearest', norm=mpl.colors.LogNorm())
+        fig.colorbar(h, ax = ax1)
         fig.tight_layout()
         plt.show()
         
 
+        ### events per pixel of the ion, image[x, y] (kept until the data changes) ###
+    def pixel_counts(self):
+        from choose_file import pixel_image
+        cached = getattr(self, '_pixel_counts', None)
+        if cached is None or cached[0] != len(self.data):
+            self._pixel_counts = (len(self.data), pixel_image(self.data))
+        return self._pixel_counts[1]
+        
+
         ### plot histogram of x values in ROI ### (should be ~gaussian)
     def xhistogram(self, bins):
         if type(self.color) == int:
@@ -104,7 +115,7 @@ class Ion:
         xguess_amp = hist_x.max()
         xguess_c = hist_x.max()/10
         xguess  = np.array([xguess_mean,xguess_sigma,xguess_amp,xguess_c])
-        popt_x, pcov_x = scipy.optimize.curve_fit(Gaussian, bin_centres_x, hist_x, p0=xguess, maxfev = 50000)
+        popt_x, pcov_x = scipy.optimize.curve_fit(Gaussian, bin_centres_x, hist_x, p0=xguess, jac=Gaussian_jacobian, maxfev = 50000)
         print(popt_x[0], popt_x[1])
         
         
@@ -130,7 +141,7 @@ class Ion:
         xguess_amp = hist_x.max()
         xguess_c = hist_x.max()/10
         xguess  = np.array([xguess_mean,xguess_sigma,xguess_amp,xguess_c])
-        popt_x, pcov_x = scipy.optimize.curve_fit(Gaussian, bin_centres_x, hist_x, p0=xguess, maxfev = 50000)
+        popt_x, pcov_x = scipy.optimize.curve_fit(Gaussian, bin_centres_x, hist_x, p0=xguess, jac=Gaussian_jacobian, maxfev = 50000)
         print(popt_x[0], popt_x[1])
         
         
@@ -185,7 +196,7 @@ class Ion:
         
     
         ### Determines the Bright/Dark state threshold for time between photon hits in the ROI by statistical value sigma ###
-    def auto_threshold(self, sigma=2, uncertainty_control = True): 
+    def auto_threshold(self, sigma=2, uncertainty_control = True, n_boot = None): 
         
         # if the specified ion does not exist in the data set being analyzed, return a statement saying so. 
         if type(self.color) == int:
@@ -197,7 +208,7 @@ class Ion:
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize = (11, 3))
         bin_heights, bin_borders, _ = ax1.hist(self.data['dt'], bins = 'auto', range = (0, .05), alpha = .5, label='\'dt\' pdf', density = True)
         bin_centers = bin_borders[:-1] + np.diff(bin_borders) / 2
-        popt, pcov = curve_fit(expon, bin_centers, bin_heights, p0=[1/5e-4, bin_heights.max()])  # fits the histogram to exponential. Input parameters 
+        popt, pcov = curve_fit(expon, bin_centers, bin_heights, p0=[1/5e-4, bin_heights.max()], jac=expon_jacobian)  # fits the histogram to exponential. Input parameters 
                                                                                  # for a specific data set but they seem to be pretty
                                                                                  # applicable to all datasets. 
 
@@ -214,6 +225,12 @@ class Ion:
         loc = 0; rate = popt[0] ; int_to = stats.expon.ppf((sigma_percent), loc=loc, scale= 1 / rate)        # turns percent into a number (threshold value)
         self.upper_limit = stats.expon.ppf((sigma_percent), loc=loc, scale= 1 / (rate-(pcov[0][0]**2)))
         self.lower_limit = stats.expon.ppf((sigma_percent), loc=loc, scale= 1 / (rate+(pcov[0][0]**2)))
+        if n_boot:
+            # limits from the 95% interval of the threshold over n_boot bootstrap replicates (bootstrap_functions.py)
+            # instead of the fit covariance. Fixed seed so the same data always gives the same limits.
+            from bootstrap_functions import threshold_replicates
+            _, replicates = threshold_replicates(self.data['dt'].to_numpy(), sigma, n_boot, rng=0)
+            self.lower_limit, self.upper_limit = np.nanquantile(replicates, [.025, .975])
         d = stats.expon.rvs(loc = loc, scale = rate, size = 10000)                                          # create random variables that follow the fit (for plotting)
         base = np.linspace(0,int_to,100000)
         ax1.plot(base,stats.expon.pdf(base,loc = loc, scale = 1 / rate), 'r', linewidth = 2,alpha = 0.4)     
@@ -388,14 +405,38 @@ class Ion:
         #  averages each 'point' and plots what can be referred to as an 'average transition' ###
         
         
-    def setup(self, sigma=2, uncertainty_control = True, single_photon_control = False):
+    def setup(self, sigma=2, uncertainty_control = True, single_photon_control = False, cache = None, n_boot = None):
         if type(self.color) == int:
             print(f'Ion {self.n} does not exist.')
             return
-        
-        self.auto_threshold(sigma, uncertainty_control)
+        # cache: ResultCache or cache directory (result_cache.py). The threshold, state sorting and transitions
+        # are stored under a hash of the ion's events, ROI and parameters and restored without refitting.
+        from result_cache import as_cache
+        cache = as_cache(cache)   # None or False: no caching
+        if cache is not None:
+            from result_cache import digest, source_digest, table_digest
+            key = digest(table_digest(self.data), self.x, self.y, self.r0, sigma, uncertainty_control,
+                         single_photon_control, n_boot, source_digest(Ion))
+            state = cache.get(key)
+            if state is not None:
+                self.threshold, self.lower_limit, self.upper_limit = state['threshold'], state['lower_limit'], state['upper_limit']
+                self.bright = self.data.loc[state['bright']]
+                self.dark = self.data.loc[state['dark']]
+                if state['uncertain'] is not None:
+                    self.uncertain_state = self.data.loc[state['uncertain']]
+                self.data['B/D'] = np.where(self.data['dt'] <= self.threshold, 1, -1)
+                self.transpts[:] = state['transpts']; self.BtD[:] = state['BtD']; self.DtB[:] = state['DtB']
+                return
+
+        self.auto_threshold(sigma, uncertainty_control, n_boot)
         self.sortbythreshold(uncertainty_control)
         self.transitions(single_photon_control)
+
+        if cache is not None:
+            cache.put(key, {'threshold': self.threshold, 'lower_limit': self.lower_limit, 'upper_limit': self.upper_limit,
+                            'bright': self.bright.index.to_numpy(), 'dark': self.dark.index.to_numpy(),
+                            'uncertain': self.uncertain_state.index.to_numpy() if uncertainty_control else None,
+                            'transpts': list(self.transpts), 'BtD': list(self.BtD), 'DtB': list(self.DtB)})
         
         
         
@@ -503,17 +544,90 @@ class Ion:
         ax.set_xlabel("Event #")
         ax.set_ylabel("Time since last event (s)")
         plt.show()
-        
-        
-    def visRange(self, start, duration):
+
+
+        ### Photon arrival rate in real time around every BtD/DtB transition (peri-jump time histogram) ###
+    def peri_jump_histogram(self, bin_width=1e-3, span=0.05, kind='BtD', include_trigger=False):
+        if type(self.color) == int:
+            print(f'Ion {self.n} does not exist.')
+            return
+        # Unlike leadup(), which averages by event number, this bins the photon arrival times
+        # relative to each transition. Returns the bin edges (s, relative to the jump), the summed
+        # photon counts and the number of jumps that covered each bin (exposure).
+        time = self.data['time'].to_numpy()
+        jumps = time[np.asarray(self.BtD if kind == 'BtD' else self.DtB, dtype=int)]
+
+        nbins = int(round(span / bin_width))
+        edges = bin_width * np.arange(-nbins, nbins + 1)
+
+        # every window edge of every jump at once: (jumps x edges) searched against the sorted times
+        windows = jumps[:, None] + edges[None, :]
+        counts = np.diff(np.searchsorted(time, windows, side='left'), axis=1)
+        if not include_trigger and len(jumps):
+            counts[:, nbins] -= 1  # the transition event itself always lands in the first bin after 0
+
+        # only bins that lie fully inside the recorded data count towards the average
+        covered = (windows[:, :-1] >= time[0]) & (windows[:, 1:] <= time[-1])
+        counts = np.where(covered, counts, 0).sum(axis=0)
+        exposure = covered.sum(axis=0)
+        return edges, counts, exposure
+
+
+        ### Bright/dark segments between the transitions as a table of start, end, duration and state ###
+    def segment_table(self):
+        if type(self.color) == int:
+            print(f'Ion {self.n} does not exist.')
+            return
+        # state follows the 'B/D' convention: 1 = bright, -1 = dark. A segment starts at the event of a
+        # transition (DtB starts a bright segment, BtD a dark one), the first and last segments are cut
+        # at the first and last events of the ion.
+        time = self.data['time'].to_numpy()
+        points = np.asarray(self.transpts, dtype=int)
+        starts_bright = np.isin(points, np.asarray(self.DtB, dtype=int))
+        first = -1 if len(points) and starts_bright[0] else 1
+        if not len(points):
+            first = 1 if 0 in self.bright['index'] else -1
+        start = np.concatenate(([time[0]], time[points]))
+        end = np.concatenate((time[points], [time[-1]]))
+        state = np.concatenate(([first], np.where(starts_bright, 1, -1)))
+        table = pd.DataFrame({'start': start, 'end': end, 'duration': end - start, 'state': state})
+        return table[table['duration'] > 0].reset_index(drop=True)
+
+
+        ### Photon arrival times folded onto the trap RF phase (micromotion) ###
+    def rf_phase_histogram(self, bins=100, state='bright', period=None, plot=False):
+        if type(self.color) == int:
+            print(f'Ion {self.n} does not exist.')
+            return
+        # state: 'bright' uses only the bright events (needs setup()), 'all' every event of the ion
+        # period: RF period in ns, RF_PERIOD by default
+        # Returns the bin edges (ns, 0 to period) and the photon counts of every bin.
+        period = RF_PERIOD if period is None else period
+        events = self.bright if state == 'bright' and len(self.bright) else self.data
+        phase = rf_phase(events['time'].to_numpy(), period)
+        counts = np.bincount(np.minimum((phase / period * bins).astype(np.int64), bins - 1), minlength=bins)
+        edges = np.linspace(0, period, bins + 1)
+        if plot:
+            fig, ax = plt.subplots(1, figsize = (5, 3))
+            ax.stairs(counts, edges, color=self.color)
+            ax.set_xlabel('RF phase (ns)')
+            ax.set_ylabel('Counts')
+            ax.set_title(f'Ion #{self.n}')
+        return edges, counts
+
+
+    def visRange(self, start, duration, max_points=5000):
         if type(self.color) == int:
             print(f'Ion {self.n} does not exist.')
             return
         # plots a small slice of data 
         # and uses red/blue color coding to distinguish between the bright and dark state
         # useful for visualizing the effects of different sorting methods
+        # windows with more than max_points events are drawn by trace() instead
         end = start+duration
         use = self.data.query(f'{start} <= time < {end}')
+        if len(use) > max_points:
+            return self.trace(start, duration)
         index = np.arange(int(min(use['index'])), int(max(use['index'])))
         change = use['dt']
         linehere = []
@@ -576,6 +690,26 @@ class Ion:
         plt.show()
         
         
+        ### dt against time for any window length, drawn from a min/max/count pyramid (trace_view.py) ###
+    def trace(self, start=None, duration=None, ax=None, columns=2000):
+        if type(self.color) == int:
+            print(f'Ion {self.n} does not exist.')
+            return
+        from trace_view import TracePyramid
+        cached = getattr(self, '_pyramid', None)
+        if cached is None or cached[0] != (len(self.data), len(self.transpts)):
+            segments = self.segment_table() if len(self.transpts) or len(self.bright) else None
+            self._pyramid = ((len(self.data), len(self.transpts)), TracePyramid(self.data['time'], self.data['dt'], segments))
+        end = None if start is None or duration is None else start + duration
+        set_up = not isinstance(self.threshold, list)
+        ax = self._pyramid[1].draw(start, end, ax, columns, ylim=(-self.threshold, 10*self.threshold) if set_up else None)
+        if set_up:
+            ax.axhline(self.threshold)
+        ax.set_title(f'Ion {self.n}')
+        plt.show()
+        return ax
+        
+        
         ###  Plots and fits bright state duration statistics as an exponential ###
     def duration_statistics(self, log=False):  # a log base can be used if log=True is plugged in when calling the function
         if type(self.color) == int:
@@ -652,42 +786,235 @@ class Ion:
         #ax2.plot(x_interval_for_fit, expon(x_interval_for_fit, *popt), label='fit')
         #ax2.set_yscale('log')
         #print(1/popt[0])
-        
+
+
+#____________________________________________________________________________________________________________________________________________________
+##### ACCUMULATORS #####
+
+
+### Sums Ion.peri_jump_histogram over ions and runs. Two accumulators with the same binning can be merged ###
+class PeriJumpHistogram:
+    def __init__(self, bin_width=1e-3, span=0.05, include_trigger=False):
+        self.bin_width = bin_width
+        self.span = span
+        self.include_trigger = include_trigger
+
+        nbins = int(round(span / bin_width))
+        self.edges = bin_width * np.arange(-nbins, nbins + 1)
+        self.counts = {'BtD': np.zeros(2*nbins, dtype=np.int64), 'DtB': np.zeros(2*nbins, dtype=np.int64)}
+        self.exposure = {'BtD': np.zeros(2*nbins, dtype=np.int64), 'DtB': np.zeros(2*nbins, dtype=np.int64)}
+        self.njumps = {'BtD': 0, 'DtB': 0}
+
+    def add(self, ion):
+        if type(ion.color) == int:
+            return
+        for kind in ('BtD', 'DtB'):
+            _, counts, exposure = ion.peri_jump_histogram(self.bin_width, self.span, kind, self.include_trigger)
+            self.counts[kind] += counts
+            self.exposure[kind] += exposure
+            self.njumps[kind] += len(ion.BtD if kind == 'BtD' else ion.DtB)
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges) or self.include_trigger != other.include_trigger:
+            raise ValueError('Peri-jump histograms must share the same binning to be merged')
+        for kind in ('BtD', 'DtB'):
+            self.counts[kind] += other.counts[kind]
+            self.exposure[kind] += other.exposure[kind]
+            self.njumps[kind] += other.njumps[kind]
+        return self
+
+    def rate(self, kind='BtD'):
+        # photons per second in each bin, averaged over every jump that covered the bin
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.counts[kind] / (self.exposure[kind] * self.bin_width)
+
+    def plot(self):
+        centers = (self.edges[:-1] + self.edges[1:]) / 2
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize = (11, 3))
+        for ax, kind, title in ((ax1, 'BtD', 'Bright->Dark transition'), (ax2, 'DtB', 'Dark->Bright transition')):
+            ax.step(centers, self.rate(kind), where='mid')
+            ax.axvline(0, color='k', alpha=0.3)
+            ax.set_title(f'{title} ({self.njumps[kind]} jumps)')
+            ax.set_xlabel('Time from transition (s)')
+            ax.set_ylabel('Photon rate (1/s)')
+        fig.tight_layout()
+        plt.show()
+
+
+### Fixed-bin (linear or log-spaced) histogram filled chunk by chunk. Same binning merges, state is plain JSON ###
+class StreamHistogram:
+    def __init__(self, low, high, bins=100, log=False, name=''):
+        #     log: bins equally spaced in log10 between low and high (low > 0)
+        # counts[0] and counts[-1] hold the values below low and above high (NaN is dropped). As in
+        # np.histogram the last bin is closed on the right, a value equal to high is counted in it.
+        self.low, self.high, self.nbins, self.log, self.name = float(low), float(high), int(bins), bool(log), name
+        if self.log:
+            self.edges = np.logspace(np.log10(self.low), np.log10(self.high), self.nbins + 1)
+        else:
+            self.edges = np.linspace(self.low, self.high, self.nbins + 1)
+        self.counts = np.zeros(self.nbins + 2, dtype=np.int64)
+        self.sum = 0.0   # sum of the values in range, for the mean
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        # bin k + 1 of edges[k] <= value < edges[k+1], the same comparisons as np.histogram(values, self.edges)
+        index = np.searchsorted(self.edges, values, side='right')
+        index[values == self.edges[-1]] = self.nbins
+        self.counts += np.bincount(index, minlength=self.nbins + 2)
+        self.sum += values[(index > 0) & (index <= self.nbins)].sum()
+        return self
+
+    def add_ion(self, ion, quantity='dt'):
+        # quantity: 'dt', 'center flux' (ToT), 'cluster size' or 'radius' (distance from the ROI centre)
+        if type(ion.color) == int:
+            return self
+        if quantity == 'radius':
+            return self.add((((ion.data['x']-(ion.x))**2 + (ion.data['y']-(ion.y))**2)**(1/2)).to_numpy())
+        return self.add(ion.data[quantity].to_numpy())
+
+    def same_binning(self, other):
+        return (self.low, self.high, self.nbins, self.log) == (other.low, other.high, other.nbins, other.log)
+
+    def merge(self, other):
+        if not self.same_binning(other):
+            raise ValueError('Histograms must share the same binning to be merged')
+        self.counts += other.counts
+        self.sum += other.sum
+        return self
+
+    @property
+    def centers(self):
+        return np.sqrt(self.edges[:-1] * self.edges[1:]) if self.log else (self.edges[:-1] + self.edges[1:]) / 2
+
+    @property
+    def total(self):
+        return int(self.counts[1:-1].sum())
+
+    def mean(self):
+        return self.sum / self.total if self.total else np.nan
+
+    def density(self):
+        # same normalisation as np.histogram(density=True): in-range counts integrate to 1
+        return self.counts[1:-1] / (max(self.total, 1) * np.diff(self.edges))
+
+    def to_dict(self):
+        return {'low': self.low, 'high': self.high, 'bins': self.nbins, 'log': self.log, 'name': self.name,
+                'counts': self.counts.tolist(), 'sum': self.sum}
+
+    @classmethod
+    def from_dict(cls, state):
+        histogram = cls(state['low'], state['high'], state['bins'], state['log'], state.get('name', ''))
+        histogram.counts[:] = state['counts']
+        histogram.sum = state['sum']
+        return histogram
+
+    def plot(self, ax=None, density=False, **kwargs):
+        if ax is None:
+            fig, ax = plt.subplots(1, figsize = (5, 3))
+        ax.stairs(self.density() if density else self.counts[1:-1], self.edges, **kwargs)
+        if self.log:
+            ax.set_xscale('log')
+        ax.set_xlabel(self.name)
+        ax.set_ylabel('Probability density' if density else 'counts')
+        return ax
+
+
 #____________________________________________________________________________________________________________________________________________________        
 ##### EQUATIONS #####
 
 
+# The models below write every intermediate step into one output array (see _buffer) instead of
+# creating a new temporary per operation. Values are identical to the plain expressions in the comments.
+# Each model also has an analytic jacobian (registered in JACOBIANS at the end of this section), used by
+# curve_fit(jac=...) in the Ion methods and automatically by fit_functions.batch_fit.
+
+RF_PERIOD = 54.789717 # ns, period of the trap RF used by Oscillation, Rscatt_ and Rscatt_high
+
+def rf_phase(time, period=RF_PERIOD, unit=1e-11):
+    # time (s) modulo the RF period, in ns. The ToA is turned back into integer counts of unit (10 ps)
+    # and the period into femtoseconds, so the remainder is exact for any run length.
+    ticks = np.rint(np.asarray(time, dtype=float) / unit).astype(np.int64)
+    tick_fs = int(round(unit * 1e15))
+    period_fs = int(round(period * 1e6))
+    return ((ticks % period_fs) * tick_fs % period_fs) * 1e-6
+
+def _shape(x, params):
+    # broadcast shape of all inputs (scalar parameters, the usual case, skip the broadcasting)
+    shape = np.shape(x)
+    for p in params:
+        if np.ndim(p):
+            shape = np.broadcast_shapes(shape, np.shape(p))
+    return shape
+
+def _buffer(x, *params):
+    # one float array with the broadcast shape of all inputs
+    return np.empty(_shape(x, params))
+
+def _like(x, out):
+    # values in the type of x as the plain expressions give them: a Series keeps its index and name,
+    # scalar input gives a scalar
+    if isinstance(x, pd.Series) and out.shape == x.shape:
+        return pd.Series(out, index=x.index, name=x.name)
+    return out[()] if out.ndim == 0 else out
+
 def expon(x, rate, multiplier):   # in scipy.stats.expon() the paramater 'scale = 1 / rate' when inputing the function
+    # plain expression: fitted on a few hundred histogram bins, where a shared buffer costs more than it saves
     return multiplier * np.exp(-rate * x)
 
+def _lorentz_into(out, x, x0, a, gam):
+    # a * gam**2 / ( gam**2 + ( x - x0 )**2) written into out
+    np.subtract(x, x0, out=out)
+    np.square(out, out=out)
+    out += np.square(gam)
+    np.divide(np.square(gam), out, out=out)
+    out *= a
+    return out
+
 def Lorentzian(x, x0, a, gam, b):
-    return b + a * gam**2 / ( gam**2 + ( x - x0 )**2)
+    # b + a * gam**2 / ( gam**2 + ( x - x0 )**2)
+    out = _lorentz_into(_buffer(x, x0, a, gam, b), x, x0, a, gam)
+    out += b
+    return _like(x, out)
 
 def Double_Lorentzian(x, x1, a1, gam1, b1, x2, a2, gam2):
-    return b1 + a1 * gam1**2 / ( gam1**2 + ( x - x1 )**2) + a2 * gam2**2 / ( gam2**2 + ( x - x2 )**2)
+    # b1 + a1 * gam1**2 / ( gam1**2 + ( x - x1 )**2) + a2 * gam2**2 / ( gam2**2 + ( x - x2 )**2)
+    out = _lorentz_into(_buffer(x, x1, a1, gam1, b1, x2, a2, gam2), x, x1, a1, gam1)
+    out += _lorentz_into(np.empty_like(out), x, x2, a2, gam2)
+    out += b1
+    return _like(x, out)
 
 def Linear(x, m, b):
     return m*x + b
 
 def Oscillation(x, A, B, phase):
-    return A + np.abs(B) *np.sin(2*np.pi*(x)/54.789717 + phase)
+    return A + np.abs(B) *np.sin(2*np.pi*(x)/RF_PERIOD + phase)
 
 def Gaussian(x, xm, sigma, A, c):
-    return np.absolute(A)*np.exp(-np.power((x-xm)/sigma,2)/2) + c
+    # np.absolute(A)*np.exp(-np.power((x-xm)/sigma,2)/2) + c
+    out = _buffer(x, xm, sigma, A, c)
+    np.subtract(x, xm, out=out)
+    out /= sigma
+    np.square(out, out=out)
+    out *= -0.5
+    np.exp(out, out=out)
+    out *= np.absolute(A)
+    out += c
+    return _like(x, out)
 
 
 
 def Rscatt_(t, d, b, p, m):
     S = 2
     G = 20.4e6
-    O = 1 / 54.789717e-9  * np.pi*2
+    O = 1 / (RF_PERIOD*1e-9)  * np.pi*2
     D = d - np.abs(b)*O*np.cos(O*10**-9*t +p)
     R = m*((G/2)**2/ (np.sqrt(1+S)*(G/2)**2 + (D)**2))
     return R
 
 def Rscatt_high(t, m, S, d, v, p):
     G = 20.4e6 * (1+S)**.5 #Natural Linewidth
-    O = np.pi * 2 / 54.789717e-9 #Driving Frequency
+    O = np.pi * 2 / (RF_PERIOD*1e-9) #Driving Frequency
     k = np.pi * 2 / (3e8/(3e8/493e-9 + d)) #Wave number 
     D = d + k*v*np.sin(O*10**-9*t +p)*np.cos(np.pi/4) #Detuning
     R = m*(G/2) * (S) / ((S + 1) + (4 * (D / G)**2)) #Scattering rate
@@ -696,6 +1023,127 @@ def Rscatt_high(t, m, S, d, v, p):
 def Superradiance(t, G, A):
     prob = A * (1+4*G*t)*2*G*np.e**(-2*G*t)
     return prob
+
+
+##### JACOBIANS #####
+# d(model)/d(parameter) with shape (..., npoints, nparams), parameters in the order of the model arguments
+
+
+def _jacobian_buffer(x, *params):
+    return np.empty(_shape(x, params) + (len(params),))
+
+def expon_jacobian(x, rate, multiplier):
+    J = _jacobian_buffer(x, rate, multiplier)
+    np.multiply(-rate, x, out=J[..., 1])
+    np.exp(J[..., 1], out=J[..., 1])
+    np.multiply(J[..., 1], x, out=J[..., 0])
+    J[..., 0] *= -multiplier
+    return J
+
+def _lorentz_jacobian_into(J, x, x0, a, gam):
+    # columns x0, a, gam of a * gam**2 / ( gam**2 + ( x - x0 )**2)
+    d = np.subtract(x, x0)
+    q = 1 / (np.square(gam) + np.square(d))
+    J[..., 1] = np.square(gam) * q
+    J[..., 0] = 2 * a * np.square(gam) * d * np.square(q)
+    J[..., 2] = 2 * a * gam * np.square(d) * np.square(q)
+
+def Lorentzian_jacobian(x, x0, a, gam, b):
+    J = _jacobian_buffer(x, x0, a, gam, b)
+    _lorentz_jacobian_into(J[..., 0:3], x, x0, a, gam)
+    J[..., 3] = 1
+    return J
+
+def Double_Lorentzian_jacobian(x, x1, a1, gam1, b1, x2, a2, gam2):
+    J = _jacobian_buffer(x, x1, a1, gam1, b1, x2, a2, gam2)
+    _lorentz_jacobian_into(J[..., 0:3], x, x1, a1, gam1)
+    J[..., 3] = 1
+    _lorentz_jacobian_into(J[..., 4:7], x, x2, a2, gam2)
+    return J
+
+def Linear_jacobian(x, m, b):
+    J = _jacobian_buffer(x, m, b)
+    J[..., 0] = x
+    J[..., 1] = 1
+    return J
+
+def Oscillation_jacobian(x, A, B, phase):
+    J = _jacobian_buffer(x, A, B, phase)
+    angle = 2*np.pi*np.asarray(x)/RF_PERIOD + phase
+    J[..., 0] = 1
+    J[..., 1] = np.sign(B) * np.sin(angle)
+    J[..., 2] = np.abs(B) * np.cos(angle)
+    return J
+
+def Gaussian_jacobian(x, xm, sigma, A, c):
+    J = _jacobian_buffer(x, xm, sigma, A, c)
+    u = np.subtract(x, xm) / sigma
+    e = np.exp(-0.5 * np.square(u))
+    J[..., 2] = np.sign(A) * e
+    e *= np.absolute(A)
+    J[..., 0] = e * u / sigma
+    J[..., 1] = e * np.square(u) / sigma
+    J[..., 3] = 1
+    return J
+
+def Rscatt__jacobian(t, d, b, p, m):
+    S = 2
+    G = 20.4e6
+    O = 1 / (RF_PERIOD*1e-9)  * np.pi*2
+    angle = O*10**-9*np.asarray(t) + p
+    D = d - np.abs(b)*O*np.cos(angle)
+    H = (G/2)**2
+    Q = np.sqrt(1+S)*H + np.square(D)
+    dR_dD = -2 * m * H * D / np.square(Q)
+    J = _jacobian_buffer(t, d, b, p, m)
+    J[..., 0] = dR_dD
+    J[..., 1] = dR_dD * (-np.sign(b)*O*np.cos(angle))
+    J[..., 2] = dR_dD * (np.abs(b)*O*np.sin(angle))
+    J[..., 3] = H / Q
+    return J
+
+def Rscatt_high_jacobian(t, m, S, d, v, p):
+    G = 20.4e6 * (1+S)**.5
+    O = np.pi * 2 / (RF_PERIOD*1e-9)
+    k = np.pi * 2 / (3e8/(3e8/493e-9 + d))
+    q = np.cos(np.pi/4)
+    angle = O*10**-9*np.asarray(t) + p
+    s = np.sin(angle)
+    D = d + k*v*s*q
+    N = (S + 1) + 4 * np.square(D / G)
+    R_N = m*(G/2) * S                         # R = R_N / N
+    dR_dN = -R_N / np.square(N)
+    dN_dD = 8 * D / np.square(G)
+
+    J = _jacobian_buffer(t, m, S, d, v, p)
+    J[..., 0] = (G/2) * S / N
+    dG_dS = G / (2*(1+S))
+    J[..., 1] = m/2 * (dG_dS*S + G) / N + dR_dN * (1 - 4*np.square(D)/(np.square(G)*(1+S)))
+    J[..., 2] = dR_dN * dN_dD * (1 + np.pi*2/3e8 * v*s*q)
+    J[..., 3] = dR_dN * dN_dD * k*s*q
+    J[..., 4] = dR_dN * dN_dD * k*v*np.cos(angle)*q
+    return J
+
+def Superradiance_jacobian(t, G, A):
+    J = _jacobian_buffer(t, G, A)
+    t = np.asarray(t)
+    e = np.exp(-2*G*t)
+    J[..., 0] = A * e * (2 + 12*G*t - 16*np.square(G*t))
+    J[..., 1] = (1+4*G*t)*2*G*e
+    return J
+
+
+JACOBIANS = {
+    expon: expon_jacobian,
+    Lorentzian: Lorentzian_jacobian,
+    Double_Lorentzian: Double_Lorentzian_jacobian,
+    Linear: Linear_jacobian,
+    Oscillation: Oscillation_jacobian,
+    Gaussian: Gaussian_jacobian,
+    Rscatt_: Rscatt__jacobian,
+    Rscatt_high: Rscatt_high_jacobian,
+    Superradiance: Superradiance_jacobian,
+}
     
     
 def find_nearest(array,value):
@@ -706,4 +1154,52 @@ def find_nearest(array,value):
         return array[idx]
 
 
+### find_nearest for many values at once: indices into the sorted array and distances ###
+def find_nearest_batch(array, values, side='nearest', tolerance=None):
+    #     side: 'nearest' (ties go to the later element, as find_nearest), 'previous' (last element <= value)
+    #           or 'next' (first element >= value)
+    #     tolerance: matches further away than this get index -1 and distance NaN
+    # Returns (index, distance) with distance = |value - array[index]|. Values without a match on
+    # their side (before the first or after the last element) also get -1 and NaN.
+    array = np.asarray(array)
+    values = np.asarray(values)
+    n = len(array)
+    if side == 'previous':
+        index = np.searchsorted(array, values, side='right') - 1
+    elif side == 'next':
+        index = np.searchsorted(array, values, side='left')
+    elif side == 'nearest':
+        right = np.searchsorted(array, values, side='left')
+        left = np.clip(right - 1, 0, max(n - 1, 0))
+        right_c = np.clip(right, 0, max(n - 1, 0))
+        if n:
+            closer = np.abs(values - array[left]) < np.abs(values - array[right_c])
+            index = np.where((right > 0) & ((right == n) | closer), left, right_c)
+        else:
+            index = np.full(np.shape(values), -1)
+    else:
+        raise ValueError("side must be 'nearest', 'previous' or 'next'")
+    found = (index >= 0) & (index < n)
+    distance = np.full(np.shape(values), np.nan)
+    distance[found] = np.abs(values[found] - array[index[found]])
+    if tolerance is not None:
+        found &= distance <= tolerance
+    distance[~found] = np.nan
+    return np.where(found, index, -1), distance
+
+
+def join_nearest(events, log, on='time', side='previous', tolerance=None, suffix='_log'):
+    # adds the columns of an external log (stage positions, shutter states, ...) to every event from
+    # the log row found by find_nearest_batch, in one pass. Unmatched events get NaN.
+    #     events, log: DataFrames, log sorted by `on`
+    index, distance = find_nearest_batch(log[on].to_numpy(), events[on].to_numpy(), side, tolerance)
+    columns = log.iloc[np.maximum(index, 0)].reset_index(drop=True)
+    columns.loc[index < 0] = np.nan
+    columns.index = events.index
+    columns = columns.rename(columns={c: c + suffix if c in events else c for c in columns.columns})
+    joined = pd.concat([events, columns], axis=1)
+    joined[f'{on}_distance'] = distance
+    return joined
+
+
 
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')   # no display: setup() draws the auto_threshold figures, they are closed unseen
+
+import run_catalog
+import rate_functions
+
+### Headless jump analysis of many runs ###
+# Runs Ion.setup on every ion of the selected runs in worker processes and appends the rates,
+# thresholds and lifetimes to the results store, without a notebook. Runs are given by name, by
+# catalog query, or both:
+#     python batch_jumps.py Jumps_Six_350V_1 Jumps_Six_350V_2
+#     python batch_jumps.py --where family=6ions_350V --processes 8 --store results.sqlite
+#     python batch_jumps.py --where ions=4 --where voltage=350 --sigma 2.5 --cache .jump_cache --csv rates.csv
+# Catalog file paths are relative to --data (default: the working directory).
+
+
+def parse_value(text):
+    # catalog values are numbers or strings: 350 -> 350, 2.5 -> 2.5, true -> True, 6ions_350V -> '6ions_350V'
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def select_runs(names, where):
+    filters = {}
+    for item in where or []:
+        key, _, value = item.partition('=')
+        filters[key] = parse_value(value)
+    runs = list(names)
+    if filters:
+        runs += [run for run in run_catalog.select(**filters) if run not in runs]
+    return runs
+
+
+def parser():
+    p = argparse.ArgumentParser(description='Jump analysis of catalog runs, results appended to the results store.')
+    p.add_argument('runs', nargs='*', help='run names (choose_file functions / run_catalog entries)')
+    p.add_argument('--where', action='append', metavar='KEY=VALUE', help='catalog filter, repeat to combine (AND)')
+    p.add_argument('--list', action='store_true', help='print the selected runs and exit')
+    p.add_argument('--data', default='.', help='directory the catalog file paths are relative to')
+    p.add_argument('--sigma', type=float, default=2)
+    p.add_argument('--no-uncertainty-control', dest='uncertainty_control', action='store_false')
+    p.add_argument('--single-photon-control', action='store_true')
+    p.add_argument('--no-afterpulse-control', dest='afterpulse_control', action='store_false')
+    p.add_argument('--tot-range', type=float, nargs=2, metavar=('LOW', 'HIGH'), help='ToT cut applied in the ROIs')
+    p.add_argument('--method', choices=('poisson', 'bootstrap'), default='poisson', help='rate confidence intervals')
+    p.add_argument('--cl', type=float, default=0.95)
+    p.add_argument('--n-boot', type=int, default=1000)
+    p.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    p.add_argument('--cache', default=None, help='result cache directory, reused between invocations')
+    p.add_argument('--store', default='results.sqlite', help='SQLite results store ("" to skip)')
+    p.add_argument('--csv', default=None, help='also write the rate table to this CSV file')
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    runs = select_runs(args.runs, args.where)
+    unknown = [run for run in runs if run not in run_catalog.RUNS]
+    if unknown:
+        parser().error(f'unknown runs: {", ".join(unknown)}')
+    if not runs:
+        parser().error('no runs selected')
+    if args.list:
+        print('\n'.join(runs))
+        return 0
+
+    store = None if not args.store else os.path.abspath(args.store)
+    cache = None if args.cache is None else os.path.abspath(args.cache)
+    csv = None if args.csv is None else os.path.abspath(args.csv)
+    os.chdir(args.data)
+
+    start = time.perf_counter()
+    table = rate_functions.transition_rates(
+        runs, args.sigma, args.uncertainty_control, args.single_photon_control, args.afterpulse_control,
+        cl=args.cl, method=args.method, n_boot=args.n_boot, processes=args.processes, cache=cache,
+        tot_range=args.tot_range)
+    print(f'{len(runs)} runs, {len(table)} ions analysed in {time.perf_counter() - start:.1f} s')
+
+    if store is not None:
+        from results_store import ResultsStore
+        parameters = rate_functions.analysis_parameters(args.sigma, args.uncertainty_control, args.single_photon_control,
+                                                        args.afterpulse_control, args.cl, args.method, args.tot_range)
+        results = ResultsStore(store)
+        analysis = results.append(table, **parameters)
+        results.close()
+        print(f'analysis {analysis} appended to {store}')
+    if csv is not None:
+        table.to_csv(csv, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
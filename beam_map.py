@@ -0,0 +1,158 @@
+import os
+import inspect
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy.optimize import least_squares
+
+import run_catalog
+import rate_functions
+from beam_scan import sigma2fwhm
+
+### Two-dimensional beam map from the x and y scans together ###
+# The xscan (399-404) and yscan (149-156) families are fitted one axis at a time in the notebooks.
+# Here every scan run with a known stage position feeds one fit of an elliptical, tilted
+# 2D Gaussian. The 4-ion xscan and yscan runs only record the scanned coordinate: they are taken to
+# cross the beam centre, their missing coordinate is the fitted x0 or y0. Runs without any stage
+# position are reported and left out. All ions are fitted jointly: ion i sits a distance
+# scale*(p_i - mean p) along the chain axis from the chain centre (p_i = its ROI position on the
+# detector, scale = stage units per pixel, fitted), so every ion samples the beam at a slightly
+# different point.
+# Per-run rates are kept in a CSV cache, adding a scan point only analyses the new run. Every cached row
+# carries the analysis settings it was computed with (rate_functions.analysis_parameters), rows of other
+# settings are kept in the file but not used, so changing sigma, the controls or the ToT cut reanalyses.
+
+PARAMS = ['x0', 'y0', 'sigma_major', 'sigma_minor', 'theta', 'scale', 'offset']
+
+
+def beam2d(X, Y, x0, y0, sigma_major, sigma_minor, theta, amplitude, offset):
+    # elliptical Gaussian, major axis at angle theta (rad) from the stage x axis
+    dx, dy = X - x0, Y - y0
+    u = dx*np.cos(theta) + dy*np.sin(theta)
+    v = -dx*np.sin(theta) + dy*np.cos(theta)
+    return amplitude*np.exp(-0.5*((u/sigma_major)**2 + (v/sigma_minor)**2)) + offset
+
+
+class BeamMap:
+    def __init__(self, cache='beam_map_rates.csv', kind='total', chain_axis='y', **rate_options):
+        #     cache: CSV file holding the rate table of every run analysed so far
+        #     chain_axis: stage axis along the ion chain ('y' for the axial scans)
+        #     rate_options: passed to rate_functions.transition_rates (sigma, processes, ...)
+        self.cache = cache
+        self.kind = kind
+        self.chain_axis = chain_axis
+        self.rate_options = rate_options
+        names = inspect.signature(rate_functions.analysis_parameters).parameters
+        self.options = rate_functions.analysis_parameters(**{k: v for k, v in rate_options.items() if k in names})
+        self.stored = pd.read_csv(cache) if cache and os.path.exists(cache) else pd.DataFrame()
+        self.rates = self.stored[self._matches(self.stored)].reset_index(drop=True) if len(self.stored) else pd.DataFrame()
+        self.fit = None
+
+
+    def _matches(self, table):
+        # rows computed with the settings of this map
+        keep = np.ones(len(table), dtype=bool)
+        for name, value in self.options.items():
+            if name not in table:
+                return np.zeros(len(table), dtype=bool)
+            keep &= table[name].isna().to_numpy() if value is None else (table[name] == value).to_numpy()
+        return keep
+
+
+        ### Adds scan runs (default: every catalog run with a stage position), analysing only new ones ###
+    def update(self, runs=None):
+        if runs is None:
+            runs = [run for run, entry in run_catalog.RUNS.items() if entry.get('x') is not None or entry.get('y') is not None]
+        position = {run: (run_catalog.RUNS.get(run, {}).get('x'), run_catalog.RUNS.get(run, {}).get('y')) for run in runs}
+        excluded = [run for run in runs if position[run] == (None, None)]
+        single = [run for run in runs if None in position[run] and run not in excluded]
+        if excluded:
+            print(f'No stage position in run_catalog, left out of the beam fit: {", ".join(excluded)}')
+        if single:
+            print(f'One stage coordinate only, placed on the fitted beam centre: {", ".join(single)}')
+        done = set(self.rates['run']) if len(self.rates) else set()
+        new = [run for run in runs if run not in done]
+        if new:
+            table = rate_functions.transition_rates(new, **self.rate_options).assign(**self.options)
+            self.rates = pd.concat([self.rates, table], ignore_index=True)
+            self.stored = pd.concat([self.stored, table], ignore_index=True)
+            if self.cache:
+                self.stored.to_csv(self.cache, index=False)
+        return new
+
+
+    def _points(self, runs=None):
+        table = self.rates if runs is None else self.rates[self.rates['run'].isin(runs)]
+        table = table.reindex(columns=table.columns.union(['x', 'y'], sort=False))
+        table = table[table[['x', 'y']].notna().any(axis=1)]
+        ions = np.sort(table['ion'].unique())
+        # ROI position of every ion along the chain (detector x), averaged over the runs
+        pixel = table.groupby('ion')['x_roi'].mean()
+        chain = (pixel - pixel.mean()).reindex(ions).to_numpy()
+        ion_index = np.searchsorted(ions, table['ion'].to_numpy())
+        error = (table[f'rate_{self.kind}_high'] - table[f'rate_{self.kind}_low']).to_numpy() / 2
+        return (table['x'].to_numpy(float), table['y'].to_numpy(float), ion_index, chain,
+                table[f'rate_{self.kind}'].to_numpy(), np.where(error > 0, error, np.nan), ions)
+
+
+    def _model(self, q, X, Y, ion_index, chain):
+        x0, y0, s1, s2, theta, scale, offset = q[:7]
+        X, Y = np.where(np.isnan(X), x0, X), np.where(np.isnan(Y), y0, Y)   # single axis scans cross the centre
+        amplitude = q[7:][ion_index]
+        shift = scale * chain[ion_index]
+        if self.chain_axis == 'y':
+            Y = Y - shift
+        else:
+            X = X - shift
+        return beam2d(X, Y, x0, y0, s1, s2, theta, amplitude, offset)
+
+
+        ### Joint fit of the 2D beam over all scan points and ions ###
+    def fit_beam(self, runs=None, p0=None):
+        X, Y, ion_index, chain, rate, error, ions = self._points(runs)
+        weight = 1 / np.where(np.isfinite(error), error, np.nanmedian(error) if np.isfinite(error).any() else 1)
+
+        if p0 is None:
+            w = np.clip(rate - rate.min(), 0, None) + 1e-12
+            # weighted moments over the runs that record the coordinate
+            mean = lambda V: np.sum((w*V)[np.isfinite(V)]) / w[np.isfinite(V)].sum() if np.isfinite(V).any() else 0.0
+            x0, y0 = mean(X), mean(Y)
+            sx = max(np.sqrt(mean((X-x0)**2)), 0.25)
+            sy = max(np.sqrt(mean((Y-y0)**2)), 0.25)
+            p0 = [x0, y0, sx, sy, 0.0, 0.0, rate.min()] + [rate.max() - rate.min()] * len(ions)
+        lower = [-np.inf, -np.inf, 1e-6, 1e-6, -np.pi/2, -np.inf, -np.inf] + [0] * len(ions)
+        upper = [np.inf, np.inf, np.inf, np.inf, np.pi/2, np.inf, np.inf] + [np.inf] * len(ions)
+
+        residual = lambda q: (self._model(q, X, Y, ion_index, chain) - rate) * weight
+        result = least_squares(residual, np.clip(p0, lower, upper), bounds=(lower, upper))
+
+        dof = max(len(rate) - len(result.x), 1)
+        cov = np.linalg.pinv(result.jac.T @ result.jac) * (2*result.cost / dof)
+        err = np.sqrt(np.diag(cov))
+        names = PARAMS + [f'amplitude_{n}' for n in ions]
+        fit = pd.DataFrame({'value': result.x, 'error': err}, index=names)
+        extra = pd.DataFrame({
+            'value': [sigma2fwhm(result.x[2]), sigma2fwhm(result.x[3]), np.degrees(result.x[4])],
+            'error': [sigma2fwhm(err[2]), sigma2fwhm(err[3]), np.degrees(err[4])],
+        }, index=['fwhm_major', 'fwhm_minor', 'tilt_deg'])
+        self.fit = pd.concat([fit, extra])
+        self.converged = result.success
+        return self.fit
+
+
+    def plot(self, runs=None):
+        X, Y, ion_index, chain, rate, error, ions = self._points(runs)
+        q = self.fit['value'].to_numpy()
+        shift = q[5] * chain[ion_index]
+        X, Y = np.where(np.isnan(X), q[0], X), np.where(np.isnan(Y), q[1], Y)
+        Xe, Ye = (X, Y - shift) if self.chain_axis == 'y' else (X - shift, Y)
+        gx, gy = np.meshgrid(np.linspace(Xe.min() - 1, Xe.max() + 1, 200), np.linspace(Ye.min() - 1, Ye.max() + 1, 200))
+        fig, ax = plt.subplots(1, figsize = (6, 5))
+        ax.contour(gx, gy, beam2d(gx, gy, *q[:5], 1, 0), levels=[np.exp(-2), 0.5, 0.9], colors='k', alpha=0.5)
+        points = ax.scatter(Xe, Ye, c=rate, cmap='viridis')
+        fig.colorbar(points, ax=ax, label='Transition Rate')
+        ax.set_xlabel('Beam x position (mils)')
+        ax.set_ylabel('Beam y position (mils)')
+        ax.set_title(f"FWHM {self.fit.at['fwhm_major', 'value']:.2f} x {self.fit.at['fwhm_minor', 'value']:.2f} mils, "
+                     f"tilt {self.fit.at['tilt_deg', 'value']:.1f} deg")
+        plt.show()
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+import run_catalog
+import rate_functions
+from fit_functions import batch_fit
+from Ion_functions import Gaussian
+
+### Beam profile scans ###
+# Axial_Size_* and Radial_size_* in one call: per-ion jump rates for every run of a scan
+# (rate_functions, in parallel), a Gaussian fit of rate against beam position for every ion and
+# the beam sigma/FWHM with uncertainties from the fit covariance.
+
+
+def sigma2fwhm(sigma):
+    return sigma * np.sqrt(8 * np.log(2))
+
+
+### Scan manifest {run: beam position} from the catalog, e.g. manifest(family='2ions_yscan', axis='y') ###
+def manifest(axis, **filters):
+    runs = run_catalog.select(**filters)
+    return {run: run_catalog.RUNS[run][axis] for run in runs if run_catalog.RUNS[run].get(axis) is not None}
+
+
+def _guess(positions, rates):
+    # starting values in the order of Gaussian(x, xm, sigma, A, c), runs without a rate (NaN) left out
+    keep = np.isfinite(rates)
+    if not keep.any():
+        return [np.mean(positions), 1, 0, 0]
+    positions, rates = positions[keep], rates[keep]
+    c = rates.min()
+    weights = np.clip(rates - c, 0, None)
+    if weights.sum() == 0:
+        weights = np.ones_like(rates)
+    xm = np.sum(weights * positions) / weights.sum()
+    sigma = np.sqrt(np.sum(weights * (positions - xm)**2) / weights.sum())
+    spacing = np.min(np.diff(np.unique(positions))) if len(np.unique(positions)) > 1 else 1
+    return [xm, max(sigma, spacing / 2), rates.max() - c, c]
+
+
+### Gaussian fit of rate against beam position for every ion, all ions in one batched fit ###
+def fit_beam(positions, rates, errors=None, offset_bounds=(-.1, .1)):
+    # positions: (npoints,) beam positions, rates: (nions, npoints), errors: same shape as rates or None
+    # offset_bounds limits the constant background c like the bounds used in the scan notebooks.
+    positions = np.asarray(positions, dtype=float)
+    rates = np.atleast_2d(np.asarray(rates, dtype=float))
+    p0 = np.array([_guess(positions, y) for y in rates])
+    p0[:, 3] = np.clip(p0[:, 3], *offset_bounds)
+    bounds = ([-np.inf, 0, -np.inf, offset_bounds[0]], [np.inf, np.inf, np.inf, offset_bounds[1]])
+    popt, pcov, info = batch_fit(Gaussian, positions, rates, p0, sigma=errors, bounds=bounds,
+                                 absolute_sigma=errors is not None)
+    perr = np.sqrt(np.einsum('mii->mi', pcov))
+    return pd.DataFrame({
+        'ion': np.arange(1, len(rates) + 1), 'center': popt[:, 0], 'center_err': perr[:, 0],
+        'sigma': np.abs(popt[:, 1]), 'sigma_err': perr[:, 1],
+        'fwhm': sigma2fwhm(np.abs(popt[:, 1])), 'fwhm_err': sigma2fwhm(perr[:, 1]),
+        'amplitude': np.abs(popt[:, 2]), 'offset': popt[:, 3],
+        'converged': info['converged'], 'n_iter': info['n_iter'],
+    })
+
+
+def rate_matrix(rates, scan, kind='total'):
+    # (nions, npoints) arrays of rates and symmetric errors in the order of the scan positions,
+    # NaN where an ion is missing from a run (e.g. ion 3 in a 2-ion run of a mixed scan)
+    runs = list(scan)
+    ions = sorted(rates['ion'].unique())
+    grid = pd.MultiIndex.from_product([ions, runs], names=['ion', 'run'])
+    table = rates.set_index(['ion', 'run']).reindex(grid)
+    column = lambda name: table[name].to_numpy(dtype=float).reshape(len(ions), len(runs))
+    value, low, high = column(f'rate_{kind}'), column(f'rate_{kind}_low'), column(f'rate_{kind}_high')
+    return ions, value, (high - low) / 2
+
+
+### Rates for every run in the scan and the beam fit of every ion ###
+def beam_scan(scan, kind='total', weighted=True, offset_bounds=(-.1, .1), rates=None, **rate_options):
+    #     scan: manifest {run: beam position}
+    #     kind: 'BtD', 'DtB' or 'total' jump rate
+    #     rates: a rate_functions table from an earlier call, to refit without re-analysing the runs
+    #     rate_options: passed to rate_functions.transition_rates (sigma, processes, masks, ...)
+    if rates is None:
+        rates = rate_functions.transition_rates(list(scan), **rate_options)
+    ions, value, error = rate_matrix(rates, scan, kind)
+    fits = fit_beam(list(scan.values()), value, error if weighted else None, offset_bounds)
+    fits['ion'] = ions
+    return rates, fits
+
+
+def plot_scan(scan, rates, fits, kind='total', axis_label='Beam position (mils)'):
+    positions = np.asarray(list(scan.values()), dtype=float)
+    ions, value, error = rate_matrix(rates, scan, kind)
+    x = np.linspace(positions.min() - 1, positions.max() + 1, 1000)
+    fig, ax = plt.subplots(1, figsize = (5, 5))
+    for i, fit in zip(range(len(ions)), fits.itertuples()):
+        points = ax.errorbar(positions, value[i], yerr=error[i], fmt='o', label=f'Ion {ions[i]}')
+        ax.plot(x, Gaussian(x, fit.center, fit.sigma, fit.amplitude, fit.offset), color=points[0].get_color())
+    ax.set_xlabel(axis_label)
+    ax.set_ylabel('Transition Rate')
+    ax.legend()
+    plt.show()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Ion_functions as func
+from fit_functions import batch_fit
+
+### Fitting benchmarks: finite differences against the analytic jacobians in Ion_functions ###
+# python benchmarks/bench_fits.py
+# Prints function evaluations / iterations and wall-clock time for the fits done in
+# Ion.xhistogram (Gaussian), Ion.auto_threshold (expon) and for batched fits of every model.
+# The two-parameter exponential on 200 bins is about break-even (0.9-1.1x between runs): its
+# finite differences cost two cheap model calls, about what one jacobian call costs.
+
+
+def timed(f, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = f()
+    return (time.perf_counter() - start) / repeat, out
+
+
+def curve_fit_case(name, model, x, y, p0, repeat=50):
+    jac = func.JACOBIANS[model]
+    t_num, (_, _, info_num, _, _) = timed(lambda: curve_fit(model, x, y, p0=p0, maxfev=50000, full_output=True), repeat)
+    t_jac, (_, _, info_jac, _, _) = timed(lambda: curve_fit(model, x, y, p0=p0, jac=jac, maxfev=50000, full_output=True), repeat)
+    # MINPACK counts the finite difference steps in nfev, an analytic jacobian call costs about one model call
+    calls_num = info_num['nfev']
+    calls_jac = info_jac['nfev'] + info_jac['njev']
+    print(f'{name:<34}{calls_num:>10}{calls_jac:>10}{t_num*1e3:>12.3f}{t_jac*1e3:>12.3f}{t_num/t_jac:>9.2f}x')
+
+
+def batch_case(name, model, x, y, p0, repeat=3):
+    t_num, (_, _, info_num) = timed(lambda: batch_fit(model, x, y, p0, jac=False), repeat)
+    t_jac, (_, _, info_jac) = timed(lambda: batch_fit(model, x, y, p0), repeat)
+    print(f'{name:<34}{info_num["n_iter"].mean():>10.1f}{info_jac["n_iter"].mean():>10.1f}'
+          f'{t_num*1e3:>12.3f}{t_jac*1e3:>12.3f}{t_num/t_jac:>9.2f}x')
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    print(f'{"curve_fit":<34}{"calls fd":>10}{"calls jac":>10}{"ms fd":>12}{"ms jac":>12}{"speedup":>10}')
+    x = np.arange(44.5, 53.5)
+    y = rng.poisson(func.Gaussian(x, 48.3, 0.9, 4000, 50)).astype(float)
+    curve_fit_case('xhistogram Gaussian', func.Gaussian, x, y, [48, 1, y.max(), y.max()/10])
+
+    dt = rng.exponential(4e-4, 200000)
+    heights, edges = np.histogram(dt, bins=200, range=(0, .05), density=True)
+    centers = edges[:-1] + np.diff(edges) / 2
+    curve_fit_case('auto_threshold expon', func.expon, centers, heights, [1/5e-4, heights.max()])
+
+    x = np.linspace(-30, 30, 41)   # MHz
+    y = func.Lorentzian(x, 2, 50, 10, 5) + rng.normal(0, 1, len(x))
+    curve_fit_case('Lorentzian spectrum', func.Lorentzian, x, y, [0, 40, 8, 0])
+
+    print()
+    print(f'{"batch_fit (500 datasets)":<34}{"iter fd":>10}{"iter jac":>10}{"ms fd":>12}{"ms jac":>12}{"speedup":>10}')
+    m = 500
+    x = np.linspace(0, 10, 60)
+    true = np.c_[rng.uniform(3, 7, m), rng.uniform(.5, 2, m), rng.uniform(5, 20, m), rng.uniform(0, 1, m)]
+    y = func.Gaussian(x, *[true[:, k, None] for k in range(4)]) + rng.normal(0, .3, (m, len(x)))
+    p0 = np.c_[x[y.argmax(1)], np.ones(m), y.max(1), np.zeros(m)]
+    batch_case('Gaussian', func.Gaussian, x, y, p0)
+
+    x = np.linspace(-5, 5, 80)
+    y = func.Double_Lorentzian(x, -1.5, 10, .6, 1, 1.2, 6, .8) + rng.normal(0, .2, (m, len(x)))
+    batch_case('Double_Lorentzian', func.Double_Lorentzian, x, y, [-1.4, 9, .5, .8, 1.1, 5, .7])
+
+    t = np.linspace(0, 2*func.RF_PERIOD, 100)
+    y = func.Rscatt_high(t, 1., 1.5, -2e7, 3., .4) * (1 + rng.normal(0, .01, (m, len(t))))
+    batch_case('Rscatt_high', func.Rscatt_high, t, y, [1.1, 1.4, -1.9e7, 2.5, .3])
+
+    print()
+    x = rng.normal(0, 1, 10**6)
+    t_old, _ = timed(lambda: np.absolute(2.)*np.exp(-np.power((x-0.1)/1.2, 2)/2) + .3, 20)
+    t_new, _ = timed(lambda: func.Gaussian(x, 0.1, 1.2, 2., .3), 20)
+    print(f'Gaussian evaluation, 1e6 points: {t_old*1e3:.2f} ms before, {t_new*1e3:.2f} ms now')
+
+
+if __name__ == '__main__':
+    main()
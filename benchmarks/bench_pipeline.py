@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import choose_file
+from Ion_functions import Ion
+
+### Pipeline benchmarks: time and peak memory of every stage of the Ion analysis ###
+# python benchmarks/bench_pipeline.py                              default grid (1e5, 1e6 events; 1, 2, 4, 9 ions)
+# python benchmarks/bench_pipeline.py --sizes 1e5 1e6 1e7 1e8 --ions 1 2 3 4 5 6 9
+# python benchmarks/bench_pipeline.py --save-baseline              store the results in baselines.json
+# python benchmarks/bench_pipeline.py --check 1.5                  exit 1 if a stage is 1.5x slower than its baseline
+#
+# Synthetic TimePix files (telegraph bright/dark fluorescence of every ion on its own pixels, written
+# in the layout of the converted data files) are analysed stage by stage:
+#     csv_load      pd.read_csv of the file as in the loaders
+#     roi_query     the loaders' per-ion ROI .query
+#     roi_assign    choose_file.assign_roi, all ions at once
+#     dt_loop       the loaders' dt loop over the events of ion 1
+#     loader        the whole choose_file group function (One ... Nine), plots included
+#     auto_threshold, sortbythreshold, transitions, leadup, duration_statistics on ion 1
+# Wall time is the best of --repeat runs; peak memory is the tracemalloc peak of one extra run.
+# A stage is skipped at a size when its time at the previous size, scaled linearly, exceeds --budget.
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+GROUPS = {1: 'One', 2: 'Two', 3: 'Three', 4: 'Four', 5: 'Five', 6: 'Six_squeezed', 9: 'Nine'}
+STAGES = ['csv_load', 'roi_query', 'roi_assign', 'dt_loop', 'loader',
+          'auto_threshold', 'sortbythreshold', 'transitions', 'leadup', 'duration_statistics']
+SPACING = 8    # pixels between neighbouring ions, wider than every loader ROI
+R = 2
+
+
+def centers(n_ions):
+    return [(40 + SPACING*k, 92) for k in range(n_ions)]
+
+
+def synthetic_events(n_events, n_ions, seed=0, bright=3000., dark=30., tau=0.05, noise=0.01):
+    # about n_events events: telegraph fluorescence of every ion plus a fraction of uniform background
+    rng = np.random.default_rng(seed)
+    per_ion = n_events * (1 - noise) / n_ions
+    duration = per_ion / ((bright + dark) / 2)
+    parts = []
+    for cx, cy in centers(n_ions):
+        k = int(duration / tau * 1.2) + 10
+        lengths = rng.exponential(tau, k)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        rates = np.where(np.arange(k) % 2 == 0, bright, dark)
+        counts = rng.poisson(rates * lengths)
+        segment = np.repeat(np.arange(k), counts)
+        time = starts[segment] + rng.random(len(segment)) * lengths[segment]
+        time = time[time < duration]
+        parts.append((np.clip(np.rint(cx + rng.normal(0, .6, len(time))), 0, 255),
+                      np.clip(np.rint(cy + rng.normal(0, .6, len(time))), 0, 255), time))
+    m = int(n_events * noise)
+    parts.append((rng.integers(0, 256, m), rng.integers(0, 256, m), rng.random(m) * duration))
+    x, y, time = (np.concatenate(column) for column in zip(*parts))
+    order = np.argsort(time, kind='stable')
+    return pd.DataFrame({'x': x[order].astype(np.int64), 'y': y[order].astype(np.int64),
+                         'time': np.rint(time[order] / choose_file.TOA_UNIT).astype(np.int64),
+                         'center flux': rng.integers(100, 3000, len(time)), 'cluster size': rng.integers(1, 6, len(time))})
+
+
+def ion_table(table, center, afterpulse_control=True):
+    # the loaders' table of one ion, with the dt loop replaced by np.diff (same values)
+    data = table.query(f"((x-{center[0]})**2 + (y-{center[1]})**2)**(1/2) <= {R}").reset_index(drop=True)
+    data['dt'] = np.append(np.diff(data['time'].to_numpy()), 0)
+    if afterpulse_control:
+        data = data.query('dt > 1e-7').reset_index()
+    data['index'] = np.arange(len(data))
+    return data
+
+
+def dt_loop(name):
+    dt = []
+    for i in range(0, len(name)-1):
+        dt.append(name.at[i+1, 'time'] - name.at[i, 'time'])
+    dt.append(0)
+    return dt
+
+
+def transitions(ion):
+    # transitions() appends to the ion's lists, every repeat starts from empty ones
+    ion.transpts, ion.BtD, ion.DtB = [], [], []
+    ion.transitions(False)
+
+
+def run_loader(path, n_ions):
+    choose_file.filename = path
+    for k, (cx, cy) in enumerate(centers(9), start=1):
+        setattr(choose_file, f'x{k}', cx)
+        setattr(choose_file, f'y{k}', cy)
+    getattr(choose_file, GROUPS[n_ions])()
+    plt.close('all')
+
+
+def measure(function, repeat, memory):
+    # the Ion methods print their results, that output is discarded
+    best = np.inf
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+            plt.close('all')
+        peak = np.nan
+        if memory:
+            tracemalloc.start()
+            try:
+                function()
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+            plt.close('all')
+    return best, peak
+
+
+### Runs every stage for one file size and ion count ###
+def bench_case(n_events, n_ions, folder, stages, repeat=1, memory=True, budget=120., previous=None):
+    #     previous: {stage: (events, seconds)} of the last size, used to skip stages over budget
+    previous = {} if previous is None else previous
+    table = synthetic_events(n_events, n_ions)
+    path = os.path.join(folder, f'events_{n_events}_{n_ions}')
+    table.to_csv(path)
+    loaded = table.astype({'time': float})
+    loaded['time'] = choose_file.TOA_UNIT * loaded['time']
+    data = ion_table(loaded, centers(n_ions)[0])
+    ion = Ion(1, *centers(n_ions)[0], R, 'r', data)
+    choose_file.filename = path
+
+    steps = {
+        'csv_load': lambda: pd.read_csv(path).drop(columns='Unnamed: 0'),
+        'roi_query': lambda: [loaded.query(f"((x-{cx})**2 + (y-{cy})**2)**(1/2) <= {R}").reset_index(drop=True)
+                              for cx, cy in centers(n_ions)],
+        'roi_assign': lambda: choose_file.assign_roi(loaded.copy(), centers(n_ions), R),
+        'dt_loop': lambda: dt_loop(loaded.query(f"((x-{centers(n_ions)[0][0]})**2 + (y-{centers(n_ions)[0][1]})**2)**(1/2) <= {R}").reset_index(drop=True)),
+        'loader': lambda: run_loader(path, n_ions),
+        'auto_threshold': lambda: ion.auto_threshold(),
+        'sortbythreshold': lambda: ion.sortbythreshold(),
+        'transitions': lambda: transitions(ion),
+        'leadup': lambda: ion.leadup(5),
+        'duration_statistics': lambda: ion.duration_statistics(),
+    }
+    results = []
+    for stage in stages:
+        row = {'stage': stage, 'events': n_events, 'ions': n_ions, 'ion_events': len(data)}
+        if stage in previous and previous[stage][1] * n_events / previous[stage][0] > budget:
+            row.update(seconds=np.nan, peak_mb=np.nan, skipped=True)
+        else:
+            try:
+                seconds, peak = measure(steps[stage], repeat, memory)
+                row.update(seconds=seconds, peak_mb=peak, skipped=False)
+                previous[stage] = (n_events, seconds)
+            except Exception as error:
+                row.update(seconds=np.nan, peak_mb=np.nan, skipped=True, error=repr(error))
+        results.append(row)
+        note = row.get('error', 'skipped (over budget)' if row['skipped'] else '')
+        print(f'{stage:<22}{n_events:>12.0e}{n_ions:>6}{row["seconds"]:>12.4f}{row["peak_mb"]:>12.1f}  {note}', flush=True)
+    os.remove(path)
+    return results
+
+
+def key(row):
+    return f'{row["stage"]}|{int(row["events"])}|{int(row["ions"])}'
+
+
+def compare(table, baselines):
+    base = baselines.get('results', {})
+    table['baseline_s'] = [base.get(key(row), {}).get('seconds', np.nan) for row in table.to_dict('records')]
+    table['ratio'] = table['seconds'] / table['baseline_s']
+    return table
+
+
+def save_baselines(table, path=BASELINES):
+    # merges the new results into the stored baselines, keyed by stage, events and ions
+    baselines = load_baselines(path)
+    baselines['machine'] = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                            'processor': platform.processor() or platform.machine(), 'system': platform.system()}
+    for row in table[~table['skipped']].to_dict('records'):
+        baselines.setdefault('results', {})[key(row)] = {'seconds': row['seconds'], 'peak_mb': row['peak_mb']}
+    baselines = {'machine': baselines['machine'], 'results': dict(sorted(baselines['results'].items()))}
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=1)
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {'results': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Time and peak memory of the Ion pipeline stages.')
+    p.add_argument('--sizes', type=float, nargs='+', default=[1e5, 1e6], help='events per file')
+    p.add_argument('--ions', type=int, nargs='+', default=[1, 2, 4, 9], choices=sorted(GROUPS))
+    p.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    p.add_argument('--repeat', type=int, default=1)
+    p.add_argument('--budget', type=float, default=120, help='skip stages estimated to take longer (s)')
+    p.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc run')
+    p.add_argument('--save-baseline', action='store_true')
+    p.add_argument('--check', type=float, default=None, metavar='RATIO', help='fail if a stage is RATIO times slower')
+    p.add_argument('--baselines', default=BASELINES)
+    p.add_argument('--json', default=None, help='write the results to this file')
+    args = p.parse_args(argv)
+
+    print(f'{"stage":<22}{"events":>12}{"ions":>6}{"seconds":>12}{"peak MB":>12}')
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for n_ions in args.ions:
+            previous = {}
+            for size in sorted(args.sizes):
+                rows += bench_case(int(size), n_ions, folder, args.stages, args.repeat, args.memory, args.budget, previous)
+    table = compare(pd.DataFrame(rows), load_baselines(args.baselines))
+
+    print()
+    compared = table[np.isfinite(table['ratio'])]
+    if len(compared):
+        print('Against baselines (ratio > 1 is slower):')
+        print(compared[['stage', 'events', 'ions', 'seconds', 'baseline_s', 'ratio']].to_string(index=False))
+    if args.json:
+        table.to_json(args.json, orient='records', indent=1)
+    if args.save_baseline:
+        save_baselines(table, args.baselines)
+    if args.check is not None and (compared['ratio'] > args.check).any():
+        print(f'Slower than {args.check}x baseline:')
+        print(compared[compared['ratio'] > args.check][['stage', 'events', 'ions', 'ratio']].to_string(index=False))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from functools import partial
+from scipy import stats
+
+import run_catalog
+import rate_functions
+from fit_functions import batch_fit
+from Ion_functions import expon
+
+### Bootstrap uncertainties of thresholds, rates and lifetimes ###
+# Every estimate is recomputed for all replicates at once instead of once per replicate:
+#     threshold: resampling the events of an ion with replacement only changes the counts of the
+#                auto_threshold 'dt' histogram, which are multinomial. All replicate histograms are drawn
+#                in one call and fitted with expon in one batch_fit.
+#     rates: block bootstrap over equal time blocks (clustered jumps widen the interval), block
+#            indices of all replicates are one (replicates x blocks) array
+#     lifetimes: bright and dark segments (Ion.segment_table) resampled with stacked index arrays
+# Replicates are processed in chunks so the index arrays stay below max_elements.
+
+
+def _chunks(n_boot, size, max_elements):
+    step = max(1, int(max_elements // max(size, 1)))
+    for start in range(0, n_boot, step):
+        yield min(step, n_boot - start)
+
+
+def _summary(name, estimate, replicates, cl):
+    a = (1 - cl) / 2
+    replicates = replicates[np.isfinite(replicates)]
+    low, high = (np.quantile(replicates, [a, 1 - a]) if len(replicates) else (np.nan, np.nan))
+    return {'quantity': name, 'estimate': estimate, 'low': low, 'high': high,
+            'std': replicates.std(ddof=1) if len(replicates) > 1 else np.nan, 'replicates': len(replicates)}
+
+
+### Threshold of auto_threshold for every replicate ###
+def threshold_replicates(dt, sigma=2, n_boot=500, rng=None, hist_range=(0, .05)):
+    # returns the threshold of the data and of every replicate
+    rng = np.random.default_rng(rng)
+    dt = np.asarray(dt, dtype=float)
+    edges = np.histogram_bin_edges(dt, bins='auto', range=hist_range)
+    counts = np.histogram(dt, edges)[0]
+    width = np.diff(edges)
+    centers = edges[:-1] + width / 2
+    draws = np.vstack([counts, rng.multinomial(counts.sum(), counts / counts.sum(), size=n_boot)])
+    heights = draws / (counts.sum() * width)   # density=True of auto_threshold
+    p0 = [1/5e-4, heights[0].max()]
+    popt, _, info = batch_fit(expon, centers, heights, p0)
+    rate = np.where(info['converged'] & (popt[:, 0] > 0), popt[:, 0], np.nan)
+    threshold = stats.expon.ppf(stats.norm.cdf(sigma), scale=1 / rate)
+    return threshold[0], threshold[1:]
+
+
+def block_rate_replicates(times, start, end, n_boot=500, blocks=20, rng=None, max_elements=5e7, masks=()):
+    # jump rate of every replicate, drawn from blocks of the run
+    #     masks: (start, end) segments excluded from the live time of the blocks (times are already unmasked)
+    rng = np.random.default_rng(rng)
+    edges = np.linspace(start, end, blocks + 1)
+    counts = np.histogram(times, edges)[0]
+    live = np.array([rate_functions.live_time(edges[i], edges[i+1], masks) for i in range(blocks)])
+    out = []
+    for size in _chunks(n_boot, blocks, max_elements):
+        draw = rng.integers(0, blocks, size=(size, blocks))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out.append(counts[draw].sum(axis=1) / live[draw].sum(axis=1))
+    return len(times) / live.sum(), np.concatenate(out)
+
+
+def mean_replicates(values, n_boot=500, rng=None, max_elements=5e7):
+    # mean of the values and of every resample of them with replacement
+    rng = np.random.default_rng(rng)
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return np.nan, np.full(n_boot, np.nan)
+    out = []
+    for size in _chunks(n_boot, len(values), max_elements):
+        out.append(values[rng.integers(0, len(values), size=(size, len(values)))].mean(axis=1))
+    return values.mean(), np.concatenate(out)
+
+
+### Bootstrap intervals of the threshold, jump rates and lifetimes of one setup() ion ###
+def bootstrap_ion(ion, sigma=2, n_boot=500, cl=0.95, blocks=20, rng=None):
+    rng = np.random.default_rng(rng)
+    time = ion.data['time'].to_numpy()
+    start, end = time[0], time[-1]
+    rows = [_summary('threshold', *threshold_replicates(ion.data['dt'].to_numpy(), sigma, n_boot, rng), cl)]
+    jumps = {'BtD': time[np.asarray(ion.BtD, dtype=int)], 'DtB': time[np.asarray(ion.DtB, dtype=int)]}
+    jumps['total'] = np.sort(np.concatenate((jumps['BtD'], jumps['DtB'])))
+    for kind in rate_functions.KINDS:
+        rows.append(_summary(f'rate_{kind}', *block_rate_replicates(jumps[kind], start, end, n_boot, blocks, rng), cl))
+    segments = ion.segment_table()
+    # the first and last segments are cut by the start and end of the run, they are not lifetimes
+    inner = segments.iloc[1:-1]
+    rows.append(_summary('bright_lifetime', *mean_replicates(inner.loc[inner['state'] == 1, 'duration'], n_boot, rng), cl))
+    rows.append(_summary('dark_lifetime', *mean_replicates(inner.loc[inner['state'] == -1, 'duration'], n_boot, rng), cl))
+    table = pd.DataFrame(rows)
+    table.insert(0, 'ion', ion.n)
+    return table
+
+
+def bootstrap_run(run, sigma=2, uncertainty_control=True, single_photon_control=False, afterpulse_control=True,
+                  n_boot=500, cl=0.95, blocks=20, seed=None, cache=None):
+    import matplotlib.pyplot as plt
+    choose_file, ions = rate_functions.load_run(run, afterpulse_control)
+    rng = np.random.default_rng(seed)
+    tables = []
+    for ion in ions:
+        ion.setup(sigma, uncertainty_control, single_photon_control, cache=cache)
+        plt.close('all')
+        tables.append(bootstrap_ion(ion, sigma, n_boot, cl, blocks, rng))
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    table.insert(0, 'run', run)
+    return table
+
+
+### Bootstrap intervals for every ion of many runs, runs in worker processes ###
+def bootstrap_runs(runs, processes=None, seed=None, **options):
+    #     options: sigma, uncertainty_control, single_photon_control, afterpulse_control, n_boot, cl, blocks, cache
+    # Every run gets its own random stream spawned from seed, results do not depend on the process count.
+    seeds = np.random.SeedSequence(seed).spawn(len(runs))
+    work = partial(_bootstrap_item, options=options)
+    tables = rate_functions.map_runs(work, list(zip(runs, seeds)), processes)
+    table = pd.concat(tables, ignore_index=True)
+    catalog = run_catalog.table([r for r in table['run'].unique() if r in run_catalog.RUNS]) if len(table) else None
+    if catalog is not None and len(catalog):
+        table = table.merge(catalog, on='run', how='left')
+    return table
+
+
+def _bootstrap_item(item, options):
+    run, seed = item
+    return bootstrap_run(run, seed=seed, **options)
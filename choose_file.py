@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+import matplotlib as mpl
 import matplotlib.pyplot as plt
 import Ion_functions
 from Ion_functions import Ion
@@ -1787,7 +1788,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x1-R1} <= x <= {x1+R1} and {y1-2*R1} <= y <= {y1+2*R1}")#circular ROI
+        .query(f"{x1-R1} <= x <= {x1+R1} and {y1-2*R1} <= y <= {y1+2*R1}{tot_cut()}")#circular ROI
         .reset_index(drop=True)
     )
     
@@ -1810,7 +1811,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x2-R2} <= x <= {x2+R2} and {y2-2*R2} <= y <= {y2+2*R2}")
+        .query(f"{x2-R2} <= x <= {x2+R2} and {y2-2*R2} <= y <= {y2+2*R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -1829,7 +1830,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_3 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x3-R3} <= x <= {x3+R3} and {y3-2*R3} <= y <= {y3+2*R3}")
+        .query(f"{x3-R3} <= x <= {x3+R3} and {y3-2*R3} <= y <= {y3+2*R3}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_3
@@ -1848,7 +1849,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_4 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x4-R4} <= x <= {x4+R4} and {y4-2*R4} <= y <= {y4+2*R4}")
+        .query(f"{x4-R4} <= x <= {x4+R4} and {y4-2*R4} <= y <= {y4+2*R4}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_4
@@ -1867,7 +1868,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_5 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x5-R5} <= x <= {x5+R5} and {y5-2*R5} <= y <= {y5+2*R5}")
+        .query(f"{x5-R5} <= x <= {x5+R5} and {y5-2*R5} <= y <= {y5+2*R5}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_5
@@ -1886,7 +1887,7 @@ def Six_squeezed(afterpulse_control = True):
     Ion_6 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x6-R6} <= x <= {x6+R6} and {y6-2*R6} <= y <= {y6+2*R6}")
+        .query(f"{x6-R6} <= x <= {x6+R6} and {y6-2*R6} <= y <= {y6+2*R6}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_6
@@ -1946,9 +1947,7 @@ def Six_squeezed(afterpulse_control = True):
     
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
     #This last part prints the ROI for each ion so that you can verify the code is correct.   
     
@@ -1982,7 +1981,7 @@ def Five(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}") #circular ROI
+        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}{tot_cut()}") #circular ROI
         
         .reset_index(drop=True)
     )
@@ -2006,7 +2005,7 @@ def Five(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}")
+        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -2025,7 +2024,7 @@ def Five(afterpulse_control = True):
     Ion_3 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}")
+        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_3
@@ -2044,7 +2043,7 @@ def Five(afterpulse_control = True):
     Ion_4 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x4})**2 + (y-{y4})**2)**(1/2) <= {R4}")
+        .query(f"((x-{x4})**2 + (y-{y4})**2)**(1/2) <= {R4}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_4
@@ -2063,7 +2062,7 @@ def Five(afterpulse_control = True):
     Ion_5 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x5})**2 + (y-{y5})**2)**(1/2) <= {R5}") #circular ROI
+        .query(f"((x-{x5})**2 + (y-{y5})**2)**(1/2) <= {R5}{tot_cut()}") #circular ROI
         
         .reset_index(drop=True)
     )
@@ -2123,9 +2122,7 @@ def Five(afterpulse_control = True):
     #ion_4.setup(sigma, uncertainty, single_photon)
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
     
     #This last part prints the ROI for each ion so that you can verify the code is correct.   
@@ -2159,7 +2156,7 @@ def Four(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}") #circular ROI
+        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}{tot_cut()}") #circular ROI
         
         .reset_index(drop=True)
     )
@@ -2183,7 +2180,7 @@ def Four(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}")
+        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -2202,7 +2199,7 @@ def Four(afterpulse_control = True):
     Ion_3 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}")
+        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_3
@@ -2221,7 +2218,7 @@ def Four(afterpulse_control = True):
     Ion_4 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x4})**2 + (y-{y4})**2)**(1/2) <= {R4}")
+        .query(f"((x-{x4})**2 + (y-{y4})**2)**(1/2) <= {R4}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_4
@@ -2276,9 +2273,7 @@ def Four(afterpulse_control = True):
     #ion_4.setup(sigma, uncertainty, single_photon)
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
     
     #This last part prints the ROI for each ion so that you can verify the code is correct.   
@@ -2311,7 +2306,7 @@ def Three(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}")
+        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_1
@@ -2330,7 +2325,7 @@ def Three(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}")
+        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -2349,7 +2344,7 @@ def Three(afterpulse_control = True):
     Ion_3 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}")
+        .query(f"((x-{x3})**2 + (y-{y3})**2)**(1/2) <= {R3}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_3
@@ -2396,9 +2391,7 @@ def Three(afterpulse_control = True):
     #ion_3.setup(sigma, uncertainty, single_photon)
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
     
     
@@ -2430,7 +2423,7 @@ def Two(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}")
+        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_1
@@ -2449,7 +2442,7 @@ def Two(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}")
+        .query(f"((x-{x2})**2 + (y-{y2})**2)**(1/2) <= {R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -2496,15 +2489,13 @@ def Two(afterpulse_control = True):
     #ion_2.setup(sigma, uncertainty, single_photon)
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
 
 #__________________________________________________________________________________________________________
 #__________________________________________________________________________________________________________
 
-def One():
+def One(afterpulse_control = True):
     
     global old_data_table 
 
@@ -2529,7 +2520,7 @@ def One():
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}")
+        .query(f"((x-{x1})**2 + (y-{y1})**2)**(1/2) <= {R1}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_1
@@ -2574,9 +2565,7 @@ def One():
     #ion_1.setup(sigma, uncertainty, single_photon)
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
-    
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
     
 #_____________________________________________________________________________________________________________________________
@@ -2611,7 +2600,7 @@ def Nine(afterpulse_control = True):
     Ion_1 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x1-R1} <= x <= {x1+R1} and {y1-2*R1} <= y <= {y1+2*R1}")#circular ROI
+        .query(f"{x1-R1} <= x <= {x1+R1} and {y1-2*R1} <= y <= {y1+2*R1}{tot_cut()}")#circular ROI
         .reset_index(drop=True)
     )
     
@@ -2634,7 +2623,7 @@ def Nine(afterpulse_control = True):
     Ion_2 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x2-R2} <= x <= {x2+R2} and {y2-2*R2} <= y <= {y2+2*R2}")
+        .query(f"{x2-R2} <= x <= {x2+R2} and {y2-2*R2} <= y <= {y2+2*R2}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_2
@@ -2653,7 +2642,7 @@ def Nine(afterpulse_control = True):
     Ion_3 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x3-R3} <= x <= {x3+R3} and {y3-2*R3} <= y <= {y3+2*R3}")
+        .query(f"{x3-R3} <= x <= {x3+R3} and {y3-2*R3} <= y <= {y3+2*R3}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_3
@@ -2672,7 +2661,7 @@ def Nine(afterpulse_control = True):
     Ion_4 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x4-R4} <= x <= {x4+R4} and {y4-2*R4} <= y <= {y4+2*R4}")
+        .query(f"{x4-R4} <= x <= {x4+R4} and {y4-2*R4} <= y <= {y4+2*R4}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_4
@@ -2691,7 +2680,7 @@ def Nine(afterpulse_control = True):
     Ion_5 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x5-R5} <= x <= {x5+R5} and {y5-2*R5} <= y <= {y5+2*R5}")
+        .query(f"{x5-R5} <= x <= {x5+R5} and {y5-2*R5} <= y <= {y5+2*R5}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_5
@@ -2710,7 +2699,7 @@ def Nine(afterpulse_control = True):
     Ion_6 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x6-R6} <= x <= {x6+R6} and {y6-2*R6} <= y <= {y6+2*R6}")
+        .query(f"{x6-R6} <= x <= {x6+R6} and {y6-2*R6} <= y <= {y6+2*R6}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_6
@@ -2730,7 +2719,7 @@ def Nine(afterpulse_control = True):
     Ion_7 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x7-R7} <= x <= {x7+R7} and {y7-2*R7} <= y <= {y7+2*R7}")
+        .query(f"{x7-R7} <= x <= {x7+R7} and {y7-2*R7} <= y <= {y7+2*R7}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_7
@@ -2750,7 +2739,7 @@ def Nine(afterpulse_control = True):
     Ion_8 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x8-R8} <= x <= {x8+R8} and {y8-2*R8} <= y <= {y8+2*R8}")
+        .query(f"{x8-R8} <= x <= {x8+R8} and {y8-2*R8} <= y <= {y8+2*R8}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_8
@@ -2770,7 +2759,7 @@ def Nine(afterpulse_control = True):
     Ion_9 = (
         old_data_table
         #.query("`cluster size` > 3")
-        .query(f"{x9-R9} <= x <= {x9+R9} and {y9-2*R9} <= y <= {y9+2*R9}")
+        .query(f"{x9-R9} <= x <= {x9+R9} and {y9-2*R9} <= y <= {y9+2*R9}{tot_cut()}")
         .reset_index(drop=True)
     )
     name = Ion_9
@@ -2825,8 +2814,121 @@ def Nine(afterpulse_control = True):
     
     
     fig, (ax1, ax2) = plt.subplots(ncols = 2, figsize = (10, 4))
-    ax1.hist2d(old_data_table['x'], old_data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    show_images(ax1, ax2)
     
-    ax2.hist2d(data_table['x'], data_table['y'], range = [(min(data_table['x'])-2, max(data_table['x'])+2), (min(data_table['y'])-2, max(data_table['y'])+2)], bins = (int(max(data_table['x']) - min(data_table['x']) +5) , int(max(data_table['y']) - min(data_table['y']) +5)))
+    #This last part prints the ROI for each ion so that you can verify the code is correct.       
     
-    #This last part prints the ROI for each ion so that you can verify the code is correct.   
\ No newline at end of file
+#__________________________________________________________________________________________________________
+#__________________________________________________________________________________________________________
+
+# Column names written by the TimePix software and the names used throughout the analysis
+# (same renaming as in the Jumps_Data_Pandas conversion notebooks)
+RAW_COLUMNS = {'#Col': 'y', '#Row': 'x', '#ToA': 'time', '#ToT[arb]': 'center flux', '#Centroid': 'cluster size'}
+TOA_UNIT = 1e-11 # seconds per ToA count, the loaders above multiply 'time' by this
+TOT_RANGE = None # (low, high) 'center flux' cut applied inside the ROI queries of the loaders, None keeps every event
+
+
+def tot_cut(tot_range = None):
+    # extra condition for the ROI query strings, so the ToT cut is part of the same query
+    tot_range = TOT_RANGE if tot_range is None else tot_range
+    if tot_range is None:
+        return ''
+    return f' and {tot_range[0]} <= `center flux` < {tot_range[1]}'
+
+
+def rename_raw(table):
+    # Renames raw TimePix columns and drops the empty column left by the trailing comma
+    table = table.rename(columns = RAW_COLUMNS)
+    return table.drop(columns = [c for c in table.columns if str(c).startswith('Unnamed')])
+
+
+def assign_roi(table, centers, R, shape = 'circle', tot_range = None):
+    # Vectorized version of the ROI queries in the loaders. Adds an 'ion' column with the number
+    # of the ion (1, 2, ...) whose ROI contains the event and 0 for events outside every ROI.
+    #     centers: list of (x, y) ion positions, in the order of the ion numbers
+    #     shape: 'circle' for ((x-x0)**2 + (y-y0)**2)**(1/2) <= R (One ... Five)
+    #            'box' for x0-R <= x <= x0+R and y0-2R <= y <= y0+2R (Six_squeezed, Nine)
+    #     tot_range: (low, high) 'center flux' cut, events outside it get ion 0
+    # Where ROIs overlap the event goes to the nearest ion.
+    x = table['x'].to_numpy()[:, None]
+    y = table['y'].to_numpy()[:, None]
+    cx = np.array([c[0] for c in centers])[None, :]
+    cy = np.array([c[1] for c in centers])[None, :]
+    dist = ((x - cx)**2 + (y - cy)**2)**(1/2)
+    if shape == 'circle':
+        inside = dist <= R
+    else:
+        inside = (np.abs(x - cx) <= R) & (np.abs(y - cy) <= 2*R)
+    if tot_range is not None:
+        tot = table['center flux'].to_numpy()[:, None]
+        inside &= (tot >= tot_range[0]) & (tot < tot_range[1])
+    nearest = np.where(inside, dist, np.inf).argmin(axis = 1)
+    table['ion'] = np.where(inside.any(axis = 1), nearest + 1, 0)
+    return table
+
+
+#____________________________________________________________________________________________________________________
+##### PIXEL IMAGES #####
+# Events per pixel of a data file, computed once with bincount and kept next to the file as
+# {filename}.pixels.npz (with the summed ToT per pixel). The loaders draw their verification plots
+# from it with imshow instead of running hist2d over every raw event.
+
+SENSOR = (256, 256)
+_pixel_images = {}
+
+
+def pixel_image(table, weights = None, shape = SENSOR):
+    # events (or the sum of weights) per pixel as image[x, y]
+    x = table['x'].to_numpy().astype(np.int64)
+    y = table['y'].to_numpy().astype(np.int64)
+    nx = max(shape[0], int(x.max()) + 1 if len(x) else 0)
+    ny = max(shape[1], int(y.max()) + 1 if len(y) else 0)
+    return np.bincount(x*ny + y, weights = weights, minlength = nx*ny).reshape(nx, ny)
+
+
+def load_pixel_images(name, table = None):
+    # {'counts', 'tot'} images of the data file name, from the sidecar if it is up to date
+    import os
+    stat = os.stat(name)
+    source = np.array([stat.st_size, stat.st_mtime_ns])
+    key = (name, stat.st_size, stat.st_mtime_ns)
+    if key in _pixel_images:
+        return _pixel_images[key]
+
+    path = f'{name}.pixels.npz'
+    images = None
+    try:
+        with np.load(path) as f:
+            if np.array_equal(f['source'], source):
+                images = {'counts': f['counts'], 'tot': f['tot']}
+    except (OSError, KeyError, ValueError):
+        pass
+    if images is None:
+        if table is None:
+            table = pd.read_csv(name)
+        images = {'counts': pixel_image(table).astype(np.uint32)}
+        tot = table['center flux'].to_numpy(dtype = float) if 'center flux' in table else np.zeros(len(table))
+        images['tot'] = pixel_image(table, tot, images['counts'].shape)
+        try:
+            np.savez_compressed(path, source = source, **images)
+        except OSError:
+            pass   # read-only data directory, keep the images in memory only
+    _pixel_images[key] = images
+    return images
+
+
+def draw_pixels(ax, image, xrange, yrange, log = False):
+    # image[x, y] between the pixel ranges (inclusive) drawn with imshow, x horizontal as in hist2d
+    x0, x1 = max(int(xrange[0]), 0), min(int(xrange[1]), image.shape[0] - 1)
+    y0, y1 = max(int(yrange[0]), 0), min(int(yrange[1]), image.shape[1] - 1)
+    return ax.imshow(image[x0:x1+1, y0:y1+1].T, origin = 'lower', extent = (x0-.5, x1+.5, y0-.5, y1+.5),
+                     aspect = 'auto', interpolation = 'nearest', norm = mpl.colors.LogNorm() if log else None)
+
+
+def show_images(ax1, ax2):
+    # verification plots of the loaders: every event of the file and the events kept in the ROIs
+    images = load_pixel_images(filename, old_data_table)
+    xrange = (min(data_table['x'])-2, max(data_table['x'])+2)
+    yrange = (min(data_table['y'])-2, max(data_table['y'])+2)
+    draw_pixels(ax1, images['counts'], xrange, yrange)
+    draw_pixels(ax2, pixel_image(data_table), xrange, yrange)
@@ -0,0 +1,388 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from functools import partial
+from itertools import combinations
+
+import run_catalog
+import rate_functions
+
+### Cross-ion jump coincidences ###
+# Looks for collective (superradiant) behaviour by correlating the quantum jumps of different ions
+# of a chain. Jump times of every ion are sorted arrays (run_jumps results or setup() ions), every
+# count is done with searchsorted on those arrays instead of loops over transpts, so a run costs
+# O(n log n) in the number of jumps (plus the number of pairs found inside the window).
+# Observed counts are compared to the accidental coincidences expected from independent ions with
+# the same jump rates.
+
+
+def jump_times(source, kind='BtD'):
+    # {ion number: sorted jump times (s)} from a run_jumps result or a list of setup() ions
+    if isinstance(source, dict):
+        entries = [(ion['ion'], ion['BtD'], ion['DtB']) for ion in source['ions']]
+    else:
+        entries = []
+        for ion in source:
+            if type(ion.color) == int:
+                continue
+            time = ion.data['time'].to_numpy()
+            entries.append((ion.n, time[np.asarray(ion.BtD, dtype=int)], time[np.asarray(ion.DtB, dtype=int)]))
+    times = {}
+    for n, BtD, DtB in entries:
+        chosen = {'BtD': BtD, 'DtB': DtB, 'total': np.concatenate((BtD, DtB))}[kind]
+        times[n] = np.sort(np.asarray(chosen, dtype=float))
+    return times
+
+
+def pair_offsets(a, b, window):
+    # every offset b[j] - a[i] with |offset| <= window, a and b sorted
+    lo = np.searchsorted(b, a - window, side='left')
+    hi = np.searchsorted(b, a + window, side='right')
+    counts = hi - lo
+    first = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    j = first + np.arange(counts.sum())
+    return b[j] - np.repeat(a, counts)
+
+
+### Histogram of jump-time offsets of every ion pair with the accidental expectation ###
+def coincidence_histogram(times, window=1e-3, bin_width=1e-5, duration=None):
+    #     times: {ion: sorted jump times}
+    #     window: largest offset |t_j - t_i| (s) that is histogrammed
+    #     duration: live time of the run (s), defaults to the span of all jumps
+    # Returns the bin edges, {(i, j): counts} and {(i, j): accidental counts per bin}. For independent
+    # Poisson jumping ions the expected number of pairs in a bin is n_i * n_j * bin_width / duration.
+    if duration is None:
+        every = np.concatenate([t for t in times.values() if len(t)]) if times else np.array([0.0])
+        duration = every.max() - every.min() if len(every) else 0
+    nbins = int(round(window / bin_width))
+    edges = bin_width * np.arange(-nbins, nbins + 1)
+    counts, accidental = {}, {}
+    for i, j in combinations(sorted(times), 2):
+        counts[(i, j)] = np.histogram(pair_offsets(times[i], times[j], window), edges)[0]
+        accidental[(i, j)] = len(times[i]) * len(times[j]) * bin_width / duration if duration > 0 else np.nan
+    return edges, counts, accidental
+
+
+def multiplicity(times, window):
+    # Number of distinct ions with a jump in [t, t + window] for every jump t of the merged run
+    # (the jumping ion included), plus the ion of every jump. All ions are merged into one sorted
+    # array, a prefix count per ion gives the distinct ions of every window in O(n * ions).
+    ions = sorted(times)
+    merged = np.concatenate([times[i] for i in ions])
+    labels = np.concatenate([np.full(len(times[i]), k) for k, i in enumerate(ions)])
+    order = np.argsort(merged, kind='stable')
+    merged, labels = merged[order], labels[order]
+    prefix = np.zeros((len(merged) + 1, len(ions)), dtype=np.int32)
+    prefix[1:][np.arange(len(merged)), labels] = 1
+    np.cumsum(prefix, axis=0, out=prefix)
+    end = np.searchsorted(merged, merged + window, side='right')
+    distinct = np.count_nonzero(prefix[end] - prefix[np.arange(len(merged))], axis=1)
+    return distinct, np.asarray(ions)[labels]
+
+
+def _at_least(probabilities, k):
+    # P(at least k of independent events with the given probabilities happen), Poisson-binomial
+    dist = np.zeros(len(probabilities) + 1)
+    dist[0] = 1
+    for p in probabilities:
+        dist[1:] = dist[1:] * (1 - p) + dist[:-1] * p
+        dist[0] *= 1 - p
+    return dist[k:].sum() if k >= 0 else 1.0
+
+
+### k-ion coincidences against the window width ###
+def k_fold(times, windows, k=2, duration=None):
+    # For every window width: number of jumps followed within the window by jumps of at least k-1
+    # other ions (observed), and the number expected from independent Poisson ions (accidental).
+    if duration is None:
+        every = np.concatenate([t for t in times.values() if len(t)])
+        duration = every.max() - every.min()
+    ions = sorted(times)
+    rates = np.array([len(times[i]) / duration for i in ions])
+    rows = []
+    for w in np.atleast_1d(windows):
+        distinct, _ = multiplicity(times, w)
+        p = 1 - np.exp(-rates * w)
+        expected = sum(len(times[i]) * _at_least(np.delete(p, n), k - 1) for n, i in enumerate(ions))
+        observed = int(np.count_nonzero(distinct >= k))
+        rows.append({'window': w, 'k': k, 'observed': observed, 'accidental': expected,
+                     'excess': observed - expected, 'ratio': observed / expected if expected > 0 else np.nan})
+    return pd.DataFrame(rows)
+
+
+def plot_coincidences(edges, counts, accidental, title=''):
+    centers = (edges[:-1] + edges[1:]) / 2
+    total = sum(counts.values())
+    fig, ax = plt.subplots(1, figsize = (6, 4))
+    ax.step(centers * 1e3, total, where='mid', label='All ion pairs')
+    ax.axhline(sum(accidental.values()), color='r', linestyle='--', label='Accidental')
+    ax.set_xlabel('Jump time offset (ms)')
+    ax.set_ylabel('Coincidences per bin')
+    ax.set_title(title)
+    ax.legend()
+    plt.show()
+
+
+#___________________________________________________________________________________________________________
+##### BATCH #####
+
+
+def chain_runs():
+    # the Jumps_Six, Jumps_Four and 9 ion runs
+    return [run for run in run_catalog.RUNS if run.startswith(('Jumps_Six', 'Jumps_Four', 'Jumps_9'))]
+
+
+def _run_coincidences(result, kind, window, bin_width, windows, k):
+    times = jump_times(result, kind)
+    duration = result['end'] - result['start']
+    edges, counts, accidental = coincidence_histogram(times, window, bin_width, duration)
+    rows = []
+    for (i, j), c in counts.items():
+        rows.append({'run': result['run'], 'ion_a': i, 'ion_b': j, 'n_a': len(times[i]), 'n_b': len(times[j]),
+                     'coincidences': int(c.sum()), 'accidental': accidental[(i, j)] * len(c)})
+    folds = pd.concat([k_fold(times, windows, m, duration).assign(run=result['run']) for m in range(2, k + 1)]) if len(times) >= 2 else None
+    return pd.DataFrame(rows), folds
+
+
+### Pair and k-fold coincidences for many runs, analysed in parallel ###
+def coincidence_batch(runs=None, kind='BtD', window=1e-3, bin_width=1e-5, windows=(1e-4, 1e-3, 1e-2), k=3,
+                      processes=None, **jump_options):
+    #     jump_options: passed to rate_functions.run_jumps (sigma, cache, ...)
+    runs = chain_runs() if runs is None else runs
+    results = rate_functions.map_runs(partial(rate_functions.run_jumps, **jump_options), list(runs), processes)
+    pairs, folds = zip(*[_run_coincidences(r, kind, window, bin_width, windows, k) for r in results])
+    pairs = pd.concat(pairs, ignore_index=True)
+    pairs['excess'] = pairs['coincidences'] - pairs['accidental']
+    folds = pd.concat([f for f in folds if f is not None], ignore_index=True) if any(f is not None for f in folds) else None
+    return pairs, folds
+
+
+#___________________________________________________________________________________________________________
+##### PHOTON CORRELATIONS (g2) #####
+# g2(tau) between the photon arrival times of two ROIs (cross) or within one ROI (auto, b=None).
+# Short lags are counted exactly: the number of pairs with t_b - t_a below a lag is a sum of
+# searchsorted positions, so every lag edge costs one O(n log n) pass and no difference arrays are
+# built. Long lags use counts binned at width w0 = duration / max_bins, correlated either with the
+# multi-tau scheme (lags m/2..m-1 bins per level, bins doubled between levels) or with one FFT.
+# The two meet at tau = m/2 * w0, below which binning would blur the lag.
+
+
+def photon_times(ion):
+    return np.sort(ion.data['time'].to_numpy(dtype=float))
+
+
+def _pair_g2(a, b, edges, duration, auto):
+    # exact pair counts with lag t_b - t_a in [edges[k], edges[k+1])
+    below = np.array([np.searchsorted(b, a + tau, side='left').sum() for tau in edges], dtype=float)
+    pairs = np.diff(below)
+    width = np.diff(edges)
+    norm = len(a) * (len(a) - 1 if auto else len(b)) * width / duration
+    return pairs, pairs / norm
+
+
+def _binned(t, t0, w0, nbins):
+    index = ((t - t0) / w0).astype(np.int64)
+    return np.bincount(index[index < nbins], minlength=nbins).astype(float)
+
+
+def _multitau(ca, cb, w0, m, tau_max):
+    lags, values, weights = [], [], []
+    w, level = w0, 0
+    while len(ca) > m and w * (m // 2) <= tau_max:
+        for j in range(1 if level == 0 else m // 2, m):
+            if j * w > tau_max or j >= len(ca):
+                break
+            overlap = len(ca) - j
+            ma, mb = ca[:overlap].mean(), cb[j:].mean()
+            lags.append(j * w)
+            values.append(np.dot(ca[:overlap], cb[j:]) / overlap / (ma * mb) if ma > 0 and mb > 0 else np.nan)
+            weights.append(overlap)
+        ca = ca[:len(ca) // 2 * 2].reshape(-1, 2).sum(axis=1)
+        cb = cb[:len(cb) // 2 * 2].reshape(-1, 2).sum(axis=1)
+        w, level = 2 * w, level + 1
+    return np.array(lags), np.array(values)
+
+
+def _fft_g2(ca, cb, w0, edges):
+    n = len(ca)
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    corr = np.fft.irfft(np.conj(np.fft.rfft(ca, size)) * np.fft.rfft(cb, size), size)[:n]
+    j = np.arange(n)
+    overlap = n - j
+    g = corr / overlap / (ca.mean() * cb.mean())
+    which = np.digitize(j * w0, edges) - 1
+    keep = (which >= 0) & (which < len(edges) - 1) & (j > 0)
+    total = np.bincount(which[keep], weights=(g * overlap)[keep], minlength=len(edges) - 1)
+    weight = np.bincount(which[keep], weights=overlap[keep], minlength=len(edges) - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(edges[:-1] * edges[1:]), total / weight
+
+
+### g2 of photon times a and b (b after a) from tau_min to tau_max, b=None for the autocorrelation ###
+def g2(a, b=None, tau_min=1e-9, tau_max=1.0, points_per_decade=10, method='multitau', m=16, max_bins=2**22,
+       duration=None):
+    # a, b: sorted photon times (s). For negative lags of a cross-correlation call g2(b, a).
+    # Returns a DataFrame with tau, g2, its Poisson error (pair counts only) and the method used.
+    auto = b is None
+    b = a if auto else b
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    t0 = min(a[0], b[0])
+    duration = max(a[-1], b[-1]) - t0 if duration is None else duration
+    w0 = duration / max_bins
+    switch = min(max(w0 * (m // 2), tau_min), tau_max)
+
+    decades = np.log10(switch / tau_min)
+    edges = np.logspace(np.log10(tau_min), np.log10(switch), max(int(np.ceil(decades * points_per_decade)), 1) + 1)
+    pairs, values = _pair_g2(a, b, edges, duration, auto)
+    short = pd.DataFrame({'tau': np.sqrt(edges[:-1] * edges[1:]), 'g2': values,
+                          'g2_err': values / np.sqrt(np.maximum(pairs, 1)), 'pairs': pairs, 'method': 'pairs'})
+    if switch >= tau_max:
+        return short
+
+    nbins = int(np.ceil(duration / w0)) + 1
+    ca = _binned(a, t0, w0, nbins)
+    cb = ca if auto else _binned(b, t0, w0, nbins)
+    if method == 'fft':
+        long_edges = np.logspace(np.log10(switch), np.log10(tau_max),
+                                 max(int(np.ceil(np.log10(tau_max / switch) * points_per_decade)), 1) + 1)
+        lags, values = _fft_g2(ca, cb, w0, long_edges)
+    else:
+        lags, values = _multitau(ca, cb, w0, m, tau_max)
+        keep = lags >= switch
+        lags, values = lags[keep], values[keep]
+    binned = pd.DataFrame({'tau': lags, 'g2': values, 'g2_err': np.nan, 'pairs': np.nan, 'method': method})
+    return pd.concat([short, binned], ignore_index=True)
+
+
+### g2 of every ion with itself and with every other ion of a run ###
+def g2_ions(ions, **options):
+    # ions: setup() or just loaded Ion objects, options as in g2()
+    ions = [ion for ion in ions if type(ion.color) != int]
+    times = {ion.n: photon_times(ion) for ion in ions}
+    start = min(t[0] for t in times.values())
+    end = max(t[-1] for t in times.values())
+    options.setdefault('duration', end - start)
+    tables = []
+    for i in times:
+        for j in times:
+            if j < i:
+                continue
+            table = g2(times[i], None if i == j else times[j], **options)
+            tables.append(table.assign(ion_a=i, ion_b=j))
+    return pd.concat(tables, ignore_index=True)
+
+
+#___________________________________________________________________________________________________________
+##### JOINT STATE #####
+# The bright/dark state of every ion of a run on one time grid. Each time bin is one unsigned integer
+# whose bit k is set while ion k is dark, so a 9 ion run needs 2 bytes per bin (an hour at 1 ms is
+# 7 MB). Counting dark ions is a popcount of the bins, the joint-state occupancy a bincount of them.
+
+
+def segments_from_jumps(BtD, DtB, start, end):
+    # segment table (as Ion.segment_table) from the jump times of a run_jumps result
+    times = np.concatenate((np.asarray(DtB, dtype=float), np.asarray(BtD, dtype=float)))
+    bright = np.concatenate((np.ones(len(DtB), dtype=bool), np.zeros(len(BtD), dtype=bool)))
+    order = np.argsort(times, kind='stable')
+    times, bright = times[order], bright[order]
+    first = (-1 if bright[0] else 1) if len(times) else 1
+    table = pd.DataFrame({'start': np.concatenate(([start], times)), 'end': np.concatenate((times, [end])),
+                          'state': np.concatenate(([first], np.where(bright, 1, -1)))})
+    table['duration'] = table['end'] - table['start']
+    return table[table['duration'] > 0].reset_index(drop=True)[['start', 'end', 'duration', 'state']]
+
+
+def popcount(bits):
+    # number of set bits of every element of an unsigned integer array
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    as_bytes = np.ascontiguousarray(bits).view(np.uint8).reshape(bits.shape + (bits.dtype.itemsize,))
+    return table[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+class JointState:
+    def __init__(self, segments, bin_width=1e-3, start=None, end=None):
+        #     segments: {ion number: segment table} (Ion.segment_table() or segments_from_jumps())
+        #     bin_width: grid spacing (s), the state of a bin is the state at its centre
+        self.ions = sorted(segments)
+        if len(self.ions) > 64:
+            raise ValueError('JointState holds at most 64 ions')
+        self.start = min(s['start'].iloc[0] for s in segments.values()) if start is None else start
+        self.end = max(s['end'].iloc[-1] for s in segments.values()) if end is None else end
+        self.bin_width = bin_width
+        nbins = int(np.ceil((self.end - self.start) / bin_width))
+        self.dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= len(self.ions))
+        self.bits = np.zeros(nbins, dtype=self.dtype)
+        self.covered = np.ones(nbins, dtype=bool)
+
+        centers = self.start + (np.arange(nbins) + 0.5) * bin_width
+        for k, n in enumerate(self.ions):
+            table = segments[n]
+            which = np.searchsorted(table['start'].to_numpy(), centers, side='right') - 1
+            inside = (which >= 0) & (centers < table['end'].to_numpy()[np.clip(which, 0, None)])
+            dark = inside & (table['state'].to_numpy()[np.clip(which, 0, None)] == -1)
+            self.bits |= dark.astype(self.dtype) << self.dtype(k)
+            self.covered &= inside
+
+
+    @classmethod
+    def from_ions(cls, ions, bin_width=1e-3):
+        # from setup() ions of one loaded run
+        return cls({ion.n: ion.segment_table() for ion in ions if type(ion.color) != int}, bin_width)
+
+
+    @classmethod
+    def from_result(cls, result, bin_width=1e-3):
+        # from a rate_functions.run_jumps result
+        segments = {ion['ion']: segments_from_jumps(ion['BtD'], ion['DtB'], result['start'], result['end'])
+                    for ion in result['ions']}
+        return cls(segments, bin_width, result['start'], result['end'])
+
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+
+    def _bins(self, t):
+        return np.clip(((np.asarray(t, dtype=float) - self.start) / self.bin_width).astype(np.int64), 0, len(self.bits) - 1)
+
+
+    def dark(self, ion, t=None):
+        # dark (True) / bright of one ion in every bin, or at times t
+        bits = self.bits if t is None else self.bits[self._bins(t)]
+        return (bits >> self.dtype(self.ions.index(ion))) & 1 == 1
+
+
+    def dark_count(self, t=None):
+        # number of dark ions in every bin, or at times t
+        return popcount(self.bits if t is None else self.bits[self._bins(t)])
+
+
+    def dark_count_histogram(self):
+        # fraction of the time with 0, 1, ..., n ions dark
+        counts = np.bincount(self.dark_count()[self.covered], minlength=len(self.ions) + 1)
+        return pd.Series(counts / max(counts.sum(), 1), name='fraction').rename_axis('dark ions')
+
+
+    def occupancy(self, min_fraction=0):
+        # Fraction of the time spent in every joint state. States are written left to right in ion
+        # order, 'B' bright and 'D' dark. The expectation for independent ions is added for comparison.
+        masks = self.bits[self.covered].astype(np.int64)
+        if len(self.ions) <= 20:
+            counts = np.bincount(masks, minlength=1 << len(self.ions))
+            states = np.flatnonzero(counts)
+            counts = counts[states]
+        else:
+            states, counts = np.unique(masks, return_counts=True)
+        fraction = counts / max(counts.sum(), 1)
+        p_dark = np.array([np.mean((masks >> k) & 1) for k in range(len(self.ions))])
+        bits = (states[:, None] >> np.arange(len(self.ions))[None, :]) & 1
+        independent = np.prod(np.where(bits == 1, p_dark, 1 - p_dark), axis=1)
+        table = pd.DataFrame({
+            'state': [''.join('D' if b else 'B' for b in row) for row in bits],
+            'dark ions': bits.sum(axis=1), 'fraction': fraction, 'independent': independent,
+        })
+        table = table[table['fraction'] >= min_fraction]
+        return table.sort_values('fraction', ascending=False).reset_index(drop=True)
@@ -0,0 +1,136 @@
+import json
+import numpy as np
+import pandas as pd
+from functools import partial
+
+import run_catalog
+import rate_functions
+from Ion_functions import StreamHistogram
+
+### Dataset-wide dt, ToT and radius distributions in one pass ###
+# EventHistograms holds one StreamHistogram per ion and quantity. Registered runs (run_catalog entries
+# with ROI 'centers') are read in chunks straight from their event file, every chunk is assigned to
+# the ions with choose_file.assign_roi and added to the histograms, so no full DataFrame is built.
+# Runs with a choose_file loader are added from the loaded ions. Histograms of different runs and
+# worker processes are merged, and the whole set is saved as JSON.
+
+# default binning: dt as in auto_threshold (log spaced to reach the dark times), ToT as in flux_histogram
+BINNING = {
+    'dt': dict(low=1e-7, high=10, bins=200, log=True),
+    'center flux': dict(low=0, high=5000, bins=100),
+    'radius': dict(low=0, high=5, bins=50),
+}
+
+
+class EventHistograms:
+    def __init__(self, binning=None):
+        self.binning = {q: dict(b) for q, b in (binning or BINNING).items()}
+        self.histograms = {}   # {(ion, quantity): StreamHistogram}
+        self.files = []
+
+    def histogram(self, ion, quantity):
+        if (ion, quantity) not in self.histograms:
+            self.histograms[(ion, quantity)] = StreamHistogram(name=quantity, **self.binning[quantity])
+        return self.histograms[(ion, quantity)]
+
+    def add_ions(self, ions):
+        for ion in ions:
+            for quantity in self.binning:
+                self.histogram(ion.n, quantity).add_ion(ion, quantity)
+        return self
+
+
+        ### Adds the events of one file, read chunk by chunk ###
+    def add_file(self, path, centers, R=2, shape='circle', chunksize=1_000_000, afterpulse_control=True, tot_range=None):
+        # dt is the time to the ion's next event as in the loaders; the last event of every ion in a
+        # chunk waits for the next chunk (pending) and the file's last event gets dt = 0.
+        # tot_range: (low, high) ToT cut applied by assign_roi
+        import choose_file
+        pending = {}   # ion: (time, row of the other quantities) of its newest event
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            if '#ToA' in chunk:
+                chunk = choose_file.rename_raw(chunk)
+            chunk['time'] = choose_file.TOA_UNIT * chunk['time']
+            chunk = choose_file.assign_roi(chunk, centers, R, shape, tot_range)
+            for n, events in chunk[chunk['ion'] > 0].groupby('ion'):
+                events = events.sort_values('time')
+                if n in pending:
+                    events = pd.concat([pending[n], events])
+                pending[n] = events.iloc[-1:]
+                self._add_events(n, events.iloc[:-1], np.diff(events['time'].to_numpy()), centers, afterpulse_control)
+        for n, events in pending.items():
+            self._add_events(n, events, np.zeros(1), centers, afterpulse_control)
+        self.files.append(path)
+        return self
+
+    def _add_events(self, n, events, dt, centers, afterpulse_control):
+        keep = dt > 1e-7 if afterpulse_control else np.ones(len(dt), dtype=bool)
+        x0, y0 = centers[n - 1]
+        values = {'dt': dt,
+                  'radius': ((events['x'].to_numpy() - x0)**2 + (events['y'].to_numpy() - y0)**2)**(1/2)}
+        for quantity in self.binning:
+            if quantity in values:
+                self.histogram(n, quantity).add(values[quantity][keep])
+            elif quantity in events:
+                self.histogram(n, quantity).add(events[quantity].to_numpy()[keep])
+
+    def merge(self, other):
+        for key, histogram in other.histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = StreamHistogram.from_dict(histogram.to_dict())
+        self.files += other.files
+        return self
+
+    def total(self, quantity):
+        # histogram of one quantity summed over all ions
+        histograms = [h for (ion, q), h in self.histograms.items() if q == quantity]
+        total = StreamHistogram(name=quantity, **self.binning[quantity])
+        for histogram in histograms:
+            total.merge(histogram)
+        return total
+
+    def to_dict(self):
+        return {'binning': self.binning, 'files': self.files,
+                'histograms': [dict(ion=int(ion), quantity=q, **h.to_dict()) for (ion, q), h in self.histograms.items()]}
+
+    @classmethod
+    def from_dict(cls, state):
+        histograms = cls(state['binning'])
+        histograms.files = list(state['files'])
+        for h in state['histograms']:
+            histograms.histograms[(h['ion'], h['quantity'])] = StreamHistogram.from_dict(h)
+        return histograms
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+### Histograms of one run, from its event file if the ROI centres are registered, else from its loader ###
+def run_histograms(run, binning=None, chunksize=1_000_000, afterpulse_control=True, tot_range=None):
+    histograms = EventHistograms(binning)
+    entry = run_catalog.RUNS.get(run, {})
+    if 'centers' in entry:
+        return histograms.add_file(entry['file'], entry['centers'], entry.get('R', 2), entry.get('shape', 'circle'),
+                                   chunksize, afterpulse_control, tot_range)
+    choose_file, ions = rate_functions.load_run(run, afterpulse_control, tot_range)
+    histograms.files.append(choose_file.filename)
+    return histograms.add_ions(ions)
+
+
+def dataset_histograms(runs, binning=None, processes=None, chunksize=1_000_000, afterpulse_control=True, tot_range=None):
+    # one pass over every run in worker processes, merged into one EventHistograms
+    work = partial(run_histograms, binning=binning, chunksize=chunksize, afterpulse_control=afterpulse_control,
+                   tot_range=tot_range)
+    results = rate_functions.map_runs(work, list(runs), processes)
+    histograms = EventHistograms(binning)
+    for result in results:
+        histograms.merge(result)
+    return histograms
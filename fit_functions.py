@@ -0,0 +1,129 @@
+import numpy as np
+
+from Ion_functions import JACOBIANS
+
+### Batched nonlinear least squares ###
+# curve_fit fits one curve per call. batch_fit runs Levenberg-Marquardt on many independent
+# datasets (ions x runs) at once: every iteration evaluates the model for all datasets in one
+# numpy call, builds all normal equations as stacked (datasets x params x params) arrays and
+# solves them together. Datasets converge independently and are frozen once they have.
+#
+# Any model written with numpy operations works (all of the EQUATIONS in Ion_functions). Inputs:
+#     x: (npoints,) shared by every dataset, or (ndatasets, npoints)
+#     y: (ndatasets, npoints). Ragged datasets can be padded with NaN, NaN points are ignored
+#     p0: (nparams,) shared starting point, or (ndatasets, nparams)
+#     sigma: uncertainties of y with the same shape (None for unweighted), as in curve_fit
+#     bounds: (lower, upper) per parameter, trial steps are projected into the box
+# Returns popt (ndatasets, nparams), pcov (ndatasets, nparams, nparams) and an info dict with
+# 'converged', 'n_iter', 'chi2' and 'dof' per dataset.
+
+
+def _evaluate(model, x, p):
+    # model(x, *params) for all datasets, params broadcast as (ndatasets, 1) columns
+    return model(x, *[p[:, k, None] for k in range(p.shape[1])])
+
+
+def numerical_jacobian(model, x, p, f=None):
+    # forward differences for all datasets at once, returns (ndatasets, npoints, nparams)
+    if f is None:
+        f = _evaluate(model, x, p)
+    f = np.broadcast_to(f, (p.shape[0], x.shape[-1]))
+    J = np.empty(f.shape + (p.shape[1],))
+    for k in range(p.shape[1]):
+        step = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(p[:, k]), 1)
+        shifted = p.copy()
+        shifted[:, k] += step
+        J[:, :, k] = (_evaluate(model, x, shifted) - f) / step[:, None]
+    return J
+
+
+def _solve(A, b):
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.einsum('mij,mj->mi', np.linalg.pinv(A), b)
+
+
+def batch_fit(model, x, y, p0, sigma=None, bounds=None, jac=None, absolute_sigma=False,
+              max_iter=200, xtol=1e-8, ftol=1e-10, lam=1e-3):
+    # jac: analytic jacobian jac(x, *params) -> (..., npoints, nparams). None uses the one registered for the
+    #      model in Ion_functions.JACOBIANS if there is one, False always uses forward differences
+    if jac is None:
+        jac = JACOBIANS.get(model)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    m, n = y.shape
+    x = np.broadcast_to(np.asarray(x, dtype=float), (m, n))
+    p = np.array(np.broadcast_to(np.asarray(p0, dtype=float), (m, np.shape(p0)[-1])))
+    npar = p.shape[1]
+
+    valid = np.isfinite(y) & np.isfinite(x)
+    w = np.ones((m, n)) if sigma is None else 1 / np.broadcast_to(np.asarray(sigma, dtype=float), (m, n))
+    w = np.where(valid & np.isfinite(w), w, 0)
+    x = np.where(valid, x, 0)
+    y = np.where(valid, y, 0)
+
+    if bounds is None:
+        lower, upper = np.full(npar, -np.inf), np.full(npar, np.inf)
+    else:
+        lower = np.broadcast_to(np.asarray(bounds[0], dtype=float), (npar,))
+        upper = np.broadcast_to(np.asarray(bounds[1], dtype=float), (npar,))
+    p = np.clip(p, lower, upper)
+
+    def residuals(xs, ys, ws, ps):
+        return (ys - _evaluate(model, xs, ps)) * ws
+
+    def jacobian(xs, ws, ps):
+        J = jac(xs, *[ps[:, k, None] for k in range(npar)]) if jac else numerical_jacobian(model, xs, ps)
+        return np.broadcast_to(J, xs.shape + (npar,)) * ws[..., None]
+
+    r = residuals(x, y, w, p)
+    cost = np.sum(r**2, axis=1)
+    damping = np.full(m, lam)
+    active = np.isfinite(cost)
+    converged = np.zeros(m, dtype=bool)
+    n_iter = np.zeros(m, dtype=int)
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        xs, ys, ws, ps = x[idx], y[idx], w[idx], p[idx]
+        J = jacobian(xs, ws, ps)
+        A = np.einsum('mni,mnj->mij', J, J)
+        g = np.einsum('mni,mn->mi', J, r[idx])
+        diag = np.einsum('mii->mi', A)
+        scaled = A + (damping[idx, None] * np.maximum(diag, 1e-12))[:, :, None] * np.eye(npar)
+        step = _solve(scaled, g)
+
+        trial = np.clip(ps + step, lower, upper)
+        r_trial = residuals(xs, ys, ws, trial)
+        cost_trial = np.sum(r_trial**2, axis=1)
+        better = np.isfinite(cost_trial) & (cost_trial <= cost[idx])
+
+        # accepted steps relax the damping, rejected ones increase it and leave the parameters
+        moved = np.abs(trial - ps)
+        small_step = np.all(moved <= xtol * (np.abs(ps) + xtol), axis=1)
+        small_cost = np.abs(cost[idx] - cost_trial) <= ftol * np.maximum(cost[idx], np.finfo(float).tiny)
+        n_iter[idx] += 1
+
+        acc = idx[better]
+        p[acc] = trial[better]
+        r[acc] = r_trial[better]
+        cost[acc] = cost_trial[better]
+        damping[acc] = np.maximum(damping[acc] / 10, 1e-12)
+        damping[idx[~better]] *= 10
+
+        done = (better & (small_step | small_cost)) | (damping[idx] > 1e12)
+        converged[idx[better & (small_step | small_cost)]] = True
+        converged[idx[~better & (damping[idx] > 1e12)]] = True   # no step lowers the cost: at a minimum
+        active[idx[done]] = False
+
+    # covariance as in curve_fit: inverse of J^T W J, scaled by the reduced chi2 unless absolute_sigma
+    J = jacobian(x, w, p)
+    A = np.einsum('mni,mnj->mij', J, J)
+    pcov = np.linalg.pinv(A)
+    dof = valid.sum(axis=1) - npar
+    if not absolute_sigma:
+        with np.errstate(divide='ignore'):
+            pcov *= np.where(dof > 0, cost / dof, np.inf)[:, None, None]
+    return p, pcov, {'converged': converged, 'n_iter': n_iter, 'chi2': cost, 'dof': dof}
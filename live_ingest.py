@@ -0,0 +1,225 @@
+import asyncio
+import glob
+import io
+import os
+import numpy as np
+import pandas as pd
+
+import choose_file
+from online_detector import OnlineJumpDetector
+
+### Live ingest of TimePix acquisition files ###
+# Watches an acquisition directory, tails every raw file that matches the pattern while it is
+# still being written, and feeds the new rows through choose_file.assign_roi into one
+# OnlineJumpDetector per file. Rows travel through a bounded asyncio.Queue, so a slow detector
+# stage makes the readers wait (back-pressure) instead of buffering the whole file in memory.
+#
+# Raw CSV files use the TimePix column names (choose_file.RAW_COLUMNS). Binary files are read as
+# fixed-size records of 'record_dtype', a numpy dtype with the fields x, y, time (raw ToA counts)
+# and optionally 'center flux' and 'cluster size'.
+
+BINARY_RECORD = np.dtype([('x', '<u2'), ('y', '<u2'), ('time', '<u8'), ('center flux', '<u2'), ('cluster size', '<u2')])
+
+
+class FileTail:
+    def __init__(self, path, record_dtype=None, holdback=1e-3):
+        self.path = path
+        self.record_dtype = None if record_dtype is None else np.dtype(record_dtype)
+        self.holdback = holdback   # (s) newest events are held back this long so late rows can be sorted in
+        self.offset = 0            # bytes already consumed
+        self.header = None
+        self.toa0 = None           # first ToA of the file, subtracted like in the conversion notebooks
+        self.pending = None
+        self.last_growth = None
+
+
+        ### Returns the complete rows appended since the last call, in time order (None if there are none) ###
+    def read_new(self):
+        size = os.path.getsize(self.path)
+        if size <= self.offset:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+
+        if self.record_dtype is not None:
+            usable = len(data) - len(data) % self.record_dtype.itemsize
+            self.offset += usable
+            table = pd.DataFrame(np.frombuffer(data[:usable], dtype=self.record_dtype))
+        else:
+            usable = data.rfind(b'\n') + 1   # a partly written last line waits for the next read
+            if usable == 0:
+                return None
+            self.offset += usable
+            data = data[:usable]
+            if self.header is None:
+                cut = data.find(b'\n') + 1
+                self.header, data = data[:cut], data[cut:]
+            table = choose_file.rename_raw(pd.read_csv(io.BytesIO(self.header + data)))
+        if len(table) == 0:
+            return None
+
+        toa = table['time'].to_numpy()
+        if self.toa0 is None:
+            self.toa0 = toa[0]
+        table['time'] = (toa.astype(np.int64) - np.int64(self.toa0)) * choose_file.TOA_UNIT
+        return self._release(table)
+
+
+    def _release(self, table):
+        if self.pending is not None:
+            table = pd.concat([self.pending, table], ignore_index=True)
+        table = table.sort_values('time', kind='stable', ignore_index=True)
+        cut = np.searchsorted(table['time'].to_numpy(), table['time'].iat[-1] - self.holdback, side='right')
+        self.pending = table.iloc[cut:]
+        return table.iloc[:cut] if cut else None
+
+
+    def flush(self):
+        table, self.pending = self.pending, None
+        return table if table is not None and len(table) else None
+
+
+class LiveIngest:
+    def __init__(self, directory, centers, R, shape='circle', pattern='*.csv', record_dtype=None,
+                 poll=0.5, idle_timeout=None, queue_size=16, holdback=1e-3, on_transition=None, **detector_options):
+        #     centers, R, shape: ROI definition, see choose_file.assign_roi
+        #     idle_timeout: (s) a file that has not grown for this long is considered finished
+        #     on_transition: called with every confirmed transition (dict with 'run' added)
+        #     detector_options: passed to OnlineJumpDetector (sigma, confirm, afterpulse_control, ...)
+        self.directory = directory
+        self.centers = centers
+        self.R = R
+        self.shape = shape
+        self.pattern = pattern
+        self.record_dtype = record_dtype
+        self.poll = poll
+        self.idle_timeout = idle_timeout
+        self.queue_size = queue_size
+        self.holdback = holdback
+        self.on_transition = on_transition
+        self.detector_options = detector_options
+
+        self.tails = {}
+        self.detectors = {}
+        self.transitions = {}
+        self.finished = set()
+        self._stop = None
+
+
+    async def run(self, duration=None):
+        # Runs until stop() is called, 'duration' seconds have passed, or (with idle_timeout)
+        # every file seen so far has finished.
+        self._stop = asyncio.Event()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        consumer = asyncio.create_task(self._consume())
+        readers = {}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        while not self._stop.is_set():
+            for path in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+                if path not in readers:
+                    self.tails[path] = FileTail(path, self.record_dtype, self.holdback)
+                    readers[path] = asyncio.create_task(self._read(self.tails[path]))
+            if duration is not None and loop.time() - start >= duration:
+                break
+            if self.idle_timeout is not None and readers and all(r.done() for r in readers.values()):
+                break
+            if consumer.done():
+                break
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+
+        self._stop.set()
+        reading = asyncio.gather(*readers.values())
+        # the consumer only returns after the final None, finishing earlier means it failed: the readers
+        # would wait forever on the full queue, so they are cancelled and the consumer's error re-raised
+        done, _ = await asyncio.wait([consumer, reading], return_when=asyncio.FIRST_COMPLETED)
+        if consumer in done:
+            reading.cancel()
+            await asyncio.gather(reading, return_exceptions=True)
+            consumer.result()
+        try:
+            await reading
+        except BaseException:
+            consumer.cancel()
+            raise
+        await self.queue.put(None)
+        await consumer
+        return self.summary()
+
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+
+    async def _read(self, tail):
+        loop = asyncio.get_running_loop()
+        tail.last_growth = loop.time()
+        while True:
+            table = await loop.run_in_executor(None, tail.read_new)
+            if table is not None:
+                tail.last_growth = loop.time()
+                await self.queue.put((tail.path, table))   # waits here while the queue is full
+            idle = self.idle_timeout is not None and loop.time() - tail.last_growth >= self.idle_timeout
+            if self._stop.is_set() or idle:
+                break
+            await asyncio.sleep(self.poll)
+
+        table = tail.flush()
+        if table is not None:
+            await self.queue.put((tail.path, table))
+        self.finished.add(tail.path)
+
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            path, table = item
+            if path not in self.detectors:
+                self.detectors[path] = OnlineJumpDetector(len(self.centers), **self.detector_options)
+                self.transitions[path] = []
+            table = choose_file.assign_roi(table, self.centers, self.R, self.shape)
+            found = await loop.run_in_executor(None, self.detectors[path].feed_table, table.query('ion > 0'))
+            for t in found:
+                t['run'] = path
+                if self.on_transition is not None:
+                    self.on_transition(t)
+            self.transitions[path] += found
+
+
+    def summary(self):
+        rows = []
+        for path, detector in self.detectors.items():
+            for row in detector.summary():
+                row['run'] = path
+                row['finished'] = path in self.finished
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+
+### Stand-in for the detector: writes a table of events into 'path' as a growing raw TimePix CSV ###
+async def write_fake_acquisition(path, table, rows_per_write=5000, interval=0.1, toa_start=10**9):
+    # table: events with the analysis columns 'x', 'y', 'time' (s) and optionally 'center flux', 'cluster size'
+    raw = pd.DataFrame({
+        '#Col': table['y'].to_numpy(),
+        '#Row': table['x'].to_numpy(),
+        '#ToA': toa_start + np.round(table['time'].to_numpy() / choose_file.TOA_UNIT).astype(np.int64),
+        '#ToT[arb]': table['center flux'].to_numpy() if 'center flux' in table else 0,
+        '#Centroid': table['cluster size'].to_numpy() if 'cluster size' in table else 1,
+        '': '',   # the TimePix files end every row with a comma
+    })
+    with open(path, 'w') as f:
+        f.write(','.join(raw.columns) + '\n')
+        f.flush()
+        for start in range(0, len(raw), rows_per_write):
+            raw.iloc[start:start + rows_per_write].to_csv(f, header=False, index=False)
+            f.flush()
+            await asyncio.sleep(interval)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from functools import partial
+
+import run_catalog
+import rate_functions
+from fit_functions import batch_fit
+from Ion_functions import RF_PERIOD, Rscatt_high, Rscatt_high_jacobian
+
+### Micromotion from RF phase-folded photon histograms ###
+# Every ion of every run is folded onto the RF phase (Ion.rf_phase_histogram, integer tick
+# arithmetic), runs are loaded in parallel worker processes and all histograms are fitted with
+# Rscatt_high in one batch_fit call. The fitted velocity amplitude v (m/s) is the micromotion
+# amplitude used for compensation scans.
+# Rscatt_high(t, m, S, d, v, p): the saturation S and detuning d (Hz) are laser settings and are held
+# fixed, the scale m, velocity amplitude v and phase p are fitted.
+
+G0 = 20.4e6
+
+
+def run_phase_histograms(run, bins=100, state='bright', sigma=2, uncertainty_control=True, afterpulse_control=True):
+    # {'run', 'edges', 'ions': [{'ion', 'counts'}]} for one run, bright events need the jump analysis
+    import matplotlib.pyplot as plt
+    choose_file, ions = rate_functions.load_run(run, afterpulse_control)
+    result = {'run': run, 'ions': []}
+    for ion in ions:
+        if state == 'bright':
+            ion.setup(sigma, uncertainty_control)
+            plt.close('all')
+        edges, counts = ion.rf_phase_histogram(bins, state)
+        result['edges'] = edges
+        result['ions'].append({'ion': ion.n, 'counts': counts})
+    return result
+
+
+def _guess(phase, counts, saturation, detuning):
+    # scale from the mean rate, velocity from the modulation depth around the detuning
+    G = G0 * (1 + saturation)**.5
+    k = np.pi * 2 / (3e8/(3e8/493e-9 + detuning))
+    level = (G/2) * saturation / ((saturation + 1) + 4 * (detuning / G)**2)
+    m = counts.mean() / level
+    slope = 8 * abs(detuning) / G**2 / ((saturation + 1) + 4 * (detuning / G)**2)
+    depth = (np.percentile(counts, 95) - np.percentile(counts, 5)) / 2 / max(counts.mean(), 1e-12)
+    v = depth / max(slope, 1e-12) / (k * np.cos(np.pi/4))
+    return m, v
+
+
+### Rscatt_high fit of many phase histograms at once ###
+def fit_micromotion(edges, counts, saturation=1.0, detuning=-10e6, starts=4):
+    #     edges: bin edges (ns), counts: (nhistograms, nbins)
+    #     starts: number of starting phases tried per histogram, the best fit is kept
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    phase = (edges[:-1] + edges[1:]) / 2
+    model = lambda t, m, v, p: Rscatt_high(t, m, saturation, detuning, v, p)
+    jac = lambda t, m, v, p: Rscatt_high_jacobian(t, m, saturation, detuning, v, p)[..., [0, 3, 4]]
+
+    guesses = np.array([_guess(phase, c, saturation, detuning) for c in counts])
+    p0 = np.concatenate([np.column_stack((guesses, np.full(len(counts), 2*np.pi*s/starts))) for s in range(starts)])
+    y = np.tile(counts, (starts, 1))
+    popt, pcov, info = batch_fit(model, phase, y, p0, sigma=np.sqrt(np.maximum(y, 1)), jac=jac,
+                                 bounds=([0, 0, -np.inf], [np.inf, np.inf, np.inf]), absolute_sigma=True)
+
+    best = np.argmin(info['chi2'].reshape(starts, -1), axis=0) * len(counts) + np.arange(len(counts))
+    popt, pcov = popt[best], pcov[best]
+    perr = np.sqrt(np.einsum('mii->mi', pcov))
+    return pd.DataFrame({
+        'scale': popt[:, 0], 'velocity': popt[:, 1], 'velocity_err': perr[:, 1],
+        'phase': np.mod(popt[:, 2], 2*np.pi), 'phase_err': perr[:, 2],
+        'chi2': info['chi2'][best], 'dof': info['dof'][best], 'converged': info['converged'][best],
+    })
+
+
+### Phase histograms and micromotion amplitude of every ion of many runs ###
+def micromotion_scan(runs, bins=100, state='bright', saturation=1.0, detuning=-10e6, processes=None, **jump_options):
+    #     jump_options: sigma, uncertainty_control, afterpulse_control for the bright-state selection
+    work = partial(run_phase_histograms, bins=bins, state=state, **jump_options)
+    results = rate_functions.map_runs(work, list(runs), processes)
+    rows = [(r['run'], ion['ion'], ion['counts']) for r in results for ion in r['ions']]
+    if not rows:
+        return pd.DataFrame(), {}
+    edges = next(r['edges'] for r in results if r['ions'])
+    table = fit_micromotion(edges, np.array([c for _, _, c in rows]), saturation, detuning)
+    table.insert(0, 'run', [r for r, _, _ in rows])
+    table.insert(1, 'ion', [i for _, i, _ in rows])
+    catalog = run_catalog.table([r for r in table['run'].unique() if r in run_catalog.RUNS])
+    if len(catalog):
+        table = table.merge(catalog, on='run', how='left')
+    histograms = {(r, i): c for r, i, c in rows}
+    return table, histograms
+
+
+def plot_phase(edges, counts, fit, saturation=1.0, detuning=-10e6, title=''):
+    phase = (edges[:-1] + edges[1:]) / 2
+    t = np.linspace(0, RF_PERIOD, 500)
+    fig, ax = plt.subplots(1, figsize = (5, 3))
+    ax.errorbar(phase, counts, yerr=np.sqrt(counts), fmt='o', ms=3)
+    ax.plot(t, Rscatt_high(t, fit['scale'], saturation, detuning, fit['velocity'], fit['phase']))
+    ax.set_xlabel('RF phase (ns)')
+    ax.set_ylabel('Counts')
+    ax.set_title(title or f"v = {fit['velocity']:.3g} m/s")
+    plt.show()
@@ -0,0 +1,246 @@
+import numpy as np
+from collections import deque
+from scipy import stats
+from scipy.optimize import curve_fit
+
+from Ion_functions import expon, expon_jacobian
+
+### Incremental quantum jump detection ###
+# Ion.setup() needs the whole run in one DataFrame. The detector below consumes time-ordered
+# events chunk by chunk and keeps, per ion, only a fixed 'dt' histogram, the current threshold
+# and a bounded tail of recent events, so an acquisition of any length runs in constant memory.
+# 'dt' follows the loaders in choose_file: the time from an event to the NEXT event in the ROI,
+# so each event is classified once the following event has arrived. Until the first threshold exists
+# (a dark ion can take long) only the newest 'warmup' events are held back, and a failed fit is
+# retried after every refit_every events instead of on every chunk.
+#
+# The running histogram has FINE_BINS bins over hist_range. With hist_bins='auto' every fit rebins it
+# to the number of bins np.histogram(bins='auto') would choose for the same events, within one bin (as in
+# Ion.auto_threshold), with the interquartile range and extent read from the fine bins. Fine bins
+# cut by a coarse edge are shared in proportion, so the rebinned counts are exact up to the spread of
+# events inside one fine bin (0.05 s / 65536 = 0.8 us). The fit uses the same jacobian as auto_threshold.
+# On a 200 s telegraph run the threshold and uncertainty band agree with Ion.setup to 1e-7 s, and the
+# transition counts to within a few in 14500. An int hist_bins fits fixed equal bins instead: the
+# uncertainty band (from the fit covariance) then depends on that binning and no longer matches.
+
+FINE_BINS = 2**16
+
+
+def auto_rebin(hist, edges):
+    # fine histogram rebinned to the bins of np.histogram(bins='auto', range=(edges[0], edges[-1])):
+    # the smaller of the Freedman-Diaconis and Sturges widths, from the events inside the range
+    n = hist.sum()
+    if n == 0:
+        return hist, edges
+    filled = np.flatnonzero(hist)
+    ptp = edges[filled[-1] + 1] - edges[filled[0]] if len(filled) > 1 else 0
+    cumulative = np.cumsum(hist) / n
+    q25, q75 = np.interp([.25, .75], np.concatenate(([0], cumulative)), edges)
+    sturges = ptp / (np.log2(n) + 1)
+    fd = 2 * (q75 - q25) * n**(-1/3)
+    width = min(fd, sturges) if fd else sturges
+    nbins = int(np.ceil((edges[-1] - edges[0]) / width)) if width > 0 else 1
+    nbins = min(max(nbins, 1), len(hist))
+    coarse = np.linspace(edges[0], edges[-1], nbins + 1)
+    # counts of fine bins cut by a coarse edge are shared in proportion to the overlap
+    return np.diff(np.interp(coarse, edges, np.concatenate(([0], np.cumsum(hist))))), coarse
+
+
+class OnlineIonState:
+    def __init__(self, n, hist_range, hist_bins, tail, warmup):
+        self.n = n
+        self.hist_bins = hist_bins        # 'auto' or a fixed number of bins for the fit
+        nbins = FINE_BINS if hist_bins == 'auto' else hist_bins
+        self.edges = np.linspace(hist_range[0], hist_range[1], nbins + 1)
+        self.hist = np.zeros(nbins)       # running 'dt' histogram used for the threshold fit
+
+        self.threshold = None
+        self.lower_limit = None
+        self.upper_limit = None
+        self.rate = None                  # fitted bright state photon rate (1/s)
+
+        self.last_time = None             # newest event, its 'dt' is not known yet
+        self.first_time = None
+        self.count = 0                    # events classified so far (matches the 'index' column)
+        self.since_fit = 0
+        self.next_fit = warmup            # events needed since the last fit (attempt) before the next one
+        self.warmup = deque()             # (time, dt) chunks held until the first threshold exists
+        self.buffered = 0                 # events in warmup, at most warmup_events between chunks
+
+        self.state = 0                    # confirmed state: 1 bright, -1 dark, 0 unknown
+        self.run_state = 0                # state of the current run of events
+        self.run_length = 0
+        self.run_start = (0, 0.0)         # (index, time) of the first event of the current run
+        self.last_raw = 1                 # last threshold decision, used inside the uncertainty band
+
+        self.BtD = 0
+        self.DtB = 0
+        self.tail = deque(maxlen=tail)    # (index, time, dt, state) of the most recent events
+
+
+class OnlineJumpDetector:
+    def __init__(self, ions, sigma=2, uncertainty_control=True, afterpulse_control=True, confirm=1,
+                 tail=4096, warmup=2000, refit_every=5000, forget=0.0, hist_range=(0, .05), hist_bins='auto'):
+        # ions: number of ions or a list of ion numbers
+        ions = range(1, ions + 1) if isinstance(ions, int) else ions
+        self.ions = {n: OnlineIonState(n, hist_range, hist_bins, tail, warmup) for n in ions}
+        self.sigma = sigma
+        self.uncertainty_control = uncertainty_control
+        self.afterpulse_control = afterpulse_control
+        self.confirm = confirm            # consecutive events needed in a new state before the jump is emitted
+        self.warmup_events = warmup
+        self.refit_every = refit_every
+        self.forget = forget              # fraction of the 'dt' histogram dropped at every refit (0 keeps all)
+
+
+        ### Feed a chunk of time-ordered events for one ion, returns the transitions confirmed by it ###
+    def feed(self, n, times):
+        ion = self.ions[n]
+        times = np.asarray(times, dtype=float)
+        if len(times) == 0:
+            return []
+        if ion.last_time is not None:
+            times = np.concatenate(([ion.last_time], times))
+        else:
+            ion.first_time = times[0]
+        if len(times) < 2:
+            ion.last_time = times[-1]
+            return []
+
+        # forward difference as in the loaders, the newest event waits for its successor
+        dt = np.diff(times)
+        times, ion.last_time = times[:-1], times[-1]
+        if self.afterpulse_control:
+            keep = dt > 1e-7
+            times, dt = times[keep], dt[keep]
+
+        ion.hist += np.histogram(dt, bins=ion.edges)[0]
+        ion.since_fit += len(dt)
+
+        if ion.threshold is None:
+            ion.warmup.append((times, dt))
+            ion.buffered += len(dt)
+            if ion.since_fit >= ion.next_fit:
+                self._fit(ion)
+                if ion.threshold is None:
+                    # no usable fit (no 'dt' in range, e.g. a dark ion, or no convergence): try again after
+                    # refit_every more events
+                    ion.since_fit, ion.next_fit = 0, self.refit_every
+            if ion.threshold is None:
+                self._trim_warmup(ion)
+                return []
+            times = np.concatenate([w[0] for w in ion.warmup])
+            dt = np.concatenate([w[1] for w in ion.warmup])
+            ion.warmup.clear()
+            ion.buffered = 0
+        elif ion.since_fit >= self.refit_every:
+            self._fit(ion)
+
+        return self._classify(ion, times, dt)
+
+
+    def _trim_warmup(self, ion):
+        # keeps the newest warmup_events events for classification once the first threshold exists.
+        # Older ones are dropped unclassified but counted, so the event indices still match the loaders.
+        while ion.buffered > self.warmup_events:
+            drop = min(ion.buffered - self.warmup_events, len(ion.warmup[0][1]))
+            times, dt = ion.warmup.popleft()
+            if drop < len(dt):
+                ion.warmup.appendleft((times[drop:], dt[drop:]))
+            ion.buffered -= drop
+            ion.count += drop
+
+
+        ### Feed a chunk holding several ions, needs 'ion' and 'time' columns (see choose_file) ###
+    def feed_table(self, chunk):
+        found = []
+        for n, group in chunk.groupby('ion', sort=False):
+            if n in self.ions:
+                found += self.feed(n, group['time'].to_numpy())
+        found.sort(key=lambda t: t['time'])
+        return found
+
+
+        ### Same exponential fit and sigma threshold as Ion.auto_threshold, on the running histogram ###
+    def _fit(self, ion):
+        # leaves the threshold unchanged (None before the first fit) when the histogram is empty or the fit fails
+        hist, edges = ion.hist, ion.edges
+        if ion.hist_bins == 'auto':
+            hist, edges = auto_rebin(hist, edges)
+        widths = np.diff(edges)
+        total = hist.sum()
+        if total == 0:
+            return
+        heights = hist / (total * widths)
+        centers = edges[:-1] + widths / 2
+        try:
+            popt, pcov = curve_fit(expon, centers, heights, p0=[1/5e-4, heights.max()], jac=expon_jacobian)
+        except RuntimeError:
+            return   # keep the previous threshold if this histogram does not converge
+
+        sigma_percent = stats.norm.cdf(self.sigma)
+        rate = popt[0]
+        ion.rate = rate
+        ion.threshold = stats.expon.ppf(sigma_percent, scale=1 / rate)
+        ion.upper_limit = stats.expon.ppf(sigma_percent, scale=1 / (rate - (pcov[0][0]**2)))
+        ion.lower_limit = stats.expon.ppf(sigma_percent, scale=1 / (rate + (pcov[0][0]**2)))
+        ion.since_fit = 0
+        if self.forget:
+            ion.hist *= 1 - self.forget
+
+
+    def _classify(self, ion, times, dt):
+        if len(dt) == 0:
+            return []
+        index = ion.count + np.arange(len(dt))
+        ion.count += len(dt)
+
+        raw = np.where(dt <= ion.threshold, 1, -1)
+        if self.uncertainty_control and np.isfinite(ion.upper_limit):
+            # inside the uncertainty band an event keeps the state of the event before it
+            unsure = (dt >= ion.lower_limit) & (dt <= ion.upper_limit)
+            raw = np.where(unsure, 0, raw)
+            filled = np.where(raw != 0, np.arange(len(raw)), -1)
+            filled = np.maximum.accumulate(filled)
+            raw = np.where(filled >= 0, raw[np.maximum(filled, 0)], ion.last_raw)
+        ion.last_raw = raw[-1]
+
+        keep = slice(max(0, len(dt) - ion.tail.maxlen), None)
+        ion.tail.extend(zip(index[keep], times[keep], dt[keep], raw[keep]))
+
+        # run-length encode the chunk, continuing the run left open by the previous chunk
+        starts = np.flatnonzero(np.diff(raw)) + 1
+        starts = np.concatenate(([0], starts))
+        lengths = np.diff(np.concatenate((starts, [len(raw)])))
+
+        found = []
+        for s, length in zip(starts, lengths):
+            state = raw[s]
+            if s == 0 and state == ion.run_state:
+                ion.run_length += length
+            else:
+                ion.run_state = state
+                ion.run_length = length
+                ion.run_start = (index[s], times[s])
+
+            if ion.run_length >= self.confirm and ion.run_state != ion.state:
+                if ion.state != 0:
+                    kind = 'DtB' if ion.run_state == 1 else 'BtD'
+                    if kind == 'DtB':
+                        ion.DtB += 1
+                    else:
+                        ion.BtD += 1
+                    found.append({'ion': ion.n, 'kind': kind, 'index': ion.run_start[0], 'time': ion.run_start[1]})
+                ion.state = ion.run_state
+        return found
+
+
+        ### Per-ion summary of the acquisition so far ###
+    def summary(self):
+        rows = []
+        for ion in self.ions.values():
+            elapsed = (ion.last_time - ion.first_time) if ion.last_time is not None else 0
+            rows.append({'ion': ion.n, 'events': ion.count, 'threshold': ion.threshold, 'rate': ion.rate,
+                         'state': ion.state, 'BtD': ion.BtD, 'DtB': ion.DtB, 'elapsed': elapsed,
+                         'jump_rate': (ion.BtD + ion.DtB) / elapsed if elapsed > 0 else np.nan})
+        return rows
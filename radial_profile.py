@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from fit_functions import batch_fit
+from Ion_functions import Gaussian, Gaussian_jacobian
+
+### Radial density profiles from per-pixel count images ###
+# Ion.rhistogram bins a float radius per event and divides by the area of continuous annuli, but
+# events only land on pixel centres. Here the profile is built from the per-pixel count image
+# (Ion.pixel_counts / choose_file.load_pixel_images): every pixel is a unit square and its counts are
+# shared between the annuli in proportion to the exact area of the square inside each annulus. The
+# density of an annulus is then counts per pixel area over the part of the annulus the window covers
+# (for images cut to circular ROIs, only the pixels inside the ROI).
+# Profiles of all ions are computed together and fitted with a centred Gaussian in one batch_fit;
+# the fitted sigma is the point-spread (radial size) of the ion in pixels.
+
+
+def _quadrant_area(x, y, r):
+    # area of {0 <= u <= x, 0 <= v <= y, u**2 + v**2 <= r**2} for x, y >= 0
+    H = lambda u: (u * np.sqrt(np.maximum(r**2 - u**2, 0)) + r**2 * np.arcsin(np.clip(u / np.maximum(r, 1e-300), -1, 1))) / 2
+    a = np.minimum(x, np.sqrt(np.maximum(r**2 - y**2, 0)))
+    b = np.minimum(x, r)
+    return y * a + H(b) - H(a)
+
+
+def disc_overlap(x0, x1, y0, y1, r):
+    # area of the rectangle [x0, x1] x [y0, y1] inside the disc of radius r around the origin
+    F = lambda x, y: np.sign(x) * np.sign(y) * _quadrant_area(np.abs(x), np.abs(y), r)
+    return F(x1, y1) - F(x0, y1) - F(x1, y0) + F(x0, y0)
+
+
+def annulus_weights(dx, dy, edges):
+    # (npixels, nbins) area of every unit pixel centred at (dx, dy) from the centre inside every annulus
+    dx = np.asarray(dx, dtype=float)[:, None, None]
+    dy = np.asarray(dy, dtype=float)[:, None, None]
+    discs = disc_overlap(dx - .5, dx + .5, dy - .5, dy + .5, np.asarray(edges, dtype=float)[None, None, :])[:, 0, :]
+    return np.diff(discs, axis=1)
+
+
+### Radial density of every ion from one count image, all ions in one pass ###
+def radial_profiles(image, centers, r_max=4, bins=8, roi=None):
+    #     image: counts per pixel as image[x, y]
+    #     centers: (nions, 2) ion positions in pixels (need not be pixel centres)
+    #     roi: radius (or one per ion) of the circular ROI the image was cut to: pixels whose centre lies
+    #          further from the ion hold no events by construction, their area is left out as well
+    # Returns the annulus edges, densities and errors (nions, bins) in counts per pixel area.
+    centers = np.atleast_2d(np.asarray(centers, dtype=float))
+    edges = np.linspace(0, r_max, bins + 1)
+    reach = int(np.ceil(r_max + 1))
+    offsets = np.arange(-reach, reach + 1)
+    px = np.rint(centers[:, 0])[:, None, None] + offsets[None, :, None]   # (nions, window, 1)
+    py = np.rint(centers[:, 1])[:, None, None] + offsets[None, None, :]   # (nions, 1, window)
+    px, py = np.broadcast_arrays(px, py)
+    inside = (px >= 0) & (px < image.shape[0]) & (py >= 0) & (py < image.shape[1])
+    if roi is not None:
+        roi = np.broadcast_to(np.asarray(roi, dtype=float), (len(centers),))[:, None, None]
+        inside &= (px - centers[:, 0, None, None])**2 + (py - centers[:, 1, None, None])**2 <= roi**2
+    counts = np.where(inside, image[np.clip(px, 0, image.shape[0] - 1).astype(int), np.clip(py, 0, image.shape[1] - 1).astype(int)], 0)
+
+    dx = (px - centers[:, 0, None, None]).reshape(-1)
+    dy = (py - centers[:, 1, None, None]).reshape(-1)
+    W = annulus_weights(dx, dy, edges).reshape(len(centers), -1, bins) * inside.reshape(len(centers), -1, 1)
+    counts = counts.reshape(len(centers), -1).astype(float)
+    area = W.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density = np.einsum('ip,ipk->ik', counts, W) / area
+        error = np.sqrt(np.einsum('ip,ipk->ik', counts, W**2)) / area
+    return edges, density, error
+
+
+### Point-spread width of every ion from its radial profile, one batch fit ###
+def fit_psf(edges, density, error=None):
+    # density(r) = |A| exp(-r**2 / (2 sigma**2)) + c
+    r = (edges[:-1] + edges[1:]) / 2
+    density = np.atleast_2d(density)
+    model = lambda x, s, A, c: Gaussian(x, 0, s, A, c)
+    jac = lambda x, s, A, c: Gaussian_jacobian(x, 0, s, A, c)[..., [1, 2, 3]]
+    p0 = np.column_stack((np.full(len(density), edges[-1] / 2), density[:, 0] - density[:, -1], density[:, -1]))
+    sigma = None if error is None else np.where(np.asarray(error) > 0, error, np.nan)
+    popt, pcov, info = batch_fit(model, r, density, p0, sigma=sigma, jac=jac, absolute_sigma=error is not None)
+    perr = np.sqrt(np.abs(np.einsum('mii->mi', pcov)))
+    return pd.DataFrame({'psf_sigma': np.abs(popt[:, 0]), 'psf_sigma_err': perr[:, 0], 'fwhm': 2*np.sqrt(2*np.log(2))*np.abs(popt[:, 0]),
+                         'amplitude': np.abs(popt[:, 1]), 'background': popt[:, 2],
+                         'chi2': info['chi2'], 'dof': info['dof'], 'converged': info['converged']})
+
+
+def ion_psf(ions, r_max=None, bins=8, image=None):
+    # radial profiles and PSF fits of the loaded ions. image: a whole-sensor count image (e.g.
+    # choose_file.load_pixel_images(filename)['counts'] for the unfiltered events), by default the
+    # ROI events of every ion from Ion.pixel_counts, with the area outside the circle of radius r0 left out
+    ions = [ion for ion in ions if type(ion.color) != int]
+    r_max = r_max or max(ion.r0 for ion in ions)
+    roi = None
+    if image is None:
+        image = sum(ion.pixel_counts() for ion in ions)
+        roi = [ion.r0 for ion in ions]
+    edges, density, error = radial_profiles(image, [(ion.x, ion.y) for ion in ions], r_max, bins, roi)
+    table = fit_psf(edges, density, error)
+    table.insert(0, 'ion', [ion.n for ion in ions])
+    return table, edges, density, error
+
+
+def plot_profiles(edges, density, error, fits):
+    r = (edges[:-1] + edges[1:]) / 2
+    x = np.linspace(0, edges[-1], 200)
+    fig, ax = plt.subplots(1, figsize = (5, 3))
+    for k, fit in enumerate(fits.itertuples()):
+        points = ax.errorbar(r, density[k], yerr=error[k], fmt='o', ms=3, label=f'Ion {fit.ion}')
+        ax.plot(x, Gaussian(x, 0, fit.psf_sigma, fit.amplitude, fit.background), color=points[0].get_color())
+    ax.set_xlabel('Radius (pixels)')
+    ax.set_ylabel('Counts per pixel area')
+    ax.legend()
+    plt.show()
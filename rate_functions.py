@@ -0,0 +1,220 @@
+import inspect
+import numpy as np
+import pandas as pd
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+
+import run_catalog
+from result_cache import as_cache, digest, source_digest
+
+### Transition rates for a batch of runs ###
+# Replaces the notebook cells that load a run, call setup() on every ion and compute
+# len(ion.transpts)/time by hand. Each run is analysed in its own worker process (the choose_file
+# loaders keep their results in module globals, so runs cannot share a process concurrently)
+# and the rates of every ion in every run come back as one DataFrame with confidence intervals.
+
+KINDS = ('BtD', 'DtB', 'total')
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')   # setup() draws the auto_threshold figures, nothing is shown in a worker
+
+
+### Loads a run through its choose_file function, returns the module and the ions that exist ###
+def load_run(run, afterpulse_control=True, tot_range=None):
+    #     tot_range: (low, high) ToT cut applied by the loader's ROI queries (choose_file.TOT_RANGE)
+    import choose_file
+    loader = getattr(choose_file, run)
+    previous, choose_file.TOT_RANGE = choose_file.TOT_RANGE, tot_range
+    try:
+        if 'afterpulse_control' in inspect.signature(loader).parameters:
+            loader(afterpulse_control)
+        else:
+            loader()
+    finally:
+        choose_file.TOT_RANGE = previous
+    n = run_catalog.RUNS[run]['ions'] if run in run_catalog.RUNS else 9
+    ions = [getattr(choose_file, f'ion_{i}', None) for i in range(1, n + 1)]
+    return choose_file, [ion for ion in ions if ion is not None and type(ion.color) != int]
+
+
+def _loader_functions(function, module, found=None):
+    # the loader and every choose_file function it calls (Two(), Six_squeezed(), ...): together they define the ROIs
+    found = [] if found is None else found
+    found.append(function)
+    for value in inspect.getclosurevars(function).globals.values():
+        if inspect.isfunction(value) and value.__module__ == module.__name__ and value not in found:
+            _loader_functions(value, module, found)
+    return found
+
+
+def run_key(run, cache, **params):
+    # content address of a run_jumps result: event file, ROI definition, analysis code and parameters
+    import choose_file
+    from Ion_functions import Ion
+    loaders = _loader_functions(getattr(choose_file, run), choose_file)
+    return digest(run, cache.file_digest(run_catalog.RUNS[run]['file']),
+                  source_digest(*sorted(loaders, key=lambda f: f.__name__)), source_digest(Ion), params)
+
+
+### Runs the jump analysis of one run and returns the transition times of every ion ###
+def run_jumps(run, sigma=2, uncertainty_control=True, single_photon_control=False, afterpulse_control=True, cache=None,
+              tot_range=None):
+    #     cache: ResultCache or cache directory, results are reused while the event file, ROIs and parameters are unchanged
+    cache = as_cache(cache)
+    if cache is not None and run in run_catalog.RUNS:
+        key = run_key(run, cache, sigma=sigma, uncertainty_control=uncertainty_control,
+                      single_photon_control=single_photon_control, afterpulse_control=afterpulse_control,
+                      tot_range=None if tot_range is None else list(tot_range))
+        return cache.cached(key, run_jumps, run, sigma, uncertainty_control, single_photon_control, afterpulse_control,
+                            None, tot_range)
+
+    import matplotlib.pyplot as plt
+    choose_file, ions = load_run(run, afterpulse_control, tot_range)
+    data_table = choose_file.data_table
+    result = {'run': run, 'start': data_table['time'].min(), 'end': data_table['time'].max(), 'ions': []}
+    for ion in ions:
+        ion.setup(sigma, uncertainty_control, single_photon_control)
+        plt.close('all')
+        result['ions'].append(ion_result(ion))
+    return result
+
+
+def ion_result(ion):
+    # the per-ion entry of a run_jumps result from an ion that has been setup()
+    time = ion.data['time'].to_numpy()
+    return {
+        'ion': ion.n, 'x': ion.x, 'y': ion.y, 'r0': ion.r0, 'events': len(ion.data),
+        'threshold': ion.threshold, 'lower_limit': ion.lower_limit, 'upper_limit': ion.upper_limit,
+        'BtD': time[np.asarray(ion.BtD, dtype=int)], 'DtB': time[np.asarray(ion.DtB, dtype=int)],
+    }
+
+
+def map_runs(function, runs, processes=None):
+    # function(run) for every run, in worker processes unless processes == 1
+    if processes == 1:
+        return [function(run) for run in runs]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        return list(pool.map(function, runs))
+
+
+#___________________________________________________________________________________________________________
+##### LIVE TIME AND INTERVALS #####
+
+
+def live_time(start, end, masks=()):
+    # time between start and end that is not covered by a masked (start, end) segment
+    total = end - start
+    for s, e in _merge(masks):
+        total -= max(0, min(e, end) - max(s, start))
+    return total
+
+
+def unmasked(times, masks=()):
+    keep = np.ones(len(times), dtype=bool)
+    for s, e in masks:
+        keep &= ~((times >= s) & (times <= e))
+    return times[keep]
+
+
+def _merge(masks):
+    merged = []
+    for s, e in sorted(masks):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def lifetimes(BtD, DtB):
+    # mean bright and dark state durations (s) between consecutive transitions
+    times = np.concatenate((DtB, BtD))
+    starts_bright = np.concatenate((np.ones(len(DtB), dtype=bool), np.zeros(len(BtD), dtype=bool)))
+    order = np.argsort(times, kind='stable')
+    durations = np.diff(times[order])
+    bright = durations[starts_bright[order][:-1]] if len(durations) else durations
+    dark = durations[~starts_bright[order][:-1]] if len(durations) else durations
+    return (bright.mean() if len(bright) else np.nan), (dark.mean() if len(dark) else np.nan)
+
+
+def poisson_interval(k, cl=0.95):
+    # exact (Garwood) interval on a Poisson count k
+    k = np.asarray(k, dtype=float)
+    a = (1 - cl) / 2
+    low = np.where(k > 0, stats.chi2.ppf(a, 2*k) / 2, 0.0)
+    high = stats.chi2.ppf(1 - a, 2*k + 2) / 2
+    return low, high
+
+
+#___________________________________________________________________________________________________________
+##### RATE TABLE #####
+
+
+def rate_table(results, masks=None, cl=0.95, method='poisson', n_boot=1000, rng=None):
+    # One row per ion and run from run_jumps() results.
+    #     masks: {run: [(start, end), ...]} segments (s) excluded from the live time and the counts,
+    #            defaults to the 'masks' entry of the run in run_catalog
+    #     method: 'poisson' or 'bootstrap' (block bootstrap, bootstrap_functions.block_rate_replicates)
+    rng = np.random.default_rng(rng)
+    rows = []
+    for result in results:
+        run = result['run']
+        run_masks = (masks or {}).get(run, run_catalog.RUNS.get(run, {}).get('masks', ()))
+        live = live_time(result['start'], result['end'], run_masks)
+        for ion in result['ions']:
+            row = {'run': run, 'ion': ion['ion'], 'x_roi': ion['x'], 'y_roi': ion['y'], 'events': ion['events'],
+                   'threshold': ion['threshold'], 'start': result['start'], 'end': result['end'], 'live_time': live}
+            times = {'BtD': unmasked(ion['BtD'], run_masks), 'DtB': unmasked(ion['DtB'], run_masks)}
+            times['total'] = np.sort(np.concatenate((times['BtD'], times['DtB'])))
+            for kind in KINDS:
+                k = len(times[kind])
+                if method == 'bootstrap':
+                    from bootstrap_functions import block_rate_replicates
+                    _, rates = block_rate_replicates(times[kind], result['start'], result['end'], n_boot, rng=rng,
+                                                     masks=run_masks)
+                    low, high = np.nanquantile(rates, [(1 - cl) / 2, (1 + cl) / 2])
+                else:
+                    low, high = poisson_interval(k, cl)
+                    low, high = low / live, high / live
+                row[f'n_{kind}'] = k
+                row[f'rate_{kind}'] = k / live
+                row[f'rate_{kind}_low'] = float(low)
+                row[f'rate_{kind}_high'] = float(high)
+            row['bright_lifetime'], row['dark_lifetime'] = lifetimes(times['BtD'], times['DtB'])
+            rows.append(row)
+
+    table = pd.DataFrame(rows)
+    catalog = run_catalog.table([r for r in table['run'].unique() if r in run_catalog.RUNS]) if len(table) else None
+    if catalog is not None and len(catalog):
+        table = table.merge(catalog, on='run', how='left')
+    return table
+
+
+### Per-ion BtD, DtB and total jump rates with confidence intervals for a batch of runs ###
+def transition_rates(runs, sigma=2, uncertainty_control=True, single_photon_control=False, afterpulse_control=True,
+                     masks=None, cl=0.95, method='poisson', n_boot=1000, processes=None, rng=None, cache=None, store=None,
+                     tot_range=None):
+    # cache: ResultCache, directory, or True for the default directory, where per-run results are kept between sessions
+    # store: ResultsStore or SQLite file the rate table is appended to
+    analyse = partial(run_jumps, sigma=sigma, uncertainty_control=uncertainty_control,
+                      single_photon_control=single_photon_control, afterpulse_control=afterpulse_control, cache=cache,
+                      tot_range=tot_range)
+    results = map_runs(analyse, list(runs), processes)
+    table = rate_table(results, masks, cl, method, n_boot, rng)
+    if store is not None:
+        from results_store import ResultsStore
+        store = store if isinstance(store, ResultsStore) else ResultsStore(store)
+        store.append(table, **analysis_parameters(sigma, uncertainty_control, single_photon_control, afterpulse_control,
+                                                  cl, method, tot_range))
+    return table
+
+
+def analysis_parameters(sigma=2, uncertainty_control=True, single_photon_control=False, afterpulse_control=True,
+                        cl=0.95, method='poisson', tot_range=None):
+    # the settings stored with a rate table in the results store (results_store.PARAMETERS)
+    low, high = (None, None) if tot_range is None else tot_range
+    return dict(sigma=sigma, uncertainty_control=uncertainty_control, single_photon_control=single_photon_control,
+                afterpulse_control=afterpulse_control, method=method, cl=cl, tot_low=low, tot_high=high)
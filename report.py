@@ -0,0 +1,158 @@
+import os
+import html
+import json
+import traceback
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import rate_functions
+
+### Batch figure reports ###
+# Renders the review figures (auto_threshold, stateHistograms, duration_statistics, leadup) of every
+# ion of every run to PNG/SVG files in worker processes with the Agg backend, and writes an index.html
+# linking all of them. generate_report() returns at once by default: the runs are rendered by a
+# process pool driven from a background thread and the returned Future gives the index path, so the
+# notebook kernel stays free for analysis. Ions that have already been setup() in the notebook can be
+# passed with ions={run: [ions]}, their runs are neither reloaded nor set up again. Other runs are loaded
+# and every ion is set up once; with cache= the thresholds and transitions come from result_cache
+# instead of being recomputed.
+
+FIGURES = ('auto_threshold', 'stateHistograms', 'duration_statistics', 'leadup')
+
+
+def _capture(function, path, formats):
+    # runs a plotting method and saves every figure it opened, returns the files written
+    import matplotlib.pyplot as plt
+    before = set(plt.get_fignums())
+    function()
+    files = []
+    for k, number in enumerate(sorted(set(plt.get_fignums()) - before)):
+        figure = plt.figure(number)
+        for fmt in formats:
+            name = f'{path}{"_" + str(k) if k else ""}.{fmt}'
+            figure.savefig(name, bbox_inches='tight')
+            files.append(name)
+    plt.close('all')
+    return files
+
+
+def _draw_threshold(ion, sigma, uncertainty_control):
+    # the auto_threshold figure, leaving the threshold of an ion that was set up with other settings as it was
+    kept = {name: getattr(ion, name) for name in ('threshold', 'lower_limit', 'upper_limit') if hasattr(ion, name)}
+    try:
+        ion.auto_threshold(sigma, uncertainty_control)
+    finally:
+        if 'B/D' in ion.data:
+            for name, value in kept.items():
+                setattr(ion, name, value)
+
+
+### Renders the figures of every ion of one run, returns one entry per ion and figure ###
+def render_run(run, out='report', figures=FIGURES, formats=('png',), leadup_points=5, sigma=2,
+               uncertainty_control=True, single_photon_control=False, afterpulse_control=True, cache=None, ions=None):
+    #     ions: the ions of the run, already setup() (the run is then not loaded)
+    import matplotlib.pyplot as plt
+    folder = os.path.join(out, run)
+    os.makedirs(folder, exist_ok=True)
+    entries = []
+    if ions is None:
+        try:
+            choose_file, ions = rate_functions.load_run(run, afterpulse_control)
+        except Exception:
+            return [{'run': run, 'ion': None, 'figure': 'load', 'files': [], 'error': traceback.format_exc(limit=2)}]
+        plt.close('all')
+    ions = [ion for ion in ions if type(ion.color) != int]
+
+    for ion in ions:
+        ion_figures = list(figures)
+        if any(figure != 'auto_threshold' for figure in figures) and 'B/D' not in ion.data:
+            # the other figures need the sorted states, set up once per ion; the setup figures are not part of the report
+            try:
+                ion.setup(sigma, uncertainty_control, single_photon_control, cache=cache)
+            except Exception:
+                entries.append({'run': run, 'ion': ion.n, 'figure': 'setup', 'files': [], 'error': traceback.format_exc(limit=2)})
+                ion_figures = [figure for figure in figures if figure == 'auto_threshold']
+            plt.close('all')
+        steps = {
+            'auto_threshold': lambda: _draw_threshold(ion, sigma, uncertainty_control),
+            'stateHistograms': lambda: ion.stateHistograms(),
+            'duration_statistics': lambda: ion.duration_statistics(),
+            'leadup': lambda: ion.leadup(leadup_points),
+        }
+        for figure in ion_figures:
+            entry = {'run': run, 'ion': ion.n, 'figure': figure, 'files': [], 'error': None}
+            try:
+                entry['files'] = _capture(steps[figure], os.path.join(folder, f'ion{ion.n}_{figure}'), formats)
+            except Exception:
+                entry['error'] = traceback.format_exc(limit=2)
+                plt.close('all')
+            entries.append(entry)
+    return entries
+
+
+def write_index(entries, out='report', title='Run review'):
+    # index.html with one section per run and one row of figures per ion
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">', f'<title>{html.escape(title)}</title>',
+             '<style>body{font-family:sans-serif} img{max-height:260px;margin:4px;border:1px solid #ccc}'
+             ' .error{color:#b00;font-size:small;white-space:pre-wrap}</style>', '</head><body>', f'<h1>{html.escape(title)}</h1>']
+    runs = list(dict.fromkeys(e['run'] for e in entries))
+    lines.append('<ul>' + ''.join(f'<li><a href="#{html.escape(r)}">{html.escape(r)}</a></li>' for r in runs) + '</ul>')
+    for run in runs:
+        lines.append(f'<h2 id="{html.escape(run)}">{html.escape(run)}</h2>')
+        run_entries = [e for e in entries if e['run'] == run]
+        for ion in dict.fromkeys(e['ion'] for e in run_entries):
+            lines.append(f'<h3>Ion {ion}</h3><div>' if ion is not None else '<div>')
+            for e in [e for e in run_entries if e['ion'] == ion]:
+                for name in e['files']:
+                    relative = html.escape(os.path.relpath(name, out))
+                    if name.endswith(('.png', '.svg')):
+                        lines.append(f'<a href="{relative}"><img src="{relative}" title="{html.escape(e["figure"])}"></a>')
+                if e['error']:
+                    lines.append(f'<div class="error">{html.escape(e["figure"])}: {html.escape(e["error"])}</div>')
+            lines.append('</div>')
+    lines.append('</body></html>')
+    path = os.path.join(out, 'index.html')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(entries, f, indent=1)
+    return path
+
+
+def _render_item(item, out, options):
+    run, ions = item
+    return render_run(run, out=out, ions=ions, **options)
+
+
+def _generate(runs, out, processes, title, options, ions=None):
+    items = [(run, (ions or {}).get(run)) for run in runs]
+    render = partial(_render_item, out=out, options=options)
+    if processes == 1:
+        import matplotlib.pyplot as plt
+        backend = plt.get_backend()
+        plt.switch_backend('Agg')   # nothing is shown in the notebook while rendering
+        try:
+            results = [render(item) for item in items]
+        finally:
+            plt.switch_backend(backend)
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=rate_functions._init_worker) as pool:
+            results = list(pool.map(render, items))
+    return write_index([e for entries in results for e in entries], out, title)
+
+
+### Review figures of many runs written to disk, in the background by default ###
+def generate_report(runs, out='report', processes=None, background=True, title='Run review', ions=None, **options):
+    #     ions: {run: [ions]} already setup() in the notebook, rendered without loading the run again
+    #     options: figures, formats (e.g. ('png', 'svg')), leadup_points, sigma, uncertainty_control,
+    #              single_photon_control, afterpulse_control, cache
+    # Returns a Future of the index.html path when background, else the path itself.
+    os.makedirs(out, exist_ok=True)
+    if not background:
+        return _generate(list(runs), out, processes, title, options, ions)
+    if processes == 1:
+        processes = None   # pyplot is not thread safe, background rendering always uses worker processes
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(_generate, list(runs), out, processes, title, options, ions)
+    executor.shutdown(wait=False)
+    return future
@@ -0,0 +1,149 @@
+import contextlib
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+import pandas as pd
+
+### Content-addressed on-disk cache of per-run analysis results ###
+# Results are stored under the sha256 of everything they depend on: the content of the event file,
+# the ROI definition (the choose_file loader and the chain function it calls), the analysis
+# parameters and the source of Ion_functions. Changing any of them gives a new key, so stale results
+# are never returned. Reading an entry marks it as recently used; when the cache grows past
+# max_bytes (or max_entries) the least recently used entries are deleted.
+# Several worker processes can share one cache: every file is written to a temporary file and renamed,
+# the event file digests are kept in one small file per event file (no shared index to read, modify and
+# write back), and entries removed by another worker in the meantime are treated as missing.
+
+DEFAULT_DIRECTORY = '.jump_cache'
+
+
+def digest(*parts):
+    # sha256 of any JSON-serialisable parts (numpy scalars are converted)
+    text = json.dumps(parts, sort_keys=True, default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def source_digest(*objects):
+    return digest(*[inspect.getsource(o) for o in objects])
+
+
+def table_digest(table, columns=('time', 'x', 'y')):
+    # fast content hash of the event columns of a DataFrame
+    columns = [c for c in columns if c in table]
+    return hashlib.sha256(pd.util.hash_pandas_object(table[columns], index=False).to_numpy().tobytes()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=2 * 1024**3, max_entries=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+
+        ### sha256 of an event file, only re-read when its size or modification time changed ###
+    def file_digest(self, path):
+        stat = os.stat(path)
+        entry_path = os.path.join(self.directory, 'files', digest(os.path.abspath(path)) + '.json')
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 22), b''):
+                h.update(block)
+        entry = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': h.hexdigest()}
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        self._write(entry_path, json.dumps(entry).encode())
+        return h.hexdigest()
+
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        with contextlib.suppress(OSError):
+            os.utime(path)   # most recently used, unless another worker has evicted it meanwhile
+        return value
+
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+        return value
+
+
+    def cached(self, key, function, *args, **kwargs):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, function(*args, **kwargs))
+        return value
+
+
+    def _write(self, path, data):
+        # write to a temporary file and rename, so parallel workers never read half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+    def entries(self):
+        # (path, size, last use) of every cached result, least recently used first
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.pkl'):
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue   # evicted by another worker
+                    found.append((os.path.join(root, name), stat.st_size, stat.st_mtime))
+        return sorted(found, key=lambda e: e[2])
+
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        count = len(entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes and (self.max_entries is None or count <= self.max_entries):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            count -= 1
+
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def as_cache(cache):
+    # accepts a ResultCache, a directory name, True (default directory) or None/False (no caching)
+    if cache is None or cache is False:
+        return None
+    if isinstance(cache, ResultCache):
+        return cache
+    return ResultCache(DEFAULT_DIRECTORY if cache is True else cache)
@@ -0,0 +1,115 @@
+import sqlite3
+import datetime
+import pandas as pd
+
+import run_catalog
+
+### Append-only results store ###
+# Per-ion, per-run results (thresholds, rates, lifetimes, ROI centres and counts) with the run
+# metadata of run_catalog, kept in one SQLite file instead of notebook variables. Every append is a
+# new analysis with its own number and time stamp, nothing is overwritten: query() returns the
+# latest analysis of every (run, ion, parameters) by default, or the whole history.
+# New columns are added to the table as they appear. Aggregating by voltage, day or chain size is a
+# query, e.g. store.aggregate('voltage', 'rate_total', family='New_Datasets').
+
+PARAMETERS = ['sigma', 'uncertainty_control', 'single_photon_control', 'afterpulse_control', 'method', 'cl',
+              'tot_low', 'tot_high']
+INDEXED = ['run', 'family', 'voltage', 'day', 'ions']
+
+
+class ResultsStore:
+    def __init__(self, path='results.sqlite'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (analysis INTEGER, written TEXT, run TEXT, ion INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_run_ion ON results (run, ion, analysis)')
+
+
+    def columns(self):
+        return [row[1] for row in self.connection.execute('PRAGMA table_info(results)')]
+
+
+        ### Appends a rate_functions.rate_table() as one new analysis, returns its number ###
+    def append(self, table, **parameters):
+        #     parameters: analysis settings stored with every row (sigma, uncertainty_control, ...)
+        table = table.copy()
+        for name, value in parameters.items():
+            table[name] = value
+        if 'family' not in table and 'run' in table:
+            catalog = run_catalog.table([r for r in table['run'].unique() if r in run_catalog.RUNS])
+            if len(catalog):
+                table = table.merge(catalog, on='run', how='left')
+        table = table.drop(columns=[c for c in table if table[c].map(lambda v: isinstance(v, (list, tuple, dict))).any()])
+
+        with self.connection:
+            analysis = self.connection.execute('SELECT COALESCE(MAX(analysis), 0) + 1 FROM results').fetchone()[0]
+            table.insert(0, 'analysis', analysis)
+            table.insert(1, 'written', datetime.datetime.now().isoformat(timespec='seconds'))
+            existing = self.columns()
+            for column in table:
+                if column not in existing:
+                    self.connection.execute(f'ALTER TABLE results ADD COLUMN "{column}"')
+                    if column in INDEXED:
+                        self.connection.execute(f'CREATE INDEX IF NOT EXISTS results_{column} ON results ("{column}")')
+            table.to_sql('results', self.connection, if_exists='append', index=False)
+        return analysis
+
+
+        ### Appends ions of a loaded run that have been setup() in a notebook ###
+    def append_ions(self, run, ions, start=None, end=None, **parameters):
+        import rate_functions
+        ions = [ion for ion in ions if type(ion.color) != int]
+        times = pd.concat([ion.data['time'] for ion in ions])
+        result = {'run': run, 'start': times.min() if start is None else start, 'end': times.max() if end is None else end,
+                  'ions': [rate_functions.ion_result(ion) for ion in ions]}
+        return self.append(rate_functions.rate_table([result]), **parameters)
+
+
+    def _where(self, filters):
+        # keyword filters: value, list of values, slice(low, high) for a range or None for missing
+        known = self.columns()
+        clauses, values = [], []
+        for column, want in filters.items():
+            if column not in known:
+                raise KeyError(f'No column {column} in {self.path}')
+            if want is None:
+                clauses.append(f'"{column}" IS NULL')
+            elif isinstance(want, slice):
+                if want.start is not None:
+                    clauses.append(f'"{column}" >= ?'); values.append(want.start)
+                if want.stop is not None:
+                    clauses.append(f'"{column}" <= ?'); values.append(want.stop)
+            elif isinstance(want, (list, tuple, set)):
+                clauses.append(f'"{column}" IN ({", ".join("?" * len(want))})'); values.extend(want)
+            else:
+                clauses.append(f'"{column}" = ?'); values.append(want)
+        return clauses, values
+
+
+        ### Results matching the filters, e.g. query(ions=4, voltage=slice(200, 400), sigma=2) ###
+    def query(self, columns=None, latest=True, **filters):
+        clauses, values = self._where(filters)
+        if latest:
+            same = ' AND '.join(f'r."{p}" IS results."{p}"' for p in ['run', 'ion'] + [p for p in PARAMETERS if p in self.columns()])
+            clauses.append(f'analysis = (SELECT MAX(r.analysis) FROM results r WHERE {same})')
+        select = '*' if columns is None else ', '.join(f'"{c}"' for c in columns)
+        where = f' WHERE {" AND ".join(clauses)}' if clauses else ''
+        return pd.read_sql_query(f'SELECT {select} FROM results{where} ORDER BY analysis, run, ion', self.connection, params=values)
+
+
+    def aggregate(self, by, values='rate_total', latest=True, **filters):
+        # mean, standard deviation and count of values grouped by catalog or result columns
+        by = [by] if isinstance(by, str) else list(by)
+        values = [values] if isinstance(values, str) else list(values)
+        table = self.query(by + values, latest, **filters)
+        return table.groupby(by)[values].agg(['mean', 'std', 'count'])
+
+
+    def history(self, run, ion=None):
+        # every stored analysis of a run (and ion)
+        filters = {'run': run} if ion is None else {'run': run, 'ion': ion}
+        return self.query(latest=False, **filters)
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,137 @@
+import pandas as pd
+
+### Catalog of the runs that have a loader in choose_file ###
+# Each key is the name of the choose_file function that loads the run. Entries hold the data file,
+# the folder it lives in (family), the number of ions the loader sets up and, where known, the
+# trap voltage, the measurement day and the (x, y) beam stage position in mils.
+# Scan positions follow the file names of the conversion notebooks ('s' = +0.5 mils, e.g.
+# xscan_399s was recorded at x_399.5_y_155).
+# Laser frequency scans carry a 'detuning' (MHz). Runs without a choose_file loader (e.g. nightly
+# scans added with register()) give the ROIs themselves: 'centers' [(x, y), ...], 'R' and 'shape'
+# as in choose_file.assign_roi.
+
+RUNS = {
+    'Two_ions_xscan_399s': {'file': '2ions_xscan/xscan_399s', 'family': '2ions_xscan', 'ions': 2, 'x': 399.5, 'y': 155},
+    'Two_ions_xscan_400s': {'file': '2ions_xscan/xscan_400s', 'family': '2ions_xscan', 'ions': 2, 'x': 400.5, 'y': 155},
+    'Two_ions_xscan_401s': {'file': '2ions_xscan/xscan_401s', 'family': '2ions_xscan', 'ions': 2, 'x': 401.5, 'y': 155},
+    'Two_ions_xscan_402s': {'file': '2ions_xscan/xscan_402s', 'family': '2ions_xscan', 'ions': 2, 'x': 402.5, 'y': 155},
+    'Two_ions_xscan_403': {'file': '2ions_xscan/xscan_403', 'family': '2ions_xscan', 'ions': 2, 'x': 403, 'y': 155},
+    'Two_ions_xscan_403s': {'file': '2ions_xscan/xscan_403s', 'family': '2ions_xscan', 'ions': 2, 'x': 403.5, 'y': 155},
+    'Two_ions_xscan_404': {'file': '2ions_xscan/xscan_404', 'family': '2ions_xscan', 'ions': 2, 'x': 404, 'y': 155},
+    'Two_ions_yscan_153s': {'file': '2ions_yscan/yscan_153s', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 153.5},
+    'Two_ions_yscan_154': {'file': '2ions_yscan/yscan_154', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 154},
+    'Two_ions_yscan_154s': {'file': '2ions_yscan/yscan_154s', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 154.5},
+    'Two_ions_yscan_155': {'file': '2ions_yscan/yscan_155', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 155},
+    'Two_ions_yscan_155s': {'file': '2ions_yscan/yscan_155s', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 155.5},
+    'Two_ions_yscan_156': {'file': '2ions_yscan/yscan_156', 'family': '2ions_yscan', 'ions': 2, 'x': 402.5, 'y': 156},
+    'xscan_401s': {'file': 'xscan/xscan_401s', 'family': 'xscan', 'ions': 4, 'x': 401.5},
+    'xscan_402': {'file': 'xscan/xscan_402', 'family': 'xscan', 'ions': 4, 'x': 402},
+    'xscan_402s': {'file': 'xscan/xscan_402s', 'family': 'xscan', 'ions': 4, 'x': 402.5},
+    'xscan_403': {'file': 'xscan/xscan_403', 'family': 'xscan', 'ions': 4, 'x': 403},
+    'xscan_403s': {'file': 'xscan/xscan_403s', 'family': 'xscan', 'ions': 4, 'x': 403.5},
+    'xscan_404': {'file': 'xscan/xscan_404', 'family': 'xscan', 'ions': 4, 'x': 404},
+    'yscan_149s': {'file': 'yscan/yscan_149.5', 'family': 'yscan', 'ions': 4, 'y': 149.5},
+    'yscan_150s': {'file': 'yscan/yscan_150.5', 'family': 'yscan', 'ions': 4, 'y': 150.5},
+    'yscan_151': {'file': 'yscan/yscan_151', 'family': 'yscan', 'ions': 4, 'y': 151},
+    'yscan_151s': {'file': 'yscan/yscan_151.5', 'family': 'yscan', 'ions': 4, 'y': 151.5},
+    'yscan_152': {'file': 'yscan/yscan_152', 'family': 'yscan', 'ions': 4, 'y': 152},
+    'yscan_152s': {'file': 'yscan/yscan_152.5', 'family': 'yscan', 'ions': 4, 'y': 152.5},
+    'yscan_153': {'file': 'yscan/yscan_153', 'family': 'yscan', 'ions': 4, 'y': 153},
+    'Jumps_4_120V_2_Day2': {'file': 'New_Datasets/Jumps_4_120V_2_Day2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 120, 'day': 2},
+    'Jumps_4_120V_1_Day2': {'file': 'New_Datasets/Jumps_4_120V_1_Day2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 120, 'day': 2},
+    'Jumps_4_300V_2_Day2': {'file': 'New_Datasets/Jumps_4_300V_2_Day2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 300, 'day': 2},
+    'Jumps_4_300V_1_Day2': {'file': 'New_Datasets/Jumps_4_300V_1_Day2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 300, 'day': 2},
+    'Jumps_4_350V_1_Day2': {'file': 'New_Datasets/Jumps_4_350V_1_Day2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 350, 'day': 2},
+    'Jumps_5_350V_2': {'file': 'New_Datasets/Jumps_5_350V_2', 'family': 'New_Datasets', 'ions': 5, 'voltage': 350},
+    'Jumps_5_350V_1': {'file': 'New_Datasets/Jumps_5_350V_1', 'family': 'New_Datasets', 'ions': 5, 'voltage': 350},
+    'Jumps_5_250V_2': {'file': 'New_Datasets/Jumps_5_250V_2', 'family': 'New_Datasets', 'ions': 5, 'voltage': 250},
+    'Jumps_5_250V_1': {'file': 'New_Datasets/Jumps_5_250V_1', 'family': 'New_Datasets', 'ions': 5, 'voltage': 250},
+    'Jumps_5_120V_2': {'file': 'New_Datasets/Jumps_5_120V_2', 'family': 'New_Datasets', 'ions': 5, 'voltage': 120},
+    'Jumps_5_120V_1': {'file': 'New_Datasets/Jumps_5_120V_1', 'family': 'New_Datasets', 'ions': 5, 'voltage': 120},
+    'Jumps_9_350V_2': {'file': 'New_Datasets/Jumps_9_350V_2', 'family': 'New_Datasets', 'ions': 9, 'voltage': 350},
+    'Jumps_9_350V_1': {'file': 'New_Datasets/Jumps_9_350V_1', 'family': 'New_Datasets', 'ions': 9, 'voltage': 350},
+    'Jumps_9_270V_2': {'file': 'New_Datasets/Jumps_9_270V_2', 'family': 'New_Datasets', 'ions': 9, 'voltage': 270},
+    'Jumps_9_270V_1': {'file': 'New_Datasets/Jumps_9_270V_1', 'family': 'New_Datasets', 'ions': 9, 'voltage': 270},
+    'Jumps_4_350V_3': {'file': 'New_Datasets/Jumps_4_350V_3', 'family': 'New_Datasets', 'ions': 4, 'voltage': 350},
+    'Jumps_4_350V_2': {'file': 'New_Datasets/Jumps_4_350V_2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 350},
+    'Jumps_4_350V_1': {'file': 'New_Datasets/Jumps_4_350V_1', 'family': 'New_Datasets', 'ions': 4, 'voltage': 350},
+    'Jumps_4_270V_2': {'file': 'New_Datasets/Jumps_4_270V_2', 'family': 'New_Datasets', 'ions': 4, 'voltage': 270},
+    'Jumps_4_270V_1': {'file': 'New_Datasets/Jumps_4_270V_1', 'family': 'New_Datasets', 'ions': 4, 'voltage': 270},
+    'Jumps_2_350V_2': {'file': 'New_Datasets/Jumps_2_350V_2', 'family': 'New_Datasets', 'ions': 2, 'voltage': 350},
+    'Jumps_2_350V_1': {'file': 'New_Datasets/Jumps_2_350V_1', 'family': 'New_Datasets', 'ions': 2, 'voltage': 350},
+    'Jumps_2_180V_2': {'file': 'New_Datasets/Jumps_2_180V_2', 'family': 'New_Datasets', 'ions': 2, 'voltage': 180},
+    'Jumps_2_180V_1': {'file': 'New_Datasets/Jumps_2_180V_1', 'family': 'New_Datasets', 'ions': 2, 'voltage': 180},
+    'Jumps_2_120V_2': {'file': 'New_Datasets/Jumps_2_120V_2', 'family': 'New_Datasets', 'ions': 2, 'voltage': 120},
+    'Jumps_2_120V_1': {'file': 'New_Datasets/Jumps_2_120V_1', 'family': 'New_Datasets', 'ions': 2, 'voltage': 120},
+    'Jumps_Six_350V_1': {'file': '6ions_350V/Jumps_Six_350V_1', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_2': {'file': '6ions_350V/Jumps_Six_350V_2', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_3': {'file': '6ions_350V/Jumps_Six_350V_3', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_4': {'file': '6ions_350V/Jumps_Six_350V_4', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_5': {'file': '6ions_350V/Jumps_Six_350V_5', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_6': {'file': '6ions_350V/Jumps_Six_350V_6', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_7': {'file': '6ions_350V/Jumps_Six_350V_7', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_8': {'file': '6ions_350V/Jumps_Six_350V_8', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_9': {'file': '6ions_350V/Jumps_Six_350V_9', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_10': {'file': '6ions_350V/Jumps_Six_350V_10', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_11': {'file': '6ions_350V/Jumps_Six_350V_11', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Six_350V_12': {'file': '6ions_350V/Jumps_Six_350V_12', 'family': '6ions_350V', 'ions': 6, 'voltage': 350},
+    'Jumps_Four_125V_1': {'file': 'DC_var/Jumps_Four_125V_1', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_125V_2': {'file': 'DC_var/Jumps_Four_125V_2', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_125V_3': {'file': 'DC_var/Jumps_Four_125V_3', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_125V_4': {'file': 'DC_var/Jumps_Four_125V_4', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_125V_5': {'file': 'DC_var/Jumps_Four_125V_5', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_125V_6': {'file': 'DC_var/Jumps_Four_125V_6', 'family': 'DC_var', 'ions': 4, 'voltage': 125},
+    'Jumps_Four_220V_1': {'file': 'DC_var/Jumps_Four_220V_1', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_220V_2': {'file': 'DC_var/Jumps_Four_220V_2', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_220V_3': {'file': 'DC_var/Jumps_Four_220V_3', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_220V_4': {'file': 'DC_var/Jumps_Four_220V_4', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_220V_5': {'file': 'DC_var/Jumps_Four_220V_5', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_220V_6': {'file': 'DC_var/Jumps_Four_220V_6', 'family': 'DC_var', 'ions': 4, 'voltage': 220},
+    'Jumps_Four_320V_1': {'file': 'DC_var/Jumps_Four_320V_1', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_2': {'file': 'DC_var/Jumps_Four_320V_2', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_3': {'file': 'DC_var/Jumps_Four_320V_3', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_4': {'file': 'DC_var/Jumps_Four_320V_4', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_5': {'file': 'DC_var/Jumps_Four_320V_5', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_6': {'file': 'DC_var/Jumps_Four_320V_6', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Four_320V_7': {'file': 'DC_var/Jumps_Four_320V_7', 'family': 'DC_var', 'ions': 4, 'voltage': 320},
+    'Jumps_Three_136V_1': {'file': 'DC_var/Jumps_Three_136V_1', 'family': 'DC_var', 'ions': 3, 'voltage': 136},
+    'Jumps_Three_136V_2': {'file': 'DC_var/Jumps_Three_136V_2', 'family': 'DC_var', 'ions': 3, 'voltage': 136},
+    'Jumps_Three_80V_1': {'file': 'DC_var/Jumps_Three_80V_1', 'family': 'DC_var', 'ions': 3, 'voltage': 80},
+    'Jumps_Three_80V_2': {'file': 'DC_var/Jumps_Three_80V_2', 'family': 'DC_var', 'ions': 3, 'voltage': 80},
+    'Jumps_Four_100s_1': {'file': 'Original/Jumps_Four_100s_1', 'family': 'Original', 'ions': 4},
+    'Jumps_Four_100s_3': {'file': 'Original/Jumps_Four_100s_3', 'family': 'Original', 'ions': 4},
+    'Jumps_Four_100s_4': {'file': 'Original/Jumps_Four_100s_4', 'family': 'Original', 'ions': 4},
+    'Jumps_Four_300s': {'file': 'Original/Jumps_Four_300s', 'family': 'Original', 'ions': 4},
+    'Jumps_One_100s': {'file': 'Original/Jumps_One_100s', 'family': 'Original', 'ions': 1},
+    'Jumps_Two_100s_1': {'file': 'Original/Jumps_Two_100s_1', 'family': 'Original', 'ions': 3},
+    'Jumps_Two_100s_2': {'file': 'Original/Jumps_Two_100s_2', 'family': 'Original', 'ions': 2},
+}
+
+
+def select(**filters):
+    # Names of the runs whose catalog entry matches every filter, e.g. select(family='6ions_350V')
+    # or select(ions=4, voltage=350). A filter value can also be a function returning True/False.
+    found = []
+    for name, entry in RUNS.items():
+        ok = True
+        for key, want in filters.items():
+            have = entry.get(key)
+            ok = want(have) if callable(want) else have == want
+            if not ok:
+                break
+        if ok:
+            found.append(name)
+    return found
+
+
+def table(runs=None):
+    # Catalog as a DataFrame with one row per run
+    runs = list(RUNS) if runs is None else runs
+    return pd.DataFrame([dict(run=name, **RUNS[name]) for name in runs])
+
+
+def register(name, **entry):
+    # Adds (or replaces) a run at runtime, e.g. register('scan_0412_p3', file='scans/0412_p3.csv',
+    # family='scan_0412', ions=9, detuning=3.0, centers=[...], R=2)
+    RUNS[name] = entry
+    return name
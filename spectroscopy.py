@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from functools import partial
+
+import run_catalog
+import rate_functions
+from fit_functions import batch_fit
+from Ion_functions import Lorentzian, Double_Lorentzian
+
+### Laser frequency scans ###
+# Per-ion fluorescence rates for every run of a scan tagged with 'detuning' in run_catalog, computed
+# in worker processes, and Lorentzian / Double_Lorentzian line fits of rate against detuning for every
+# ion at once with batch_fit. After a first fit from data-driven guesses every ion is refitted starting
+# from the parameters of its neighbours in the chain and the best fit is kept: all ions see the same
+# line, so a neighbour's fit is a much better start than a guess when one spectrum is noisy.
+#
+# Runs with a choose_file loader are analysed through it. Runs registered with ROI 'centers' are read
+# straight from their event file and every event is assigned to an ion with one assign_roi call.
+
+MODELS = {'Lorentzian': Lorentzian, 'Double_Lorentzian': Double_Lorentzian}
+PARAMS = {'Lorentzian': ['x0', 'a', 'gam', 'b'], 'Double_Lorentzian': ['x1', 'a1', 'gam1', 'b1', 'x2', 'a2', 'gam2']}
+
+
+def manifest(**filters):
+    # {run: detuning} of the catalog runs matching the filters, in order of detuning
+    runs = run_catalog.select(detuning=lambda v: v is not None, **filters)
+    return dict(sorted(((run, run_catalog.RUNS[run]['detuning']) for run in runs), key=lambda item: item[1]))
+
+
+def _file_rates(run, entry, afterpulse_control=True):
+    # event counts per ion straight from the event file of a registered run
+    import choose_file
+    table = pd.read_csv(entry['file'])
+    if '#ToA' in table:
+        table = choose_file.rename_raw(table)
+    table = table.drop(columns=[c for c in table.columns if str(c).startswith('Unnamed')])
+    table['time'] = choose_file.TOA_UNIT * table['time']
+    table = choose_file.assign_roi(table, entry['centers'], entry.get('R', 2), entry.get('shape', 'circle'))
+    ion = table['ion'].to_numpy()
+    time = table['time'].to_numpy()
+    keep = ion > 0
+    if afterpulse_control:
+        # as the loaders: drop events followed by the next event of the same ion within 1e-7 s
+        order = np.lexsort((time, ion))
+        dt = np.zeros(len(order))
+        dt[:-1] = np.where(ion[order][1:] == ion[order][:-1], np.diff(time[order]), 0)
+        keep[order] &= dt > 1e-7
+    counts = np.bincount(ion[keep], minlength=len(entry['centers']) + 1)[1:]
+    live = time.max() - time.min()
+    return [{'run': run, 'ion': n + 1, 'events': int(c), 'live_time': live} for n, c in enumerate(counts)]
+
+
+### Fluorescence rate of every ion of one run ###
+def run_rates(item, state='bright', sigma=2, uncertainty_control=True, afterpulse_control=True):
+    #     item: (run, catalog entry)
+    #     state: 'bright' counts bright events over the time spent bright (needs the jump analysis),
+    #            'all' every event over the run time. Registered file runs always use 'all'.
+    run, entry = item
+    if 'centers' in entry:
+        rows = _file_rates(run, entry, afterpulse_control)
+    else:
+        choose_file, ions = rate_functions.load_run(run, afterpulse_control)
+        span = choose_file.data_table['time'].max() - choose_file.data_table['time'].min()
+        rows = []
+        for ion in ions:
+            if state == 'bright':
+                ion.setup(sigma, uncertainty_control)
+                plt.close('all')
+                segments = ion.segment_table()
+                rows.append({'run': run, 'ion': ion.n, 'events': len(ion.bright),
+                             'live_time': segments.loc[segments['state'] == 1, 'duration'].sum()})
+            else:
+                rows.append({'run': run, 'ion': ion.n, 'events': len(ion.data), 'live_time': span})
+    for row in rows:
+        row['detuning'] = entry['detuning']
+        row['rate'] = row['events'] / row['live_time'] if row['live_time'] > 0 else np.nan
+        row['rate_err'] = np.sqrt(max(row['events'], 1)) / row['live_time'] if row['live_time'] > 0 else np.nan
+    return rows
+
+
+def scan_rates(runs, processes=None, **rate_options):
+    # one row per run and ion, runs analysed in parallel
+    items = [(run, run_catalog.RUNS[run]) for run in runs]
+    results = rate_functions.map_runs(partial(run_rates, **rate_options), items, processes)
+    return pd.DataFrame([row for rows in results for row in rows])
+
+
+#___________________________________________________________________________________________________________
+##### LINE FITS #####
+
+
+def _guess_lorentzian(x, y):
+    b = np.nanmin(y)
+    peak = np.nanargmax(y)
+    a = y[peak] - b
+    above = x[y >= b + a / 2]
+    spacing = np.min(np.diff(x)) if len(x) > 1 else 1
+    gam = max((above.max() - above.min()) / 2, spacing / 2) if len(above) else spacing
+    return [x[peak], a, gam, b]
+
+
+def _guess_double(x, y):
+    x1, a1, gam1, b = _guess_lorentzian(x, y)
+    rest = np.where(np.abs(x - x1) > 2 * gam1, y, np.nan)
+    if np.all(np.isnan(rest)):
+        return [x1 - gam1, a1, gam1, b, x1 + gam1, a1 / 2, gam1]
+    second = np.nanargmax(rest)
+    return [x1, a1, gam1, b, x[second], max(y[second] - b, 0), gam1]
+
+
+### Line fit of every ion's spectrum in one batch, refined from the fits of neighbouring ions ###
+def fit_spectrum(detuning, rates, errors=None, model='Lorentzian', p0=None, neighbours=1):
+    #     detuning: (npoints,), rates and errors: (nions, npoints) with the ions in chain order
+    #     p0: starting parameters for every ion, guessed from the data if None
+    #     neighbours: how many ions on each side provide warm starts (0 switches the refit off)
+    function = MODELS[model]
+    x = np.asarray(detuning, dtype=float)
+    y = np.atleast_2d(np.asarray(rates, dtype=float))
+    sigma = None if errors is None else np.atleast_2d(np.asarray(errors, dtype=float))
+    guess = _guess_lorentzian if model == 'Lorentzian' else _guess_double
+    if p0 is None:
+        p0 = np.array([guess(x, row) for row in y])
+    popt, pcov, info = batch_fit(function, x, y, p0, sigma=sigma, absolute_sigma=sigma is not None)
+    chi2 = np.where(np.isfinite(info['chi2']), info['chi2'], np.inf)
+    converged, n_iter = info['converged'], info['n_iter']
+
+    pairs = [(i, j) for i in range(len(y)) for j in range(i - neighbours, i + neighbours + 1) if j != i and 0 <= j < len(y)]
+    if pairs:
+        target = np.array([i for i, _ in pairs])
+        source = np.array([j for _, j in pairs])
+        warm, warm_cov, warm_info = batch_fit(function, x, y[target], popt[source],
+                                              sigma=None if sigma is None else sigma[target], absolute_sigma=sigma is not None)
+        warm_chi2 = np.where(np.isfinite(warm_info['chi2']), warm_info['chi2'], np.inf)
+        for k, i in enumerate(target):
+            if warm_chi2[k] < chi2[i] * (1 - 1e-9):
+                popt[i], pcov[i], chi2[i] = warm[k], warm_cov[k], warm_chi2[k]
+                converged[i], n_iter[i] = warm_info['converged'][k], warm_info['n_iter'][k]
+
+    perr = np.sqrt(np.abs(np.einsum('mii->mi', pcov)))
+    table = pd.DataFrame({'ion': np.arange(1, len(y) + 1)})
+    for k, name in enumerate(PARAMS[model]):
+        value = np.abs(popt[:, k]) if name.startswith('gam') else popt[:, k]
+        table[name] = value
+        table[f'{name}_err'] = perr[:, k]
+    for name in [p for p in PARAMS[model] if p.startswith('gam')]:
+        table['fwhm' + name[3:]] = 2 * table[name]
+    table['chi2'], table['dof'] = chi2, info['dof']
+    table['converged'], table['n_iter'] = converged, n_iter
+    return table
+
+
+### Rates and line fits of every ion for a scan ###
+def spectrum(runs=None, model='Lorentzian', weighted=True, neighbours=1, rates=None, processes=None, **rate_options):
+    #     runs: list of runs with a 'detuning' (default: every tagged run in the catalog)
+    #     rates: a scan_rates table from an earlier call, to refit without re-analysing the runs
+    #     rate_options: state, sigma, uncertainty_control, afterpulse_control
+    if rates is None:
+        runs = list(manifest()) if runs is None else runs
+        rates = scan_rates(runs, processes, **rate_options)
+    value = rates.pivot_table(index='ion', columns='detuning', values='rate')
+    error = rates.pivot_table(index='ion', columns='detuning', values='rate_err')
+    fits = fit_spectrum(value.columns.to_numpy(), value.to_numpy(), error.to_numpy() if weighted else None,
+                        model, neighbours=neighbours)
+    fits['ion'] = value.index.to_numpy()
+    return rates, fits
+
+
+def plot_spectrum(rates, fits, model='Lorentzian'):
+    function = MODELS[model]
+    x = np.linspace(rates['detuning'].min(), rates['detuning'].max(), 1000)
+    fig, ax = plt.subplots(1, figsize = (6, 4))
+    for fit in fits.itertuples():
+        ion = rates[rates['ion'] == fit.ion].sort_values('detuning')
+        points = ax.errorbar(ion['detuning'], ion['rate'], yerr=ion['rate_err'], fmt='o', ms=3, label=f'Ion {fit.ion}')
+        params = [getattr(fit, name) for name in PARAMS[model]]
+        ax.plot(x, function(x, *params), color=points[0].get_color())
+    ax.set_xlabel('Detuning (MHz)')
+    ax.set_ylabel('Count rate (1/s)')
+    ax.legend()
+    plt.show()
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def telegraph_events(duration=60, bright=3000, dark=30, tau=0.2, seed=0):
+    # photon times of one ion switching between bright and dark with exponential dwell times,
+    # and the times of the switches
+    rng = np.random.default_rng(seed)
+    k = int(duration / tau * 2) + 10
+    lengths = rng.exponential(tau, k)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    counts = rng.poisson(np.where(np.arange(k) % 2 == 0, bright, dark) * lengths)
+    segment = np.repeat(np.arange(k), counts)
+    times = np.sort(starts[segment] + rng.random(len(segment)) * lengths[segment])
+    switches = starts[1:]
+    return times[times < duration], switches[switches < duration]
+
+
+def ion_frame(times, afterpulse_control=True):
+    # an Ion data table as the loaders build it
+    import pandas as pd
+    data = pd.DataFrame({'time': times, 'x': 0, 'y': 0, 'center flux': 1000})
+    data['dt'] = np.append(np.diff(data['time'].to_numpy()), 0)
+    if afterpulse_control:
+        data = data.query('dt > 1e-7').reset_index()
+    data['index'] = np.arange(len(data))
+    return data
+
+
+@pytest.fixture
+def telegraph():
+    return telegraph_events
+
+
+@pytest.fixture(autouse=True)
+def close_figures():
+    yield
+    import matplotlib.pyplot as plt
+    plt.close('all')
+
+
+def event_table(centers, duration=20, seed=0, **telegraph_options):
+    # converted TimePix events (time in ToA counts) of telegraph ions on their own pixels
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    parts = []
+    for k, (cx, cy) in enumerate(centers):
+        times, _ = telegraph_events(duration, seed=seed + k, **telegraph_options)
+        parts.append(pd.DataFrame({'x': np.clip(np.rint(cx + rng.normal(0, .6, len(times))), cx - 1, cx + 1),
+                                   'y': np.clip(np.rint(cy + rng.normal(0, .6, len(times))), cy - 1, cy + 1),
+                                   'time': times}))
+    table = pd.concat(parts).sort_values('time', kind='stable', ignore_index=True)
+    table['time'] = np.rint(table['time'] / 1e-11).astype(np.int64)
+    table['center flux'] = rng.integers(100, 3000, len(table))
+    table['cluster size'] = rng.integers(1, 6, len(table))
+    return table.astype({'x': np.int64, 'y': np.int64})
+
+
+XSCAN_399S = [(48, 92), (61, 92)]   # ROI centres of choose_file.Two_ions_xscan_399s
+
+
+@pytest.fixture
+def two_ion_run(tmp_path, monkeypatch):
+    # the event file of the run Two_ions_xscan_399s, written into a temporary data directory
+    os.makedirs(tmp_path / '2ions_xscan')
+    event_table(XSCAN_399S).to_csv(tmp_path / '2ions_xscan' / 'xscan_399s')
+    monkeypatch.chdir(tmp_path)
+    return 'Two_ions_xscan_399s'
+
+
+def setup_ion(times, n=1, **setup_options):
+    # an Ion of the given photon times after setup(), its printed results discarded
+    import contextlib
+    import io
+    import choose_file
+    from Ion_functions import Ion
+    choose_file.filename = 'synthetic'
+    ion = Ion(n, 0, 0, 2, 'r', ion_frame(times))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ion.setup(**setup_options)
+    return ion
+
+
+@pytest.fixture(scope='session')
+def telegraph_ion():
+    # a set up ion of a 30 s telegraph run (3000/s bright, 30/s dark, 0.2 s mean dwell), not to be modified
+    return setup_ion(telegraph_events(duration=30, seed=7)[0])
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import choose_file
+
+
+def grid(n=24, tot=True):
+    # one event on every pixel of an n x n window
+    x, y = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    table = pd.DataFrame({'x': x.ravel(), 'y': y.ravel()})
+    if tot:
+        table['center flux'] = np.arange(len(table)) % 3000
+    return table
+
+
+@pytest.mark.parametrize('tot_range', [None, (500, 2000)])
+def test_circle_matches_loader_query(tot_range):
+    table = grid()
+    centers, R = [(6, 8), (16, 12)], 3
+    assigned = choose_file.assign_roi(table.copy(), centers, R, tot_range=tot_range)
+    for k, (cx, cy) in enumerate(centers, start=1):
+        query = table.query(f"((x-{cx})**2 + (y-{cy})**2)**(1/2) <= {R}{choose_file.tot_cut(tot_range)}")
+        assert list(assigned.index[assigned['ion'] == k]) == list(query.index)
+
+
+def test_box_matches_loader_query():
+    table = grid()
+    centers, R = [(6, 10), (14, 10)], 2
+    assigned = choose_file.assign_roi(table.copy(), centers, R, shape='box')
+    for k, (cx, cy) in enumerate(centers, start=1):
+        query = table.query(f"{cx-R} <= x <= {cx+R} and {cy-2*R} <= y <= {cy+2*R}")
+        assert list(assigned.index[assigned['ion'] == k]) == list(query.index)
+    assert (assigned.query('x == 0')['ion'] == 0).all()
+
+
+def test_overlapping_rois_go_to_the_nearest_ion():
+    table = pd.DataFrame({'x': [10, 11, 12, 13, 14, 30], 'y': [10, 10, 10, 10, 10, 30]})
+    assigned = choose_file.assign_roi(table, [(10, 10), (14, 10)], 3)
+    assert list(assigned['ion']) == [1, 1, 1, 2, 2, 0]
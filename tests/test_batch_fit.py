@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+
+from fit_functions import batch_fit, numerical_jacobian
+from Ion_functions import expon, Lorentzian, Linear
+
+
+def datasets(model, x, truths, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.array([model(x, *p) + rng.normal(0, noise, len(x)) for p in truths])
+
+
+def test_matches_curve_fit_for_every_dataset():
+    x = np.linspace(-5, 5, 80)
+    truths = [(0., 2., 1., .1), (1., 1.5, .5, 0.), (-1.5, 3., 2., .3)]
+    y = datasets(Lorentzian, x, truths, .02)
+    popt, pcov, info = batch_fit(Lorentzian, x, y, [0., 2., 1., 0.])
+    assert info['converged'].all() and (info['dof'] == len(x) - 4).all()
+    for k, data in enumerate(y):
+        expected, expected_cov = curve_fit(Lorentzian, x, data, p0=[0., 2., 1., 0.])
+        assert popt[k] == pytest.approx(expected, rel=1e-5, abs=1e-7)
+        assert np.allclose(pcov[k], expected_cov, rtol=1e-3, atol=1e-3 * np.abs(expected_cov).max())
+        assert info['chi2'][k] == pytest.approx(np.sum((data - Lorentzian(x, *expected))**2), rel=1e-6)
+
+
+def test_sigma_and_absolute_sigma():
+    x = np.linspace(0, 5e-3, 60)
+    y = datasets(expon, x, [(1000., 50.), (2000., 80.)], 0.5)
+    sigma = np.full_like(y, 0.5)
+    for absolute in (False, True):
+        popt, pcov, _ = batch_fit(expon, x, y, [1500., 60.], sigma=sigma, absolute_sigma=absolute)
+        for k in range(2):
+            expected, expected_cov = curve_fit(expon, x, y[k], p0=[1500., 60.], sigma=sigma[k], absolute_sigma=absolute)
+            assert popt[k] == pytest.approx(expected, rel=1e-5)
+            assert np.allclose(pcov[k], expected_cov, rtol=1e-3)
+
+
+def test_ragged_datasets_padded_with_nan_and_own_x():
+    x = np.array([np.linspace(0, 10, 20), np.linspace(-3, 3, 20)])
+    y = np.array([Linear(x[0], 2., 1.), Linear(x[1], -1., 4.)])
+    y[1, 12:] = np.nan
+    popt, _, info = batch_fit(Linear, x, y, [[1., 0.], [0., 0.]])
+    assert popt == pytest.approx(np.array([[2., 1.], [-1., 4.]]), abs=1e-8)
+    assert list(info['dof']) == [18, 10]
+
+
+def test_bounds_are_respected():
+    x = np.linspace(-5, 5, 50)
+    y = Lorentzian(x, 0., 2., 1., .5)[None, :]
+    popt, _, _ = batch_fit(Lorentzian, x, y, [0., 2., 1., 0.], bounds=([-np.inf, 0, 0, -.1], [np.inf, np.inf, np.inf, .1]))
+    assert popt[0, 3] == pytest.approx(.1)
+
+
+def test_numerical_jacobian_gives_the_same_fit():
+    x = np.linspace(-5, 5, 80)
+    y = datasets(Lorentzian, x, [(0.3, 2., 1., .1)], .02)
+    analytic = batch_fit(Lorentzian, x, y, [0., 2., 1., 0.])[0]
+    numeric = batch_fit(Lorentzian, x, y, [0., 2., 1., 0.], jac=False)[0]
+    assert numeric == pytest.approx(analytic, rel=1e-5)
+    p = np.array([[0.3, 2., 1., .1]])
+    J = numerical_jacobian(Lorentzian, np.broadcast_to(x, (1, len(x))), p)
+    assert J.shape == (1, len(x), 4)
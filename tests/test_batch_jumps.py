@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+import batch_jumps
+import run_catalog
+from results_store import ResultsStore
+
+
+def test_parse_value():
+    assert batch_jumps.parse_value('350') == 350
+    assert batch_jumps.parse_value('2.5') == 2.5
+    assert batch_jumps.parse_value('true') is True
+    assert batch_jumps.parse_value('6ions_350V') == '6ions_350V'
+
+
+def test_select_runs_combines_names_and_filters():
+    family = run_catalog.select(family='2ions_xscan')
+    runs = batch_jumps.select_runs(['Two_ions_xscan_400s'], ['family=2ions_xscan', 'ions=2'])
+    assert runs[0] == 'Two_ions_xscan_400s' and sorted(runs) == sorted(family)
+    assert batch_jumps.select_runs(['Two_ions_xscan_400s'], None) == ['Two_ions_xscan_400s']
+
+
+def test_list_and_unknown_runs(capsys):
+    assert batch_jumps.main(['--where', 'family=2ions_xscan', '--list']) == 0
+    assert capsys.readouterr().out.split() == batch_jumps.select_runs([], ['family=2ions_xscan'])
+    with pytest.raises(SystemExit):
+        batch_jumps.main(['Not_a_run'])
+    assert 'unknown runs: Not_a_run' in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        batch_jumps.main([])
+
+
+def test_run_writes_store_and_csv(two_ion_run, tmp_path, monkeypatch):
+    data = str(tmp_path)
+    monkeypatch.chdir(tmp_path.parent)
+    store, csv = str(tmp_path / 'results.sqlite'), str(tmp_path / 'rates.csv')
+    assert batch_jumps.main([two_ion_run, '--data', data, '--store', store, '--csv', csv, '--processes', '1',
+                             '--tot-range', '0', '5000']) == 0
+    table = pd.read_csv(csv)
+    assert list(table['ion']) == [1, 2] and (table['n_total'] > 0).all()
+    results = ResultsStore(store)
+    stored = results.query()
+    results.close()
+    assert list(stored['ion']) == [1, 2] and (stored['analysis'] == 1).all()
+    assert (stored['tot_low'] == 0).all() and (stored['tot_high'] == 5000).all()
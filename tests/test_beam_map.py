@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import beam_map
+import rate_functions
+import run_catalog
+
+
+def scan_rates(runs, truth, chain=(-6.5, 6.5)):
+    # rate table of a 2D Gaussian beam seen by two ions along the chain (detector x 48 and 61)
+    rows = []
+    for run in runs:
+        x, y = run_catalog.RUNS[run].get('x'), run_catalog.RUNS[run].get('y')
+        for ion, (pixel, p) in enumerate(zip((48, 61), chain), start=1):
+            # single axis scans are recorded through the beam centre
+            rate = beam_map.beam2d(truth['x0'] if x is None else x, (truth['y0'] if y is None else y) - truth['scale'] * p, truth['x0'], truth['y0'], truth['sigma_major'],
+                                   truth['sigma_minor'], truth['theta'], 10., 1.)
+            rows.append({'run': run, 'ion': ion, 'x_roi': pixel, 'x': np.nan if x is None else x,
+                         'y': np.nan if y is None else y, 'rate_total': rate,
+                         'rate_total_low': rate - .01, 'rate_total_high': rate + .01})
+    return pd.DataFrame(rows)
+
+
+TRUTH = dict(x0=401.8, y0=154.6, sigma_major=1.2, sigma_minor=.8, theta=.3, scale=.02)
+RUNS = run_catalog.select(family=lambda f: f in ('2ions_xscan', '2ions_yscan'))
+
+
+@pytest.fixture
+def analysed(monkeypatch):
+    calls = []
+
+    def transition_rates(runs, **options):
+        calls.append((list(runs), options))
+        return scan_rates(runs, TRUTH)
+    monkeypatch.setattr(rate_functions, 'transition_rates', transition_rates)
+    return calls
+
+
+def test_fit_recovers_the_beam(analysed):
+    beam = beam_map.BeamMap(cache=None)
+    beam.update(RUNS)
+    fit = beam.fit_beam()
+    assert beam.converged
+    for name in ('x0', 'y0', 'sigma_major', 'sigma_minor', 'theta'):
+        assert fit.at[name, 'value'] == pytest.approx(TRUTH[name], abs=1e-3)
+
+
+def test_cached_rates_are_reused_only_with_the_same_settings(tmp_path, analysed):
+    cache = str(tmp_path / 'rates.csv')
+    assert beam_map.BeamMap(cache, sigma=2).update(RUNS) == RUNS
+    assert beam_map.BeamMap(cache, sigma=2, processes=4).update(RUNS) == []
+    assert beam_map.BeamMap(cache, sigma=2.5).update(RUNS) == RUNS
+    assert beam_map.BeamMap(cache, sigma=2, tot_range=(500, 1500)).update(RUNS[:2]) == RUNS[:2]
+
+    # both settings stay in the file, each map sees only its own rows
+    assert beam_map.BeamMap(cache, sigma=2).update(RUNS) == []
+    beam = beam_map.BeamMap(cache, sigma=2, tot_range=(500, 1500))
+    assert set(beam.rates['run']) == set(RUNS[:2])
+    assert len(analysed) == 3
+
+
+def test_single_axis_scans_are_fitted_and_unplaced_runs_reported(analysed, capsys):
+    beam = beam_map.BeamMap(cache=None)
+    beam.update()
+    runs = set(analysed[0][0])
+    single = set(run_catalog.select(family=lambda f: f in ('xscan', 'yscan')))
+    assert set(RUNS) | single <= runs
+    assert 'One stage coordinate only' in capsys.readouterr().out
+
+    fit = beam.fit_beam()
+    assert beam.converged
+    for name in ('x0', 'y0', 'sigma_major', 'sigma_minor', 'theta'):
+        assert fit.at[name, 'value'] == pytest.approx(TRUTH[name], abs=1e-3)
+    beam.plot()
+
+    beam = beam_map.BeamMap(cache=None)
+    beam.update(['Jumps_Six_350V_1', 'xscan_402'])
+    out = capsys.readouterr().out
+    assert 'left out of the beam fit: Jumps_Six_350V_1' in out and 'placed on the fitted beam centre: xscan_402' in out
+    assert set(beam._points()[0]) == {402.}
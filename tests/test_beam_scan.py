@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import curve_fit
+
+import beam_scan
+from Ion_functions import Gaussian
+
+
+def test_manifest_from_the_catalog():
+    scan = beam_scan.manifest('y', family='2ions_yscan')
+    assert scan['Two_ions_yscan_153s'] == 153.5 and len(scan) == 6
+    assert beam_scan.sigma2fwhm(1) == pytest.approx(2.3548, abs=1e-4)
+
+
+def test_fit_beam_matches_curve_fit_per_ion():
+    positions = np.linspace(150, 157, 15)
+    truth = [(153.2, 1.1, 5., .05), (153.6, .8, 3., -.02)]
+    rng = np.random.default_rng(0)
+    rates = np.array([Gaussian(positions, *p) + rng.normal(0, .05, len(positions)) for p in truth])
+    fits = beam_scan.fit_beam(positions, rates)
+    assert fits['converged'].all()
+    for row, y in zip(fits.itertuples(), rates):
+        popt, pcov = curve_fit(Gaussian, positions, y, p0=[153, 1, 4, 0], bounds=([-np.inf, 0, -np.inf, -.1], [np.inf, np.inf, np.inf, .1]))
+        assert [row.center, row.sigma, row.amplitude, row.offset] == pytest.approx(popt, rel=1e-4, abs=1e-6)
+        assert row.sigma_err == pytest.approx(np.sqrt(pcov[1, 1]), rel=1e-2)
+        assert row.fwhm == pytest.approx(beam_scan.sigma2fwhm(popt[1]), rel=1e-4)
+
+
+def test_beam_scan_refits_a_rate_table():
+    scan = beam_scan.manifest('x', family='2ions_xscan')
+    rows = []
+    for run, x in scan.items():
+        for ion, center in ((1, 401.5), (2, 402.)):
+            rate = Gaussian(x, center, 1.2, 4., 0.)
+            rows.append({'run': run, 'ion': ion, 'rate_total': rate, 'rate_total_low': rate - .1, 'rate_total_high': rate + .1})
+    rates, fits = beam_scan.beam_scan(scan, rates=pd.DataFrame(rows))
+    assert list(fits['ion']) == [1, 2]
+    assert fits['center'].to_numpy() == pytest.approx([401.5, 402.], abs=1e-4)
+    assert fits['sigma'].to_numpy() == pytest.approx([1.2, 1.2], abs=1e-4)
+
+
+def test_ions_missing_from_some_runs_are_nan():
+    # a mixed scan: 4-ion runs and 2-ion runs, ions 3 and 4 only exist in the 4-ion runs
+    scan = {'a': 401., 'b': 401.5, 'c': 402., 'd': 402.5, 'e': 403., 'f': 403.5, 'g': 404.}
+    rows = []
+    for run, x in scan.items():
+        for ion in (1, 2, 3, 4) if run in 'aceg' else (1, 2):
+            rate = Gaussian(x, 402.5, 1., 4., 0.)
+            rows.append({'run': run, 'ion': ion, 'rate_total': rate, 'rate_total_low': rate - .1, 'rate_total_high': rate + .1})
+    ions, value, error = beam_scan.rate_matrix(pd.DataFrame(rows), scan)
+    assert ions == [1, 2, 3, 4] and value.shape == (4, 7)
+    assert np.isnan(value[2:, [1, 3, 5]]).all() and np.isfinite(value[:2]).all() and np.isfinite(error[2:, 0]).all()
+    rates, fits = beam_scan.beam_scan(scan, rates=pd.DataFrame(rows))
+    assert fits['center'].to_numpy() == pytest.approx([402.5] * 4, abs=1e-4)
+    beam_scan.plot_scan(scan, rates, fits)
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import bench_pipeline
+
+
+def test_synthetic_events_layout():
+    table = bench_pipeline.synthetic_events(20000, 3)
+    assert list(table.columns) == ['x', 'y', 'time', 'center flux', 'cluster size']
+    assert abs(len(table) - 20000) < 0.1 * 20000
+    assert np.all(np.diff(table['time']) >= 0)
+    loaded = table.astype({'time': float})
+    for center in bench_pipeline.centers(3):
+        assert len(bench_pipeline.ion_table(loaded, center)) > 0.25 * len(table)
+
+
+def test_baselines_round_trip_and_compare(tmp_path):
+    path = str(tmp_path / 'baselines.json')
+    assert bench_pipeline.load_baselines(path) == {'results': {}}
+    table = pd.DataFrame({'stage': ['csv_load', 'loader'], 'events': [1000, 1000], 'ions': [1, 1],
+                          'seconds': [0.5, np.nan], 'peak_mb': [1., np.nan], 'skipped': [False, True]})
+    bench_pipeline.save_baselines(table, path)
+    baselines = bench_pipeline.load_baselines(path)
+    assert list(baselines['results']) == ['csv_load|1000|1'] and 'python' in baselines['machine']
+
+    table['seconds'] = [1.0, 2.0]
+    compared = bench_pipeline.compare(table, baselines)
+    assert compared['ratio'].iloc[0] == pytest.approx(2) and np.isnan(compared['ratio'].iloc[1])
+
+
+def test_main_runs_the_grid_and_checks(tmp_path, capsys):
+    baselines, output = str(tmp_path / 'baselines.json'), str(tmp_path / 'results.json')
+    arguments = ['--sizes', '2e4', '--ions', '1', '2', '--no-memory', '--baselines', baselines, '--json', output]
+    assert bench_pipeline.main(arguments + ['--save-baseline']) == 0
+    with open(output) as f:
+        rows = json.load(f)
+    assert len(rows) == 2 * len(bench_pipeline.STAGES)
+    assert not any(row['skipped'] for row in rows), [row.get('error') for row in rows]
+    with open(baselines) as f:
+        assert len(json.load(f)['results']) == len(rows)
+
+    stored = bench_pipeline.load_baselines(baselines)
+    for entry in stored['results'].values():
+        entry['seconds'] = 1e-9   # every stage now looks much slower than its baseline
+    with open(baselines, 'w') as f:
+        json.dump(stored, f)
+    assert bench_pipeline.main(arguments + ['--stages', 'csv_load', '--check', '1.5']) == 1
+    assert 'Slower than 1.5x baseline' in capsys.readouterr().out
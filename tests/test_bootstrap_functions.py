@@ -0,0 +1,71 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import bootstrap_functions
+import choose_file
+import rate_functions
+from conftest import ion_frame
+from Ion_functions import Ion
+
+
+def test_threshold_replicates_spread_around_the_estimate(telegraph):
+    times, _ = telegraph(duration=60)
+    dt = np.diff(times)
+    estimate, replicates = bootstrap_functions.threshold_replicates(dt, n_boot=200, rng=1)
+    assert len(replicates) == 200 and np.isfinite(replicates).mean() > .95
+    low, high = np.nanquantile(replicates, [.025, .975])
+    assert low < estimate < high
+    assert high - low < .2 * estimate
+
+
+def test_block_rate_replicates_with_masks():
+    times = np.linspace(0.5, 99.5, 100)   # one jump per second
+    estimate, replicates = bootstrap_functions.block_rate_replicates(times, 0, 100, n_boot=300, rng=0)
+    assert estimate == pytest.approx(1) and np.allclose(replicates, 1)
+
+    kept = rate_functions.unmasked(times, [(0, 50)])
+    estimate, replicates = bootstrap_functions.block_rate_replicates(kept, 0, 100, n_boot=300, rng=0, masks=[(0, 50)])
+    assert estimate == pytest.approx(1)
+    assert np.nanmedian(replicates) == pytest.approx(1)
+
+
+def test_chunked_replicates_match_one_chunk():
+    times = np.random.default_rng(0).random(500) * 100
+    one = bootstrap_functions.block_rate_replicates(times, 0, 100, n_boot=50, rng=3)[1]
+    chunked = bootstrap_functions.block_rate_replicates(times, 0, 100, n_boot=50, rng=3, max_elements=20 * 50)[1]
+    assert np.array_equal(one, chunked)
+    values = np.arange(10.)
+    estimate, replicates = bootstrap_functions.mean_replicates(values, n_boot=100, rng=0)
+    assert estimate == 4.5 and replicates.min() >= 0 and replicates.max() <= 9
+
+
+def test_rate_table_bootstrap_uses_block_replicates():
+    rng = np.random.default_rng(0)
+    DtB = np.sort(rng.random(200) * 100)
+    result = {'run': 'synthetic', 'start': 0., 'end': 100.,
+              'ions': [{'ion': 1, 'x': 0, 'y': 0, 'r0': 2, 'events': 1000, 'threshold': 1e-3,
+                        'lower_limit': 1e-3, 'upper_limit': 1e-3, 'BtD': DtB + 1e-3, 'DtB': DtB}]}
+    table = rate_functions.rate_table([result], method='bootstrap', n_boot=500, rng=4)
+    row = table.iloc[0]
+    assert row['rate_total_low'] < row['rate_total'] < row['rate_total_high']
+    # the same replicates as bootstrap_functions draws from the same stream
+    rng = np.random.default_rng(4)
+    for kind, times in [('BtD', DtB + 1e-3), ('DtB', DtB), ('total', np.sort(np.concatenate((DtB + 1e-3, DtB))))]:
+        _, rates = bootstrap_functions.block_rate_replicates(times, 0, 100, 500, rng=rng)
+        assert [row[f'rate_{kind}_low'], row[f'rate_{kind}_high']] == pytest.approx(np.quantile(rates, [.025, .975]))
+    assert not hasattr(rate_functions, 'bootstrap_interval')
+
+
+def test_bootstrap_ion(telegraph):
+    times, _ = telegraph(duration=60)
+    choose_file.filename = 'synthetic'
+    ion = Ion(1, 0, 0, 2, 'r', ion_frame(times))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ion.setup()
+    table = bootstrap_functions.bootstrap_ion(ion, n_boot=100, rng=0)
+    assert list(table['quantity']) == ['threshold', 'rate_BtD', 'rate_DtB', 'rate_total', 'bright_lifetime', 'dark_lifetime']
+    assert ((table['low'] <= table['estimate']) & (table['estimate'] <= table['high'])).all()
+    assert table.set_index('quantity').at['threshold', 'estimate'] == pytest.approx(ion.threshold, rel=1e-6)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import correlation_functions as C
+
+
+def poisson_times(rate, duration, seed):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.random(rng.poisson(rate * duration)) * duration)
+
+
+def test_pair_offsets_match_all_pairs():
+    a, b = poisson_times(50, 10, 0), poisson_times(80, 10, 1)
+    offsets = C.pair_offsets(a, b, 5e-3)
+    expected = (b[None, :] - a[:, None]).ravel()
+    expected = expected[np.abs(expected) <= 5e-3]
+    assert np.allclose(np.sort(offsets), np.sort(expected))
+
+
+def test_multiplicity_matches_a_loop():
+    times = {1: poisson_times(30, 5, 2), 2: poisson_times(30, 5, 3), 4: poisson_times(30, 5, 4)}
+    distinct, ions = C.multiplicity(times, 0.02)
+    merged = sorted((t, i) for i, ts in times.items() for t in ts)
+    for k, (t, i) in enumerate(merged):
+        assert ions[k] == i
+        assert distinct[k] == len({j for s, j in merged if t <= s <= t + 0.02})
+
+
+def test_independent_ions_match_the_accidental_rate():
+    times = {i: poisson_times(20, 2000, 10 + i) for i in (1, 2, 3)}
+    edges, counts, accidental = C.coincidence_histogram(times, window=1e-2, bin_width=1e-3, duration=2000)
+    for pair in counts:
+        assert counts[pair].mean() == pytest.approx(accidental[pair], rel=.1)
+    table = C.k_fold(times, [1e-3, 1e-2], k=2, duration=2000)
+    assert table['ratio'].to_numpy() == pytest.approx([1, 1], rel=.1)
+
+
+def test_correlated_jumps_show_an_excess():
+    base = poisson_times(20, 500, 20)
+    times = {1: base, 2: np.sort(base + 2e-4), 3: poisson_times(20, 500, 21)}
+    table = C.k_fold(times, [1e-3], k=2, duration=500)
+    assert table.at[0, 'ratio'] > 5
+
+
+def test_jump_times_from_a_result():
+    result = {'ions': [{'ion': 1, 'BtD': np.array([3., 1.]), 'DtB': np.array([2.])},
+                       {'ion': 2, 'BtD': np.array([]), 'DtB': np.array([5.])}]}
+    assert list(C.jump_times(result)[1]) == [1., 3.]
+    assert list(C.jump_times(result, 'total')[1]) == [1., 2., 3.]
+    assert list(C.jump_times(result, 'DtB')[2]) == [5.]
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Ion_functions import find_nearest, find_nearest_batch, join_nearest
+
+
+def test_nearest_matches_find_nearest():
+    rng = np.random.default_rng(0)
+    array = np.sort(rng.random(200) * 100)
+    values = np.concatenate((rng.random(500) * 120 - 10, array[:20], (array[:-1] + array[1:])[:20] / 2))
+    index, distance = find_nearest_batch(array, values)
+    assert [array[i] for i in index] == [find_nearest(array, v) for v in values]
+    np.testing.assert_allclose(distance, np.abs(values - array[index]))
+
+
+def test_previous_next_and_tolerance():
+    array = np.array([1., 2., 4., 8.])
+    values = np.array([0., 1., 3., 8., 9.])
+    index, distance = find_nearest_batch(array, values, 'previous')
+    assert list(index) == [-1, 0, 1, 3, 3]
+    np.testing.assert_array_equal(distance, [np.nan, 0, 1, 0, 1])
+    index, _ = find_nearest_batch(array, values, 'next')
+    assert list(index) == [0, 0, 2, 3, -1]
+    index, distance = find_nearest_batch(array, values, tolerance=0.5)
+    assert list(index) == [-1, 0, -1, 3, -1] and np.isnan(distance[[0, 2, 4]]).all()
+    assert list(find_nearest_batch([], values)[0]) == [-1] * 5
+    with pytest.raises(ValueError):
+        find_nearest_batch(array, values, 'after')
+
+
+def test_join_nearest_adds_the_log_columns():
+    events = pd.DataFrame({'time': [0.5, 1.5, 2.5, 10.], 'x': [1, 2, 3, 4]}, index=[10, 11, 12, 13])
+    log = pd.DataFrame({'time': [1., 2.], 'x': [100., 200.], 'shutter': [0., 1.]})
+    joined = join_nearest(events, log, tolerance=5)
+    assert list(joined.index) == [10, 11, 12, 13]
+    np.testing.assert_array_equal(joined['x_log'], [np.nan, 100, 200, np.nan])
+    np.testing.assert_array_equal(joined['shutter'], [np.nan, 0, 1, np.nan])
+    np.testing.assert_array_equal(joined['time_distance'], [np.nan, .5, .5, np.nan])
+    assert list(joined['x']) == [1, 2, 3, 4]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import correlation_functions as C
+
+
+def poisson_times(rate, duration, seed):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.random(rng.poisson(rate * duration)) * duration)
+
+
+def test_pair_counts_match_brute_force():
+    a, b = poisson_times(200, 2, 0), poisson_times(300, 2, 1)
+    table = C.g2(a, b, tau_min=1e-4, tau_max=1e-2, points_per_decade=4, max_bins=2**8, duration=2)
+    assert set(table['method']) == {'pairs'}
+    edges = np.logspace(-4, -2, 9)
+    lags = (b[None, :] - a[:, None]).ravel()
+    assert np.array_equal(table['pairs'].to_numpy(), np.histogram(lags, edges)[0])
+
+
+@pytest.mark.parametrize('method', ['multitau', 'fft'])
+def test_poisson_photons_are_uncorrelated(method):
+    a = poisson_times(2000, 50, 2)
+    table = C.g2(a, tau_min=1e-5, tau_max=1., method=method, max_bins=2**16)
+    assert set(table['method']) == {'pairs', method}
+    assert table['g2'].to_numpy() == pytest.approx(1, abs=.1)
+
+
+def test_blinking_ion_is_bunched_below_the_dwell_time(telegraph):
+    times, _ = telegraph(duration=100, bright=3000, dark=30, tau=.2)
+    multitau = C.g2(times, tau_min=1e-5, tau_max=5., max_bins=2**18)
+    fft = C.g2(times, tau_min=1e-5, tau_max=5., method='fft', max_bins=2**18)
+    for table in (multitau, fft):
+        short, long = table[table['tau'] < 1e-2]['g2'], table[table['tau'] > 2]['g2']
+        assert short.mean() == pytest.approx(2, rel=.15)   # 1 / bright fraction of a symmetric telegraph
+        assert long.mean() == pytest.approx(1, abs=.15)
+    # both long-lag methods follow the same curve
+    at = np.interp(fft['tau'], multitau['tau'], multitau['g2'])
+    middle = (fft['tau'] > 1e-3) & (fft['tau'] < 1)
+    assert np.allclose(fft['g2'][middle], at[middle], rtol=.1)
+
+
+def test_g2_ions_covers_every_pair(telegraph):
+    from conftest import ion_frame
+    from Ion_functions import Ion
+    ions = [Ion(n, 0, 0, 2, 'r', ion_frame(telegraph(duration=10, seed=n)[0])) for n in (1, 2)]
+    table = C.g2_ions(ions, tau_min=1e-4, tau_max=.1, max_bins=2**12)
+    assert set(zip(table['ion_a'], table['ion_b'])) == {(1, 1), (1, 2), (2, 2)}
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import Ion_functions as F
+
+# model: (x, parameters) in the ranges the notebooks fit
+CASES = {
+    F.expon: (np.linspace(0, 5e-3, 40), [2000., 50.]),
+    F.Lorentzian: (np.linspace(-50, 50, 40), [3., 2., 10., .5]),
+    F.Double_Lorentzian: (np.linspace(-50, 50, 40), [-10., 2., 8., .5, 15., 1., 5.]),
+    F.Linear: (np.linspace(-3, 3, 40), [2., 1.]),
+    F.Oscillation: (np.linspace(0, 100, 40), [5., 2., .3]),
+    F.Gaussian: (np.linspace(150, 157, 40), [153., 1.2, 4., .1]),
+    F.Rscatt_: (np.linspace(0, 100, 40), [-20e6, 1e-3, .4, 1e3]),
+    F.Rscatt_high: (np.linspace(0, 100, 40), [1., .5, -20e6, 5., .4]),
+    F.Superradiance: (np.linspace(0, 1e-6, 40), [3e6, 1e-6]),
+}
+
+
+def test_every_model_has_a_case():
+    assert set(CASES) == set(F.JACOBIANS)
+
+
+@pytest.mark.parametrize('model', list(CASES), ids=lambda m: m.__name__)
+def test_jacobian_matches_central_differences(model):
+    x, p = CASES[model]
+    J = F.JACOBIANS[model](x, *p)
+    assert J.shape == (len(x), len(p))
+    for k in range(len(p)):
+        step = 1e-6 * max(abs(p[k]), 1e-3)
+        up, down = list(p), list(p)
+        up[k] += step
+        down[k] -= step
+        numeric = (model(x, *up) - model(x, *down)) / (2 * step)
+        scale = np.abs(numeric).max() or 1
+        assert np.allclose(J[:, k], numeric, rtol=1e-4, atol=1e-6 * scale), f'd/d parameter {k}'
+
+
+@pytest.mark.parametrize('model', list(CASES), ids=lambda m: m.__name__)
+def test_batched_parameters(model):
+    # batch_fit calls the models and jacobians with (ndatasets, 1) parameter columns
+    x, p = CASES[model]
+    columns = [np.array([[v], [v * 1.1]]) for v in p]
+    J = F.JACOBIANS[model](x, *columns)
+    assert J.shape == (2, len(x), len(p))
+    assert np.allclose(J[0], F.JACOBIANS[model](x, *p))
+    assert np.allclose(model(x, *columns)[1], model(x, *[v * 1.1 for v in p]))
+
+
+def test_buffered_models_equal_the_plain_expressions():
+    x = np.linspace(-50, 50, 101)
+    assert np.allclose(F.expon(x, .1, 3.), 3. * np.exp(-.1 * x))
+    assert np.allclose(F.Lorentzian(x, 3., 2., 10., .5), .5 + 2. * 10.**2 / (10.**2 + (x - 3.)**2))
+    assert np.allclose(F.Double_Lorentzian(x, -10., 2., 8., .5, 15., 1., 5.),
+                       .5 + 2. * 64 / (64 + (x + 10)**2) + 1. * 25 / (25 + (x - 15)**2))
+    assert np.allclose(F.Gaussian(x, 3., 12., -4., .1), 4. * np.exp(-((x - 3.) / 12.)**2 / 2) + .1)
+
+
+@pytest.mark.parametrize('model, p', [(F.expon, (.1, 3.)), (F.Lorentzian, (3., 2., 10., .5)),
+                                      (F.Double_Lorentzian, (-10., 2., 8., .5, 15., 1., 5.)), (F.Gaussian, (3., 12., -4., .1))])
+def test_models_keep_the_input_type(model, p):
+    import pandas as pd
+    x = pd.Series(np.linspace(-50, 50, 11), index=np.arange(100, 111), name='dt')
+    y = model(x, *p)
+    assert isinstance(y, pd.Series) and y.index.equals(x.index) and y.name == 'dt'
+    assert np.allclose(y, model(x.to_numpy(), *p))
+    (x + y).plot()   # aligned on the index, as notebooks use it
+    scalar = model(1.5, *p)
+    assert isinstance(scalar, float) and scalar == pytest.approx(model(np.array([1.5]), *p)[0])
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation_functions as C
+
+
+def test_popcount():
+    bits = np.array([0, 1, 3, 255, 2**15 + 1, 2**63 + 7], dtype=np.uint64)
+    assert list(C.popcount(bits)) == [0, 1, 2, 8, 2, 4]
+
+
+def test_segments_from_jumps():
+    table = C.segments_from_jumps(BtD=[2., 6.], DtB=[4.], start=0., end=10.)
+    assert table['state'].tolist() == [1, -1, 1, -1]
+    assert table['duration'].tolist() == [2., 2., 2., 4.]
+
+
+def test_joint_state_of_a_result():
+    result = {'start': 0., 'end': 10., 'ions': [
+        {'ion': 1, 'BtD': np.array([2., 6.]), 'DtB': np.array([4.])},   # dark 2-4 and 6-10
+        {'ion': 3, 'BtD': np.array([3.]), 'DtB': np.array([5.])},       # dark 3-5
+    ]}
+    state = C.JointState.from_result(result, bin_width=.5)
+    assert state.dtype == np.uint8 and len(state.bits) == 20
+    assert list(state.dark(1, [1., 2.5, 5., 7.])) == [False, True, False, True]
+    assert list(state.dark_count([1., 3.5, 4.5, 5.5, 8.])) == [0, 2, 1, 0, 1]
+    histogram = state.dark_count_histogram()
+    assert histogram.tolist() == pytest.approx([.3, .6, .1])
+    occupancy = state.occupancy().set_index('state')
+    assert occupancy.at['DB', 'fraction'] == pytest.approx(.5)   # ion 1 dark, ion 3 bright
+    assert occupancy.at['DD', 'fraction'] == pytest.approx(.1)
+    assert occupancy.at['DD', 'independent'] == pytest.approx(.6 * .2)
+
+
+def test_many_ions_use_a_wider_word():
+    segments = {n: pd.DataFrame({'start': [0.], 'end': [1.], 'duration': [1.], 'state': [-1 if n % 2 else 1]})
+                for n in range(1, 10)}
+    state = C.JointState(segments, bin_width=.1)
+    assert state.dtype == np.uint16 and state.nbytes == 20
+    assert (state.dark_count() == 5).all()
+    with pytest.raises(ValueError):
+        C.JointState({n: segments[1] for n in range(65)})
@@ -0,0 +1,53 @@
+import asyncio
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from online_detector import OnlineJumpDetector
+from live_ingest import LiveIngest, FileTail, write_fake_acquisition
+
+
+def acquisition(telegraph, duration=20):
+    times, switches = telegraph(duration=duration)
+    table = pd.DataFrame({'x': 48, 'y': 92, 'time': times, 'center flux': 500, 'cluster size': 1})
+    return table, switches
+
+
+def test_file_tail_reads_growing_file(tmp_path, telegraph):
+    table, _ = acquisition(telegraph, duration=2)
+    path = os.path.join(tmp_path, 'run.csv')
+    asyncio.run(write_fake_acquisition(path, table, rows_per_write=1000, interval=0))
+    tail = FileTail(path, holdback=0)
+    read = tail.read_new()
+    assert tail.read_new() is None
+    rows = pd.concat([read, tail.flush()])
+    assert len(rows) == len(table)
+    assert np.allclose(rows['time'].to_numpy(), table['time'].to_numpy() - table['time'].iat[0], atol=1e-10)
+
+
+def test_ingest_finds_transitions(tmp_path, telegraph):
+    table, _ = acquisition(telegraph)
+    path = os.path.join(tmp_path, 'run.csv')
+    asyncio.run(write_fake_acquisition(path, table, interval=0))
+    ingest = LiveIngest(tmp_path, [(48, 92)], 2, poll=0.01, idle_timeout=0.1, warmup=5000)
+    summary = asyncio.run(asyncio.wait_for(ingest.run(), 60))
+    assert summary['finished'].all()
+    # the same transitions as the detector fed with the whole run at once
+    detector = OnlineJumpDetector(1, warmup=5000)
+    found = detector.feed(1, table['time'].to_numpy() - table['time'].iat[0])
+    assert abs(len(ingest.transitions[path]) - len(found)) <= 0.01 * len(found)
+
+
+def test_consumer_error_is_raised_instead_of_hanging(tmp_path, telegraph):
+    table, _ = acquisition(telegraph, duration=5)
+    path = os.path.join(tmp_path, 'run.csv')
+    asyncio.run(write_fake_acquisition(path, table, rows_per_write=100, interval=0))
+
+    def fail(transition):
+        raise ValueError('consumer failed')
+    # every chunk is its own queue item and the queue holds one, the reader blocks on put once the consumer stops
+    ingest = LiveIngest(tmp_path, [(48, 92)], 2, poll=0.01, queue_size=1, holdback=0, on_transition=fail, warmup=500)
+    with pytest.raises(ValueError, match='consumer failed'):
+        asyncio.run(asyncio.wait_for(ingest.run(duration=30), 20))
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import micromotion
+from conftest import ion_frame
+from Ion_functions import Ion, RF_PERIOD, Rscatt_high, rf_phase
+
+
+def test_rf_phase_is_exact_for_long_runs():
+    ticks = np.array([0, 1, 5478, 10**15 + 12345, 3 * 10**15 + 7], dtype=np.int64)   # 10 ps ToA counts, up to 8 h
+    period_fs = int(round(RF_PERIOD * 1e6))
+    exact = np.array([(int(t) * 10000) % period_fs for t in ticks]) * 1e-6
+    assert np.allclose(rf_phase(ticks * 1e-11), exact, rtol=0, atol=1e-9)
+    assert ((rf_phase(ticks * 1e-11) >= 0) & (rf_phase(ticks * 1e-11) < RF_PERIOD)).all()
+
+
+def test_rf_phase_histogram_of_modulated_photons():
+    # photons emitted only in the first quarter of every RF period
+    rng = np.random.default_rng(0)
+    cycles = rng.integers(0, 10**9, 20000)
+    phase = rng.random(20000) * RF_PERIOD / 4
+    times = np.sort(np.rint((cycles * RF_PERIOD + phase) * 1e-9 / 1e-11) * 1e-11)
+    ion = Ion(1, 0, 0, 2, 'r', ion_frame(times, afterpulse_control=False))
+    edges, counts = ion.rf_phase_histogram(bins=40, state='all')
+    assert len(edges) == 41 and counts.sum() == len(times)
+    assert counts[:10].sum() > .99 * len(times)
+
+
+def test_fit_micromotion_recovers_the_velocity():
+    edges = np.linspace(0, RF_PERIOD, 101)
+    phase = (edges[:-1] + edges[1:]) / 2
+    rng = np.random.default_rng(1)
+    truth = [(2e-2, 8., 1.), (3e-2, 4., 4.)]
+    counts = np.array([rng.poisson(Rscatt_high(phase, m, 1., -10e6, v, p)) for m, v, p in truth])
+    fits = micromotion.fit_micromotion(edges, counts)
+    assert fits['converged'].all()
+    for row, (m, v, p) in zip(fits.itertuples(), truth):
+        assert abs(row.velocity - v) < 4 * row.velocity_err
+        assert abs(np.angle(np.exp(1j * (row.phase - p)))) < .1
@@ -0,0 +1,61 @@
+import numpy as np
+
+import choose_file
+from conftest import ion_frame
+from Ion_functions import Ion
+from online_detector import OnlineJumpDetector, auto_rebin, FINE_BINS
+
+
+def test_dark_warmup_is_kept_until_a_threshold_exists(telegraph):
+    detector = OnlineJumpDetector(1, warmup=500)
+    # a dark ion: every dt is above the 0.05 s histogram range, no fit is possible
+    dark = np.arange(0, 20, 0.1)
+    assert detector.feed(1, dark) == []
+    assert detector.ions[1].threshold is None
+    assert sum(len(w[1]) for w in detector.ions[1].warmup) == len(dark) - 1
+
+    # once bright events arrive the buffered events are classified with the new threshold
+    times, _ = telegraph(duration=20, seed=1)
+    detector.feed(1, 20 + times)
+    ion = detector.ions[1]
+    assert ion.threshold is not None
+    assert len(ion.warmup) == 0 and ion.buffered == 0
+    assert ion.count == len(dark) + np.count_nonzero(np.diff(20 + times) > 1e-7)
+
+
+def test_long_dark_warmup_stays_bounded(monkeypatch):
+    detector = OnlineJumpDetector(1, warmup=100, refit_every=1000)
+    fits = []
+    fit = detector._fit
+    monkeypatch.setattr(detector, '_fit', lambda ion: fits.append(ion.since_fit) or fit(ion))
+    for start in range(0, 20000, 10):
+        detector.feed(1, start + np.arange(100) * 0.1)
+        ion = detector.ions[1]
+        assert ion.buffered <= 100 and sum(len(w[1]) for w in ion.warmup) == ion.buffered
+    assert ion.threshold is None
+    assert ion.count + ion.buffered == 2000 * 100 - 1   # dropped events keep their index
+    assert len(fits) <= 2000 * 100 // 1000 + 1
+
+
+def test_auto_rebin_matches_numpy_auto_bins(telegraph):
+    times, _ = telegraph(duration=30)
+    dt = np.diff(times)
+    edges = np.linspace(0, .05, FINE_BINS + 1)
+    hist, coarse = auto_rebin(np.histogram(dt, edges)[0].astype(float), edges)
+    expected = np.histogram_bin_edges(dt, bins='auto', range=(0, .05))
+    # the quartiles come from the fine bins, the bin count can differ from numpy's by one
+    assert abs(len(coarse) - len(expected)) <= 1
+    assert hist.sum() == np.count_nonzero(dt <= .05)
+
+
+def test_threshold_and_jumps_match_setup(telegraph):
+    times, _ = telegraph(duration=100)
+    data = ion_frame(times)
+    choose_file.filename = 'synthetic'
+    ion = Ion(1, 0, 0, 2, 'r', data.copy())
+    ion.setup(uncertainty_control=False)
+
+    detector = OnlineJumpDetector(1, uncertainty_control=False, warmup=len(data) - 5, refit_every=10**9)
+    found = detector.feed(1, times)
+    assert abs(detector.ions[1].threshold - ion.threshold) < 1e-6
+    assert abs(len(found) - len(ion.transpts)) <= 0.01 * len(ion.transpts)
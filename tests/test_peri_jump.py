@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from conftest import ion_frame
+from Ion_functions import Ion, PeriJumpHistogram
+
+
+def brute_force(ion, bin_width, span, kind):
+    time = ion.data['time'].to_numpy()
+    nbins = int(round(span / bin_width))
+    edges = bin_width * np.arange(-nbins, nbins + 1)
+    counts = np.zeros(2*nbins, dtype=int)
+    exposure = np.zeros(2*nbins, dtype=int)
+    for point in (ion.BtD if kind == 'BtD' else ion.DtB):
+        t0 = time[point]
+        for k in range(2*nbins):
+            low, high = t0 + edges[k], t0 + edges[k + 1]
+            if low >= time[0] and high <= time[-1]:
+                exposure[k] += 1
+                counts[k] += np.count_nonzero((time >= low) & (time < high)) - (k == nbins)
+    return edges, counts, exposure
+
+
+@pytest.mark.parametrize('kind', ['BtD', 'DtB'])
+def test_matches_a_loop_over_jumps(telegraph_ion, kind):
+    edges, counts, exposure = telegraph_ion.peri_jump_histogram(2e-3, 0.02, kind)
+    expected = brute_force(telegraph_ion, 2e-3, 0.02, kind)
+    assert np.allclose(edges, expected[0])
+    assert np.array_equal(counts, expected[1]) and np.array_equal(exposure, expected[2])
+
+
+def test_rate_follows_the_true_switches(telegraph):
+    # the jumps of the simulation (the first segment is bright): BtD at the last bright photon,
+    # DtB at the first bright photon after the dark segment
+    times, switches = telegraph(duration=30, seed=3)
+    data = ion_frame(times)
+    ion = Ion(1, 0, 0, 2, 'r', data)
+    points = np.searchsorted(data['time'].to_numpy(), switches)
+    ion.BtD, ion.DtB = list(points[0::2] - 1), list(points[1::2])
+    histogram = PeriJumpHistogram(bin_width=5e-3, span=0.05)
+    histogram.add(ion)
+    assert histogram.njumps['BtD'] == len(ion.BtD)
+    # the bins next to the jump: bright before a BtD and after a DtB, dark on the other side
+    assert histogram.rate('BtD')[9] > 2000 and histogram.rate('BtD')[10] < 100
+    assert histogram.rate('DtB')[9] < 100 and histogram.rate('DtB')[10] > 2000
+
+
+def test_merge_adds_and_checks_binning(telegraph_ion):
+    one, two = PeriJumpHistogram(), PeriJumpHistogram()
+    one.add(telegraph_ion)
+    two.add(telegraph_ion)
+    one.merge(two)
+    single = PeriJumpHistogram()
+    single.add(telegraph_ion)
+    assert np.array_equal(one.counts['DtB'], 2 * single.counts['DtB'])
+    assert np.allclose(one.rate('DtB'), single.rate('DtB'), equal_nan=True)
+    with pytest.raises(ValueError):
+        one.merge(PeriJumpHistogram(bin_width=2e-3))
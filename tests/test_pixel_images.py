@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+import choose_file
+from conftest import event_table, XSCAN_399S
+
+
+def test_pixel_image_matches_histogram2d():
+    table = event_table(XSCAN_399S, duration=2)
+    image = choose_file.pixel_image(table)
+    expected, _, _ = np.histogram2d(table['x'], table['y'], bins=256, range=((-.5, 255.5), (-.5, 255.5)))
+    assert image.shape == choose_file.SENSOR
+    np.testing.assert_array_equal(image, expected)
+    tot = choose_file.pixel_image(table, table['center flux'].to_numpy(dtype=float))
+    assert tot.sum() == table['center flux'].sum()
+
+
+def test_sidecar_written_reused_and_refreshed(tmp_path):
+    name = str(tmp_path / 'events')
+    table = event_table(XSCAN_399S, duration=2)
+    table.to_csv(name)
+    images = choose_file.load_pixel_images(name)
+    assert os.path.exists(name + '.pixels.npz')
+    assert images['counts'].sum() == len(table)
+
+    choose_file._pixel_images.clear()
+    with np.load(name + '.pixels.npz') as f:
+        np.testing.assert_array_equal(f['counts'], images['counts'])
+    again = choose_file.load_pixel_images(name, table=table.iloc[:0])   # read from the sidecar, not the table
+    np.testing.assert_array_equal(again['counts'], images['counts'])
+
+    table.iloc[:100].to_csv(name)
+    changed = choose_file.load_pixel_images(name)
+    assert changed['counts'].sum() == 100
+
+
+def test_draw_pixels_extent_and_clipping():
+    image = np.arange(256 * 256).reshape(256, 256)
+    _, ax = plt.subplots()
+    drawn = choose_file.draw_pixels(ax, image, (10, 12), (250, 260))
+    assert drawn.get_extent() == [9.5, 12.5, 249.5, 255.5]
+    np.testing.assert_array_equal(drawn.get_array(), image[10:13, 250:256].T)
+
+
+def test_ion_pixel_counts_follow_the_data():
+    from Ion_functions import Ion
+    table = event_table(XSCAN_399S[:1], duration=2)
+    ion = Ion(1, *XSCAN_399S[0], 2, 'r', table)
+    first = ion.pixel_counts()
+    assert ion.pixel_counts() is first
+    ion.data = table.iloc[:50]
+    assert ion.pixel_counts().sum() == 50
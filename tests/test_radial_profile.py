@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import radial_profile
+
+
+def test_disc_overlap_exact_areas():
+    assert radial_profile.disc_overlap(-5, 5, -5, 5, 2.) == pytest.approx(np.pi * 4)
+    assert radial_profile.disc_overlap(-.5, .5, -.5, .5, 3.) == pytest.approx(1)
+    assert radial_profile.disc_overlap(0, 5, 0, 5, 1.) == pytest.approx(np.pi / 4)
+    assert radial_profile.disc_overlap(-1, 1, 0, 3, 1.) == pytest.approx(np.pi / 2)
+
+
+def test_disc_overlap_against_sampling():
+    rng = np.random.default_rng(0)
+    u, v = rng.random((2, 400000))
+    for x0, y0, r in [(0.3, -0.8, 1.1), (-1.5, 0.2, 1.7), (1.2, 1.4, 2.)]:
+        inside = ((x0 + u)**2 + (y0 + v)**2 <= r**2).mean()
+        assert radial_profile.disc_overlap(x0, x0 + 1, y0, y0 + 1, r) == pytest.approx(inside, abs=3e-3)
+
+
+def test_annulus_weights_share_every_pixel():
+    edges = np.linspace(0, 6, 13)
+    offsets = np.arange(-7, 8)
+    dx, dy = (a.ravel() + 0.3 for a in np.meshgrid(offsets, offsets))
+    W = radial_profile.annulus_weights(dx, dy, edges)
+    assert W.shape == (len(dx), 12) and (W >= -1e-12).all()
+    near = np.hypot(np.abs(dx) + .5, np.abs(dy) + .5) <= 6
+    np.testing.assert_allclose(W[near].sum(axis=1), 1)
+    np.testing.assert_allclose(W.sum(axis=0), np.pi * np.diff(edges**2))
+
+
+def test_uniform_image_has_flat_density():
+    image = np.full((64, 64), 5.)
+    edges, density, error = radial_profile.radial_profiles(image, [(20, 30), (40.4, 30.7), (1, 1)], r_max=4, bins=8)
+    np.testing.assert_allclose(density, 5)   # also at the sensor edge, where only the covered area counts
+    assert (error > 0).all()
+
+
+def test_psf_fit_recovers_the_width():
+    x, y = np.meshgrid(np.arange(64), np.arange(64), indexing='ij')
+    centers = [(20, 30), (44.5, 30)]
+    sigmas = [1.2, 2.]
+    image = sum(1000 * np.exp(-((x - cx)**2 + (y - cy)**2) / (2 * s**2)) for (cx, cy), s in zip(centers, sigmas)) + 2
+    edges, density, error = radial_profile.radial_profiles(image, centers, r_max=8, bins=32)
+    fits = radial_profile.fit_psf(edges, density)
+    assert fits['converged'].all()
+    np.testing.assert_allclose(fits['psf_sigma'], sigmas, rtol=0.05)
+    np.testing.assert_allclose(fits['background'], 2, atol=0.005 * 1000)   # pixel sampling of the narrow peak
+
+
+def test_ion_psf_of_loaded_ions():
+    from Ion_functions import Ion
+    from conftest import event_table, XSCAN_399S
+    table = event_table(XSCAN_399S, duration=5)
+    ions = [Ion(k, cx, cy, 2, 'r', table.query(f'((x-{cx})**2 + (y-{cy})**2)**(1/2) <= 2'))
+            for k, (cx, cy) in enumerate(XSCAN_399S, start=1)]
+    fits, edges, density, error = radial_profile.ion_psf(ions, bins=4)
+    assert list(fits['ion']) == [1, 2] and density.shape == (2, 4) and edges[-1] == 2
+    assert (density[:, 0] > density[:, -1]).all()
+
+
+def test_ion_psf_of_a_gaussian_spot_cut_to_its_roi():
+    import pandas as pd
+    from Ion_functions import Ion
+    rng = np.random.default_rng(1)
+    sigma, R, center = 1.5, 4, (60, 90)
+    x, y = rng.normal(center, sigma, (400000, 2)).T
+    table = pd.DataFrame({'x': np.rint(x).astype(int), 'y': np.rint(y).astype(int), 'time': np.arange(len(x))})
+    ion = Ion(1, *center, R, 'r', table.query(f'((x-{center[0]})**2 + (y-{center[1]})**2)**(1/2) <= {R}'))
+    fits, _, density, _ = radial_profile.ion_psf([ion], bins=8)
+    # rounding to pixels spreads every event over its pixel: a unit box adds 1/12 to the variance
+    expected = np.sqrt(sigma**2 + 1/12)
+    assert fits['psf_sigma'].iloc[0] == pytest.approx(expected, rel=0.03)
+    # counting the empty area outside the ROI lowers the outer bins and biases the fit
+    edges, unmasked, error = radial_profile.radial_profiles(ion.pixel_counts(), [center], R, 8)
+    assert unmasked[0, -1] < 0.8 * density[0, -1]
+    biased = radial_profile.fit_psf(edges, unmasked, error)['psf_sigma'].iloc[0]
+    assert abs(biased - expected) > 2 * abs(fits['psf_sigma'].iloc[0] - expected)
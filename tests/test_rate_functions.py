@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import rate_functions
+
+
+def result(BtD, DtB, start=0., end=100., run='synthetic'):
+    return {'run': run, 'start': start, 'end': end,
+            'ions': [{'ion': 1, 'x': 0, 'y': 0, 'r0': 2, 'events': 1000, 'threshold': 1e-3,
+                      'lower_limit': 1e-3, 'upper_limit': 1e-3, 'BtD': np.asarray(BtD), 'DtB': np.asarray(DtB)}]}
+
+
+def test_live_time_merges_overlapping_masks():
+    assert rate_functions.live_time(0, 100, [(10, 20), (15, 30), (90, 120)]) == pytest.approx(70)
+    times = np.array([5., 12., 25., 50., 95.])
+    assert list(rate_functions.unmasked(times, [(10, 30), (90, 120)])) == [5., 50.]
+
+
+def test_poisson_interval():
+    low, high = rate_functions.poisson_interval([0, 10])
+    assert low[0] == 0 and high[0] == pytest.approx(3.689, abs=1e-3)
+    assert low[1] == pytest.approx(4.795, abs=1e-3) and high[1] == pytest.approx(18.39, abs=1e-2)
+
+
+def test_lifetimes_of_alternating_transitions():
+    DtB = np.arange(0, 100, 10.)
+    BtD = DtB + 3
+    bright, dark = rate_functions.lifetimes(BtD, DtB)
+    assert bright == pytest.approx(3) and dark == pytest.approx(7)
+
+
+def test_rate_table_counts_and_masks():
+    DtB = np.arange(0, 100, 10.) + 1
+    BtD = DtB + 3
+    table = rate_functions.rate_table([result(BtD, DtB)], masks={'synthetic': [(0, 50)]})
+    row = table.iloc[0]
+    assert row['live_time'] == pytest.approx(50)
+    assert row['n_BtD'] == 5 and row['n_DtB'] == 5 and row['n_total'] == 10
+    assert row['rate_total'] == pytest.approx(10 / 50)
+    assert row['rate_total_low'] < row['rate_total'] < row['rate_total_high']
+
+
+def test_transition_rates_of_a_run(two_ion_run):
+    table = rate_functions.transition_rates([two_ion_run], processes=1)
+    assert list(table['ion']) == [1, 2]
+    assert (table['n_total'] == table['n_BtD'] + table['n_DtB']).all()
+    assert (table['rate_total'] > 0).all()
+    assert (table['family'] == '2ions_xscan').all()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+
+import choose_file
+import rate_functions
+import report
+from conftest import ion_frame
+from Ion_functions import Ion
+
+
+def setup_ion(times, n=1):
+    choose_file.filename = 'synthetic'
+    ion = Ion(n, 0, 0, 2, 'r', ion_frame(times))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ion.setup()
+    return ion
+
+
+def counting_setup(monkeypatch):
+    calls = []
+    setup = Ion.setup
+
+    def counted(ion, *args, **kwargs):
+        calls.append(ion.n)
+        return setup(ion, *args, **kwargs)
+    monkeypatch.setattr(Ion, 'setup', counted)
+    return calls
+
+
+def test_setup_ions_are_rendered_without_reloading(tmp_path, telegraph, monkeypatch):
+    ion = setup_ion(telegraph(duration=10)[0])
+    threshold = ion.threshold
+    calls = counting_setup(monkeypatch)
+    monkeypatch.setattr(rate_functions, 'load_run', lambda *args, **kwargs: 1/0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        entries = report.render_run('synthetic', out=str(tmp_path), ions=[ion], sigma=2.5)
+    assert calls == []
+    assert [e['figure'] for e in entries] == list(report.FIGURES)
+    assert all(e['files'] and os.path.exists(e['files'][0]) for e in entries if e['error'] is None)
+    assert entries[0]['error'] is None
+    # the auto_threshold figure is drawn with sigma=2.5, the ion keeps the threshold of its setup
+    assert ion.threshold == threshold
+
+
+def test_ion_without_transitions_is_set_up_once(tmp_path, monkeypatch):
+    # a steadily bright ion: no transitions after setup
+    times = np.cumsum(np.random.default_rng(0).exponential(1 / 3000, 15000))
+    choose_file.filename = 'synthetic'
+    ion = Ion(1, 0, 0, 2, 'r', ion_frame(times))
+    calls = counting_setup(monkeypatch)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report.render_run('synthetic', out=str(tmp_path), ions=[ion])
+    assert calls == [1]
+
+
+def test_report_of_a_loaded_run(two_ion_run, tmp_path, monkeypatch):
+    calls = counting_setup(monkeypatch)
+    out = str(tmp_path / 'report')
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = report.generate_report([two_ion_run], out=out, processes=1, background=False,
+                                       figures=('auto_threshold', 'stateHistograms'))
+    assert calls == [1, 2]
+    text = open(index).read()
+    assert two_ion_run in text and 'ion1_stateHistograms.png' in text and 'ion2_auto_threshold.png' in text
@@ -0,0 +1,111 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pytest
+
+import rate_functions
+import result_cache
+from result_cache import ResultCache, digest
+
+
+def test_digest_depends_on_every_part():
+    assert digest('run', {'sigma': 2}) == digest('run', {'sigma': 2})
+    assert digest('run', {'sigma': 2}) != digest('run', {'sigma': 2.5})
+    assert digest(np.float64(2.)) == digest(2.)
+
+
+def test_get_put_and_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    for k, key in enumerate(['a' * 64, 'b' * 64, 'c' * 64]):
+        cache.put(key, {'value': k})
+        time.sleep(0.01)
+        if k == 1:
+            assert cache.get('a' * 64) == {'value': 0}   # used again, 'b' is now the oldest
+    assert cache.get('b' * 64) is None
+    assert cache.get('a' * 64) == {'value': 0} and cache.get('c' * 64) == {'value': 2}
+
+
+def test_get_survives_eviction_by_another_worker(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put('a' * 64, 1)
+
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(result_cache.os, 'utime', evicted)
+    assert cache.get('a' * 64) == 1
+
+
+def test_file_digest_is_reused_until_the_file_changes(tmp_path):
+    path = tmp_path / 'events'
+    path.write_bytes(b'x,y,time\n1,2,3\n')
+    cache = ResultCache(str(tmp_path / 'cache'))
+    first = cache.file_digest(str(path))
+    assert cache.file_digest(str(path)) == first
+    path.write_bytes(b'x,y,time\n1,2,4\n5,6,7\n')
+    assert cache.file_digest(str(path)) != first
+
+
+def test_file_digests_of_parallel_workers_are_all_kept(tmp_path):
+    paths = []
+    for k in range(8):
+        paths.append(str(tmp_path / f'events_{k}'))
+        with open(paths[-1], 'w') as f:
+            f.write(f'x,y,time\n{k},0,0\n')
+    cache = ResultCache(str(tmp_path / 'cache'))
+    with ProcessPoolExecutor(4) as pool:
+        digests = list(pool.map(cache.file_digest, paths))
+    entries = os.listdir(tmp_path / 'cache' / 'files')
+    assert len(entries) == len(paths) and len(set(digests)) == len(paths)
+
+
+def test_run_jumps_result_is_cached(two_ion_run, tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    first = rate_functions.run_jumps(two_ion_run, cache=cache)
+
+    def not_loaded(*args, **kwargs):
+        raise AssertionError('run loaded again')
+    monkeypatch.setattr(rate_functions, 'load_run', not_loaded)
+    again = rate_functions.run_jumps(two_ion_run, cache=cache)
+    assert [len(i['BtD']) for i in again['ions']] == [len(i['BtD']) for i in first['ions']]
+    with pytest.raises(AssertionError):
+        rate_functions.run_jumps(two_ion_run, sigma=2.5, cache=cache)
+
+
+def setup_ions(times, count, **setup_options):
+    # identical ions of the same events, each setup() with the given options
+    import contextlib
+    import io
+    import choose_file
+    from Ion_functions import Ion
+    from conftest import ion_frame
+    choose_file.filename = 'synthetic'
+    ions = [Ion(1, 0, 0, 2, 'r', ion_frame(times)) for _ in range(count)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for ion in ions:
+            ion.setup(**setup_options)
+    return ions
+
+
+@pytest.mark.parametrize('cache', [None, False])
+def test_setup_without_cache(telegraph, cache):
+    ion, = setup_ions(telegraph(duration=5)[0], 1, cache=cache)
+    assert len(ion.transpts) > 0
+
+
+@pytest.mark.parametrize('uncertainty_control', [True, False])
+def test_cached_setup_restores_the_whole_state(telegraph, tmp_path, monkeypatch, uncertainty_control):
+    from Ion_functions import Ion
+    times = telegraph(duration=10)[0]
+    cache = ResultCache(str(tmp_path))
+    fresh, stored = setup_ions(times, 2, cache=cache, uncertainty_control=uncertainty_control)
+    monkeypatch.setattr(Ion, 'auto_threshold', lambda *args, **kwargs: pytest.fail('fitted again'))
+    restored, = setup_ions(times, 1, cache=cache, uncertainty_control=uncertainty_control)
+    for ion in (stored, restored):
+        assert (ion.threshold, ion.lower_limit, ion.upper_limit) == (fresh.threshold, fresh.lower_limit, fresh.upper_limit)
+        for name in ('bright', 'dark') + (('uncertain_state',) if uncertainty_control else ()):
+            assert getattr(ion, name).equals(getattr(fresh, name)), name
+        assert ion.data.equals(fresh.data)
+        assert (ion.transpts, ion.BtD, ion.DtB) == (fresh.transpts, fresh.BtD, fresh.DtB)
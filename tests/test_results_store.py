@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from results_store import ResultsStore
+
+
+def rates(run, values, **columns):
+    return pd.DataFrame({'run': run, 'ion': np.arange(1, len(values) + 1), 'rate_total': values, **columns})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    yield store
+    store.close()
+
+
+def test_latest_analysis_and_history(store):
+    first = store.append(rates('Jumps_4_350V_1', [1., 2.]), sigma=2)
+    second = store.append(rates('Jumps_4_350V_1', [1.5, 2.5]), sigma=2)
+    store.append(rates('Jumps_4_350V_1', [9., 9.]), sigma=3)
+    assert (first, second) == (1, 2)
+    latest = store.query(sigma=2)
+    assert list(latest['rate_total']) == [1.5, 2.5]
+    assert len(store.query()) == 4   # latest of sigma 2 and of sigma 3
+    assert list(store.history('Jumps_4_350V_1', ion=1)['analysis']) == [1, 2, 3]
+
+
+def test_catalog_columns_filters_and_aggregate(store):
+    store.append(rates('Jumps_4_350V_1', [1., 3.]))
+    store.append(rates('Jumps_4_120V_1_Day2', [2., 4.]))
+    store.append(rates('Jumps_2_180V_1', [5., 7.], threshold=[1e-3, 2e-3]))
+    assert set(store.query(voltage=slice(200, 400))['run']) == {'Jumps_4_350V_1'}
+    assert set(store.query(ions=[2, 4], day=None)['run']) == {'Jumps_4_350V_1', 'Jumps_2_180V_1'}
+    assert store.query(threshold=slice(1.5e-3, None))['rate_total'].tolist() == [7.]
+    summary = store.aggregate('voltage', 'rate_total', family='New_Datasets')
+    assert summary.loc[120, ('rate_total', 'mean')] == 3. and summary.loc[350, ('rate_total', 'count')] == 2
+    with pytest.raises(KeyError):
+        store.query(no_such_column=1)
+
+
+def test_list_columns_are_not_stored(store):
+    table = rates('synthetic', [1.])
+    table['BtD'] = [[1., 2.]]
+    store.append(table)
+    assert 'BtD' not in store.columns()
+
+
+def test_append_ions(store, telegraph_ion):
+    store.append_ions('synthetic', [telegraph_ion], sigma=2)
+    row = store.query(run='synthetic').iloc[0]
+    assert row['n_total'] == len(telegraph_ion.transpts)
+    assert row['threshold'] == pytest.approx(telegraph_ion.threshold)
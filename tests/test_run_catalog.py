@@ -0,0 +1,41 @@
+import ast
+import inspect
+
+import pytest
+
+import choose_file
+import run_catalog
+
+GROUPS = {'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5, 'Six_squeezed': 6, 'Nine': 9}
+
+
+def loader_settings(name):
+    # the file the loader reads (filename = '...') and the group function it calls (One() ... Nine())
+    tree = ast.parse(inspect.getsource(getattr(choose_file, name)))
+    files = [node.value.value for node in ast.walk(tree) if isinstance(node, ast.Assign)
+             and any(isinstance(t, ast.Name) and t.id == 'filename' for t in node.targets)
+             and isinstance(node.value, ast.Constant)]
+    groups = [node.func.id for node in ast.walk(tree) if isinstance(node, ast.Call)
+              and isinstance(node.func, ast.Name) and node.func.id in GROUPS]
+    return files, groups
+
+
+LOADED = [run for run in run_catalog.RUNS if hasattr(choose_file, run)]
+
+
+@pytest.mark.parametrize('run', LOADED)
+def test_catalog_matches_loader(run):
+    files, groups = loader_settings(run)
+    entry = run_catalog.RUNS[run]
+    assert files == [entry['file']]
+    assert [GROUPS[g] for g in groups] == [entry['ions']]
+
+
+def test_every_loader_is_catalogued():
+    assert len(LOADED) == len(run_catalog.RUNS) - len([r for r in run_catalog.RUNS if 'centers' in run_catalog.RUNS[r]])
+
+
+def test_select():
+    assert set(run_catalog.select(family='yscan')) == {r for r, e in run_catalog.RUNS.items() if e['family'] == 'yscan'}
+    assert run_catalog.select(family='yscan', y=149.5) == ['yscan_149s']
+    assert run_catalog.select(ions=lambda n: n >= 6) == [r for r, e in run_catalog.RUNS.items() if e['ions'] >= 6]
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import run_catalog
+import spectroscopy
+from Ion_functions import Lorentzian
+
+LINE = (2e6, 3000., 5e6, 100.)   # x0 (Hz), a, gam, b of the fluorescence rate (1/s)
+CENTERS = [(40, 90), (48, 90), (56, 90)]
+
+
+@pytest.fixture
+def scan(tmp_path):
+    # registered runs of a detuning scan, photons of every ion at the rate of the line
+    rng = np.random.default_rng(0)
+    runs = []
+    for k, detuning in enumerate(np.linspace(-20e6, 20e6, 9)):
+        rate = Lorentzian(detuning, *LINE)
+        parts = []
+        for cx, cy in CENTERS:
+            n = rng.poisson(rate * 5)
+            parts.append(pd.DataFrame({'x': cx, 'y': cy, 'time': np.rint(rng.random(n) * 5 / 1e-11).astype(np.int64)}))
+        table = pd.concat(parts).sort_values('time', ignore_index=True)
+        table['center flux'] = 500
+        path = str(tmp_path / f'scan_{k}')
+        table.to_csv(path)
+        run = f'test_scan_{k}'
+        run_catalog.register(run, file=path, family='test_scan', ions=3, detuning=detuning, centers=CENTERS, R=2)
+        runs.append(run)
+    yield runs
+    for run in runs:
+        run_catalog.RUNS.pop(run)
+
+
+def test_manifest_is_ordered_by_detuning(scan):
+    found = spectroscopy.manifest(family='test_scan')
+    assert list(found) == scan and list(found.values()) == sorted(found.values())
+
+
+def test_rates_and_line_fit_of_registered_runs(scan):
+    rates, fits = spectroscopy.spectrum(scan, processes=1)
+    assert len(rates) == 3 * len(scan)
+    expected = Lorentzian(rates['detuning'].to_numpy(), *LINE)
+    assert np.all(np.abs(rates['rate'] - expected) < 5 * rates['rate_err'] + 1)
+    assert fits['converged'].all()
+    assert fits['x0'].to_numpy() == pytest.approx(LINE[0], abs=5e5)
+    assert fits['fwhm'].to_numpy() == pytest.approx(2 * LINE[2], rel=.1)
+
+
+def test_neighbour_warm_start_rescues_a_bad_start():
+    x = np.linspace(-20e6, 20e6, 21)
+    rng = np.random.default_rng(2)
+    y = np.array([Lorentzian(x, *LINE) + rng.normal(0, 20, len(x)) for _ in range(3)])
+    p0 = np.array([LINE, [-18e6, 50., 1e5, 100.], LINE])   # ion 2 starts on a wrong, narrow peak
+    cold = spectroscopy.fit_spectrum(x, y, p0=p0, neighbours=0)
+    warm = spectroscopy.fit_spectrum(x, y, p0=p0, neighbours=1)
+    assert warm.at[1, 'chi2'] < cold.at[1, 'chi2']
+    assert warm.at[1, 'x0'] == pytest.approx(LINE[0], abs=1e6)
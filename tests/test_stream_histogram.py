@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from event_histograms import EventHistograms
+from Ion_functions import StreamHistogram
+
+
+@pytest.mark.parametrize('log', [False, True])
+def test_counts_match_numpy(log):
+    values = np.random.default_rng(0).exponential(1e-3, 20000)
+    histogram = StreamHistogram(1e-6, 5e-3, 50, log=log)
+    for chunk in np.array_split(values, 7):
+        histogram.add(chunk)
+    expected = np.histogram(values, histogram.edges)[0]
+    assert np.array_equal(histogram.counts[1:-1], expected)
+    assert histogram.counts[0] == np.count_nonzero(values < 1e-6)
+    assert histogram.counts[-1] == np.count_nonzero(values > histogram.edges[-1])
+    assert np.allclose(histogram.density(), np.histogram(values, histogram.edges, density=True)[0])
+
+
+def test_edges_are_counted_like_numpy():
+    histogram = StreamHistogram(0, 10, 10)
+    values = np.array([0., 1., 9.999, 10., 10.5, -1, np.nan])
+    histogram.add(values)
+    assert np.array_equal(histogram.counts[1:-1], np.histogram(values[np.isfinite(values)], histogram.edges)[0])
+    assert histogram.counts[0] == 1 and histogram.counts[-1] == 1 and histogram.counts[-2] == 2
+    assert histogram.mean() == pytest.approx((0 + 1 + 9.999 + 10) / 4)
+
+
+def test_merge_and_json_round_trip():
+    rng = np.random.default_rng(1)
+    a, b = rng.random(100) * 10, rng.random(50) * 10
+    one = StreamHistogram(0, 10, 20).add(a)
+    two = StreamHistogram(0, 10, 20).add(b)
+    merged = StreamHistogram.from_dict(one.to_dict()).merge(two)
+    assert np.array_equal(merged.counts, StreamHistogram(0, 10, 20).add(np.concatenate((a, b))).counts)
+    with pytest.raises(ValueError):
+        one.merge(StreamHistogram(0, 10, 21))
+
+
+def test_event_histograms_of_a_file_match_the_loader(two_ion_run):
+    import rate_functions
+    import run_catalog
+    from conftest import XSCAN_399S
+    entry = run_catalog.RUNS[two_ion_run]
+    streamed = EventHistograms().add_file(entry['file'], XSCAN_399S, chunksize=5000)
+    _, ions = rate_functions.load_run(two_ion_run)
+    loaded = EventHistograms().add_ions(ions)
+    for key, histogram in loaded.histograms.items():
+        assert np.array_equal(streamed.histograms[key].counts, histogram.counts)
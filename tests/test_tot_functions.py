@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import choose_file
+import rate_functions
+import tot_functions
+from results_store import ResultsStore
+
+
+def test_load_run_restores_tot_range(two_ion_run):
+    choose_file.TOT_RANGE = None
+    _, cut = rate_functions.load_run(two_ion_run, tot_range=(500, 1500))
+    assert choose_file.TOT_RANGE is None
+    assert all(((ion.data['center flux'] >= 500) & (ion.data['center flux'] < 1500)).all() for ion in cut)
+    _, ions = rate_functions.load_run(two_ion_run)
+    assert all(len(ion.data) > len(c.data) for ion, c in zip(ions, cut))
+
+
+def test_load_run_restores_tot_range_on_error(monkeypatch):
+    def failing():
+        raise FileNotFoundError('no data')
+    monkeypatch.setattr(choose_file, 'failing_run', failing, raising=False)
+    choose_file.TOT_RANGE = (1, 2)
+    try:
+        with pytest.raises(FileNotFoundError):
+            rate_functions.load_run('failing_run', tot_range=(500, 1500))
+        assert choose_file.TOT_RANGE == (1, 2)
+    finally:
+        choose_file.TOT_RANGE = None
+
+
+def test_cut_and_uncut_analyses_are_kept_apart(tmp_path):
+    table = pd.DataFrame({'run': ['synthetic'], 'ion': [1], 'rate_total': [10.]})
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    store.append(table, **rate_functions.analysis_parameters())
+    store.append(table.assign(rate_total=4.), **rate_functions.analysis_parameters(tot_range=(500, 1500)))
+    latest = store.query()
+    assert sorted(latest['rate_total']) == [4., 10.]
+    assert list(store.query(tot_low=500)['rate_total']) == [4.]
+    assert list(store.query(tot_low=None)['method']) == ['poisson']
+    store.close()
+
+
+def test_assign_roi_tot_cut():
+    table = pd.DataFrame({'x': [10, 10, 20, 30], 'y': [10, 10, 10, 10], 'center flux': [100, 900, 900, 900]})
+    out = choose_file.assign_roi(table, [(10, 10), (21, 10)], 2, tot_range=(500, 1000))
+    assert list(out['ion']) == [0, 1, 2, 0]
+
+
+def test_tot_spectra_counts_every_ion():
+    table = pd.DataFrame({'ion': [0, 1, 1, 2, 2, 2], 'center flux': [10, 60, 70, 120, 4990, 6000]})
+    counts, edges = tot_functions.tot_spectra(table, 2, bin_width=50)
+    assert counts.shape == (3, 100) and len(edges) == 101
+    assert counts[0, 0] == 1 and counts[1, 1] == 2
+    assert counts[2, 2] == 1 and counts[2, 99] == 1 and counts.sum() == 5
+
+
+def test_calibration_fit_and_charge_table():
+    truth = np.array([[2., 100., 500., 1.], [2.5, 80., 400., .5]])
+    charge = np.linspace(3, 100, 25)
+    tot = np.array([tot_functions.surrogate(charge, *p) for p in truth])
+    calibration = tot_functions.fit_calibration(charge, tot)
+    assert calibration['converged'].all()
+    assert np.allclose(calibration[tot_functions.CALIBRATION].to_numpy(), truth, rtol=1e-4)
+
+    table = tot_functions.charge_table(calibration, tot_max=400, step=.5)
+    events = np.array([150., 300., 250.])
+    ion = np.array([1, 1, 2])
+    charge = tot_functions.to_charge(events, ion, table, step=.5)
+    assert np.allclose([tot_functions.surrogate(q, *truth[i - 1]) for q, i in zip(charge, ion)], events, atol=1e-3)
+    # the larger root: every charge is above the asymptote t
+    assert (table > truth[:, 3:]).all()
+
+
+def test_surrogate_jacobian_matches_finite_differences():
+    Q = np.linspace(3, 100, 7)
+    p = np.array([2., 100., 500., 1.])
+    J = tot_functions.surrogate_jacobian(Q, *p)
+    for k in range(4):
+        step = np.zeros(4); step[k] = 1e-6 * max(1, abs(p[k]))
+        numeric = (tot_functions.surrogate(Q, *(p + step)) - tot_functions.surrogate(Q, *(p - step))) / (2 * step[k])
+        assert np.allclose(J[:, k], numeric, rtol=1e-5)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+
+from trace_view import TracePyramid
+
+
+def events(n=10000, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.sort(rng.random(n) * 100)
+    return time, np.append(np.diff(time), 0)
+
+
+def test_levels_match_brute_force_min_max():
+    time, dt = events()
+    pyramid = TracePyramid(time, dt)
+    assert len(pyramid.levels[0][0]) == 2**14 and len(pyramid.levels[-1][0]) == 1
+    for level in (0, 5, 10):
+        lo, hi, count = pyramid.levels[level]
+        width = pyramid.width * 2**level
+        index = np.minimum(((time - time[0]) / width).astype(int), len(lo) - 1)
+        assert count.sum() == len(time)
+        for i in np.unique(index)[::97]:
+            assert lo[i] == pytest.approx(dt[index == i].min(), rel=1e-6)
+            assert hi[i] == pytest.approx(dt[index == i].max(), rel=1e-6)
+    assert pyramid.levels[-1][1][0] == pytest.approx(dt.max(), rel=1e-6)
+
+
+def test_bins_give_at_least_one_bin_per_column():
+    time, dt = events()
+    pyramid = TracePyramid(time, dt)
+    for start, end, columns in [(1, 99, 500), (10, 12, 100), (50, 50.05, 2000)]:
+        centers, lo, hi, count = pyramid.bins(start, end, columns)
+        assert len(centers) >= min(columns, (end - start) / pyramid.width)
+        assert len(centers) < 4 * columns + 2
+        width = centers[1] - centers[0]
+        assert centers[0] - width / 2 <= start and centers[-1] + width / 2 >= end
+
+
+def test_draw_bounds_the_number_of_primitives():
+    time, dt = events(100000)
+    pyramid = TracePyramid(time, dt)
+    _, ax = plt.subplots()
+    pyramid.draw(ax=ax, columns=300)
+    lines = [c for c in ax.collections if isinstance(c, LineCollection)]
+    assert len(lines) == 1 and len(lines[0].get_segments()) <= 4 * 300
+    _, ax = plt.subplots()
+    pyramid.draw(0, 0.01, ax=ax)
+    assert len(ax.collections[0].get_offsets()) == np.count_nonzero((time >= 0) & (time < 0.01))
+
+
+def test_shading_and_dark_time():
+    time, dt = events()
+    starts = np.arange(0, 100, 10.)
+    segments = pd.DataFrame({'start': starts, 'end': starts + 10, 'state': np.where(np.arange(10) % 2, -1, 1)})
+    pyramid = TracePyramid(time, dt, segments)
+    np.testing.assert_allclose(pyramid.dark_time([0, 5, 15, 25, 100]), [0, 0, 5, 10, 50])
+    _, ax = plt.subplots()
+    shade = pyramid.shade(ax, 0, 100, 50, (0, 1))
+    assert isinstance(shade, PolyCollection) and len(shade.get_paths()) == 10
+    strip = pyramid.shade(ax, 0, 100, 4, (0, 1))
+    np.testing.assert_allclose(strip.get_array()[0], [.4, .4, .6, .6])
+
+
+def test_ion_trace_reuses_its_pyramid(telegraph_ion):
+    telegraph_ion.trace(0, 10)
+    pyramid = telegraph_ion._pyramid
+    telegraph_ion.trace(5, 1)
+    assert telegraph_ion._pyramid is pyramid
+    assert pyramid[1].segments is not None
+    ax = telegraph_ion.visRange(0, 10, max_points=1000)   # too many events, drawn by trace()
+    assert ax.get_xlim() == (0, 10)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from functools import partial
+
+import rate_functions
+from event_histograms import run_histograms
+from fit_functions import batch_fit
+
+### Time-over-threshold spectra and charge calibration ###
+# Per-ion ToT ('center flux') spectra are counted with one bincount over (ion, ToT bin) in the same
+# pass that assigns events to ions: tot_spectra for a table with an 'ion' column (assign_roi), and
+# run_tot_spectra for whole runs through event_histograms (chunked file reads, worker processes).
+# ToT cuts are applied during ROI extraction: choose_file.assign_roi(tot_range=...) and the loaders'
+# ROI queries (rate_functions.load_run(tot_range=...)), so a cut costs no extra pass over the events.
+# The ToT response of the detector is the usual TimePix surrogate function of the deposited charge Q
+#     ToT(Q) = a*Q + b - c/(Q - t)
+# fitted for every ion at once from calibration points (test pulses of known charge). charge_table
+# inverts the fitted curves on a ToT grid, so converting events is one indexing operation.
+
+TOT_MAX = 5000   # ToT range of flux_histogram
+CALIBRATION = ['a', 'b', 'c', 't']
+
+
+def tot_spectra(table, nions, bin_width=50, tot_max=TOT_MAX):
+    # (nions + 1, nbins) counts with row 0 for the events outside every ROI, and the bin edges
+    nbins = int(np.ceil(tot_max / bin_width))
+    tot = table['center flux'].to_numpy()
+    ion = table['ion'].to_numpy().astype(np.int64)
+    k = np.floor(tot / bin_width).astype(np.int64)
+    keep = (k >= 0) & (k < nbins)
+    counts = np.bincount(ion[keep] * nbins + k[keep], minlength=(nions + 1) * nbins).reshape(nions + 1, nbins)
+    return counts, bin_width * np.arange(nbins + 1)
+
+
+### ToT spectrum of every ion of many runs, one pass over each run ###
+def run_tot_spectra(runs, bin_width=50, tot_max=TOT_MAX, processes=None, **histogram_options):
+    #     histogram_options: chunksize, afterpulse_control, tot_range (see event_histograms.run_histograms)
+    # Returns a table with one row per run and ion (counts in a list per row) and the bin edges.
+    binning = {'center flux': dict(low=0, high=tot_max, bins=int(np.ceil(tot_max / bin_width)))}
+    work = partial(run_histograms, binning=binning, **histogram_options)
+    results = rate_functions.map_runs(work, list(runs), processes)
+    rows = []
+    for run, histograms in zip(runs, results):
+        for (ion, _), histogram in sorted(histograms.histograms.items()):
+            rows.append({'run': run, 'ion': ion, 'events': histogram.total, 'mean_tot': histogram.mean(),
+                         'counts': histogram.counts[1:-1]})
+    edges = np.linspace(0, tot_max, binning['center flux']['bins'] + 1)
+    return pd.DataFrame(rows), edges
+
+
+#___________________________________________________________________________________________________________
+##### CALIBRATION #####
+
+
+def surrogate(Q, a, b, c, t):
+    return a*Q + b - c / (Q - t)
+
+
+def surrogate_jacobian(Q, a, b, c, t):
+    J = np.empty(np.broadcast_shapes(np.shape(Q), np.shape(a), np.shape(b), np.shape(c), np.shape(t)) + (4,))
+    d = 1 / (np.asarray(Q) - t)
+    J[..., 0] = Q
+    J[..., 1] = 1
+    J[..., 2] = -d
+    J[..., 3] = -c * d**2
+    return J
+
+
+def fit_calibration(charge, tot, tot_err=None, p0=None):
+    #     charge: (npoints,) test pulse charges, tot: (nions, npoints) mean ToT of every ion for every pulse
+    # One surrogate fit per ion in one batch_fit, returns a table of a, b, c, t with errors.
+    charge = np.asarray(charge, dtype=float)
+    tot = np.atleast_2d(np.asarray(tot, dtype=float))
+    if p0 is None:
+        # straight line through the high-charge half, small curvature near the lowest charge
+        high = charge >= np.median(charge)
+        slope, offset = np.polyfit(charge[high], tot[:, high].T, 1)
+        p0 = np.column_stack((slope, offset, np.full(len(tot), slope * (charge.max() - charge.min()) / 10),
+                              np.full(len(tot), charge.min() / 2)))
+    popt, pcov, info = batch_fit(surrogate, charge, tot, p0, sigma=tot_err, jac=surrogate_jacobian,
+                                 absolute_sigma=tot_err is not None)
+    perr = np.sqrt(np.abs(np.einsum('mii->mi', pcov)))
+    table = pd.DataFrame({'ion': np.arange(1, len(tot) + 1)})
+    for k, name in enumerate(CALIBRATION):
+        table[name] = popt[:, k]
+        table[f'{name}_err'] = perr[:, k]
+    table['chi2'], table['dof'], table['converged'] = info['chi2'], info['dof'], info['converged']
+    return table
+
+
+def charge_table(calibration, tot_max=TOT_MAX, step=1):
+    # (nions, ntot) charge of every ToT on the grid 0, step, ..., tot_max for every calibrated ion:
+    # the larger root of a*Q**2 - (ToT + a*t - b)*Q - (b*t - ToT*t + c) = 0. ToT below the curve's reach gives NaN.
+    p = {name: calibration[name].to_numpy()[:, None] for name in CALIBRATION}
+    tot = np.arange(0, tot_max + step, step, dtype=float)[None, :]
+    B = tot + p['a']*p['t'] - p['b']
+    disc = B**2 + 4*p['a']*(p['b']*p['t'] - tot*p['t'] + p['c'])
+    with np.errstate(invalid='ignore'):
+        return np.where(disc >= 0, (B + np.sqrt(disc)) / (2*p['a']), np.nan)
+
+
+def to_charge(tot, ion, table, step=1):
+    # charge of every event from its ToT and ion number (1, 2, ...) with one lookup in charge_table
+    tot = np.asarray(tot, dtype=float)
+    k = np.clip(np.rint(tot / step).astype(np.int64), 0, table.shape[1] - 1)
+    return table[np.asarray(ion, dtype=np.int64) - 1, k]
+
+
+def plot_spectra(spectra, edges, log=True):
+    fig, ax = plt.subplots(1, figsize = (5, 4))
+    for row in spectra.itertuples():
+        ax.stairs(row.counts, edges, label=f'{row.run} ion {row.ion}')
+    if log:
+        ax.set_yscale('log')
+    ax.set_xlabel('ToT(ns)')
+    ax.set_ylabel('counts')
+    ax.legend(fontsize = 'small')
+    plt.show()
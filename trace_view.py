@@ -0,0 +1,119 @@
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+
+### Level-of-detail rendering of dt-vs-time traces ###
+# visRange scatters every event and draws one axvspan per transition, which freezes the kernel for
+# windows longer than a few seconds. TracePyramid keeps the min, max and count of 'dt' in time bins
+# at every power-of-two resolution. A window is drawn from the coarsest level that still gives at
+# least one bin per screen column, as one LineCollection of min-max bars, so the number of primitives
+# is bounded by the number of columns whatever the zoom. Short windows fall back to the raw events.
+# State shading comes from the segment table: one PolyCollection of bright/dark spans, or when there
+# are more segments than columns, one image strip of the dark fraction of every column.
+
+BRIGHT = 'red'   # colours of visRange
+DARK = 'blue'
+
+
+class TracePyramid:
+    def __init__(self, time, dt, segments=None, max_bins=2**21):
+        #     time, dt: event times and time to the next event (s), sorted by time
+        #     segments: Ion.segment_table() for the state shading, or None
+        self.time = np.asarray(time, dtype=float)
+        self.dt = np.asarray(dt, dtype=np.float32)
+        self.t0 = self.time[0]
+        span = max(self.time[-1] - self.t0, 1e-12)
+        nbins = 1 << int(np.clip(np.ceil(np.log2(max(len(self.time), 1))), 0, np.log2(max_bins)))
+        self.width = span * (1 + 1e-12) / nbins
+
+        index = np.minimum(((self.time - self.t0) / self.width).astype(np.int64), nbins - 1)
+        lo = np.full(nbins, np.inf, dtype=np.float32)
+        hi = np.full(nbins, -np.inf, dtype=np.float32)
+        first = np.flatnonzero(np.concatenate(([True], index[1:] != index[:-1])))   # events are sorted, bins are runs
+        lo[index[first]] = np.minimum.reduceat(self.dt, first)
+        hi[index[first]] = np.maximum.reduceat(self.dt, first)
+        self.levels = [(lo, hi, np.bincount(index, minlength=nbins).astype(np.int32))]
+        while len(self.levels[-1][0]) > 1:
+            lo, hi, count = self.levels[-1]
+            self.levels.append((np.minimum(lo[0::2], lo[1::2]), np.maximum(hi[0::2], hi[1::2]), count[0::2] + count[1::2]))
+
+        self.segments = None
+        if segments is not None and len(segments):
+            self.segments = segments
+            self.starts = segments['start'].to_numpy()
+            self.ends = segments['end'].to_numpy()
+            dark = np.where(segments['state'].to_numpy() == -1, self.ends - self.starts, 0)
+            self.dark_before = np.concatenate(([0], np.cumsum(dark)))   # dark time before every segment
+
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for level in self.levels for a in level)
+
+
+    def bins(self, start, end, columns):
+        # centres, min, max and count of the coarsest level with at least `columns` bins in the window
+        level = int(np.clip(np.floor(np.log2(max((end - start) / columns, self.width) / self.width)), 0, len(self.levels) - 1))
+        width = self.width * 2**level
+        lo, hi, count = self.levels[level]
+        i0 = max(int((start - self.t0) // width), 0)
+        i1 = min(int(np.ceil((end - self.t0) / width)), len(lo))
+        centers = self.t0 + (np.arange(i0, i1) + 0.5) * width
+        return centers, lo[i0:i1], hi[i0:i1], count[i0:i1]
+
+
+    def dark_time(self, t):
+        # dark time from the start of the segment table up to every t
+        t = np.asarray(t, dtype=float)
+        k = np.clip(np.searchsorted(self.starts, t, side='right') - 1, 0, len(self.starts) - 1)
+        inside = np.clip(t - self.starts[k], 0, self.ends[k] - self.starts[k])
+        dark = self.segments['state'].to_numpy()[k] == -1
+        return self.dark_before[k] + np.where(dark, inside, 0)
+
+
+    def shade(self, ax, start, end, columns, ylim):
+        if self.segments is None:
+            return None
+        k0 = max(np.searchsorted(self.ends, start, side='right'), 0)
+        k1 = np.searchsorted(self.starts, end, side='left')
+        if k1 - k0 <= columns:
+            s = np.clip(self.starts[k0:k1], start, end)
+            e = np.clip(self.ends[k0:k1], start, end)
+            verts = np.stack([np.column_stack((s, np.full_like(s, ylim[0]))), np.column_stack((s, np.full_like(s, ylim[1]))),
+                              np.column_stack((e, np.full_like(e, ylim[1]))), np.column_stack((e, np.full_like(e, ylim[0])))], axis=1)
+            colors = np.where(self.segments['state'].to_numpy()[k0:k1] == -1, DARK, BRIGHT)
+            return ax.add_collection(PolyCollection(verts, facecolors=colors, alpha=0.3, linewidths=0))
+        # more segments than columns: fraction of every column spent dark, drawn as one image
+        edges = np.linspace(start, end, columns + 1)
+        fraction = np.diff(self.dark_time(edges)) / np.diff(edges)
+        cmap = mpl.colors.LinearSegmentedColormap.from_list('state', [BRIGHT, DARK])
+        return ax.imshow(fraction[None, :], extent=(start, end, ylim[0], ylim[1]), aspect='auto', cmap=cmap,
+                         vmin=0, vmax=1, alpha=0.3, interpolation='nearest', zorder=0)
+
+
+        ### Draws the window [start, end) with a bounded number of primitives ###
+    def draw(self, start=None, end=None, ax=None, columns=2000, max_points=5000, ylim=None):
+        #     columns: horizontal resolution (bins drawn) for long windows
+        #     max_points: windows with at most this many events are drawn event by event
+        start = self.time[0] if start is None else start
+        end = self.time[-1] if end is None else end
+        if ax is None:
+            fig, ax = plt.subplots(1, figsize=(15, 1.5))
+        i0, i1 = np.searchsorted(self.time, [start, end])
+        if i1 - i0 <= max_points:
+            ax.scatter(self.time[i0:i1], self.dt[i0:i1], s=4)
+            top = self.dt[i0:i1].max() if i1 > i0 else 1
+        else:
+            centers, lo, hi, count = self.bins(start, end, columns)
+            full = count > 0
+            segments = np.stack([np.column_stack((centers[full], lo[full])), np.column_stack((centers[full], hi[full]))], axis=1)
+            ax.add_collection(LineCollection(segments, linewidths=1, capstyle='round'))
+            top = hi[full].max() if full.any() else 1
+        ylim = ylim or (0, float(top) * 1.05)
+        self.shade(ax, start, end, columns, ylim)
+        ax.set_xlim(start, end)
+        ax.set_ylim(*ylim)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Time since last event (s)')
+        return ax